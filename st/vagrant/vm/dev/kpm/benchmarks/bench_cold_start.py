@@ -0,0 +1,83 @@
+"""
+Compare the time a fresh process takes to load the trained models from
+joblib (which imports sklearn and xgboost) with mapping their exported
+artifacts, including the imports, and check that both predict the same.
+
+    python benchmarks/bench_cold_start.py --runs 5
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from power_model.trainer import artifact
+from power_model.trainer.runner import pipeline_for_model_name
+
+MODELS = {
+    "linear": {"positive": True},
+    "polynomial": {"degree": 2},
+    "xgboost": {"objective": "reg:squarederror", "random_state": 42},
+}
+
+JOBLIB = """
+import sys, joblib
+from power_model.trainer.compiled import compile_pipeline
+models = [compile_pipeline(joblib.load(f"{sys.argv[1]}/{m}_model.joblib")) for m in sys.argv[2:]]
+"""
+
+ARTIFACT = """
+import sys
+from power_model.trainer import artifact
+models = [artifact.load(artifact.artifact_path(sys.argv[1], m)) for m in sys.argv[2:]]
+"""
+
+
+def cold_start(script: str, model_path: str, runs: int) -> list[float]:
+    times = []
+    for _ in range(runs):
+        begin = time.perf_counter()
+        subprocess.run([sys.executable, "-c", script, model_path, *MODELS], check=True)
+        times.append(time.perf_counter() - begin)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes started per format")
+    parser.add_argument("--train-rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.random((args.train_rows, 2)) * [1000, 300], columns=["cpu_time", "page_cache_hits"])
+    y = 0.8 * X["cpu_time"] + 0.1 * X["page_cache_hits"] + rng.normal(0, 5, args.train_rows) + 50
+
+    with tempfile.TemporaryDirectory() as model_path:
+        for name, params in MODELS.items():
+            pipeline = pipeline_for_model_name(name, params).fit(X, y)
+            joblib.dump(pipeline, f"{model_path}/{name}_model.joblib")
+            artifact.export(pipeline, model_path, name)
+
+            loaded = artifact.load(artifact.artifact_path(model_path, name))
+            diff = np.abs(pipeline.predict(X) - loaded.predict(X.to_numpy())).max()
+            print(f"{name} ({type(loaded).__name__}), max abs diff {diff:.3g}")
+
+        # the interpreter alone, to separate its startup from loading models
+        baseline = cold_start("pass", model_path, args.runs)
+        for label, script in [("joblib", JOBLIB), ("artifact", ARTIFACT)]:
+            times = cold_start(script, model_path, args.runs)
+            print(
+                f"{label:>8}: median {statistics.median(times) * 1e3:7.1f} ms  "
+                f"min {min(times) * 1e3:7.1f} ms  "
+                f"(interpreter startup {statistics.median(baseline) * 1e3:.1f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    main()
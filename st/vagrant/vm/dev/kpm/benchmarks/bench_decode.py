@@ -0,0 +1,83 @@
+"""
+Compare decoding and aligning range query responses with the previous
+MetricRangeDataFrame + pd.merge chain against decode_matrix + Grid.
+
+    python benchmarks/bench_decode.py --series 10 50 --points 100000
+"""
+
+import argparse
+import functools as fn
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from prometheus_api_client import MetricRangeDataFrame
+
+from power_model.datasource.prometheus import Grid, decode_matrix
+
+START = 1_729_641_600
+
+
+def response(series: int, points: int) -> str:
+    values = [[START + i, str(900 + (i + series) % 600 / 10)] for i in range(points)]
+    return json.dumps(
+        {"status": "success", "data": {"resultType": "matrix", "result": [{"metric": {}, "values": values}]}},
+        separators=(",", ":"),
+    )
+
+
+def merge_chain(bodies: list[str]) -> pd.DataFrame:
+    results = []
+    for i, body in enumerate(bodies):
+        data = json.loads(body)["data"]["result"]
+        df = MetricRangeDataFrame(data=data, ts_as_datetime=False)
+        df.index = df.index.astype("int64")
+        df.rename(columns={"value": f"f{i}"}, inplace=True)
+        results.append(df)
+
+    merged = fn.reduce(lambda left, right: pd.merge(left, right, on=["timestamp"], how="inner"), results)
+    merged.sort_index(inplace=True)
+    return merged
+
+
+def grid(bodies: list[str], points: int) -> pd.DataFrame:
+    g = Grid([f"f{i}" for i in range(len(bodies))], START, 1.0, points)
+    for i, body in enumerate(bodies):
+        samples = decode_matrix(body)[0]
+        g.write(i, samples[:, 0], samples[:, 1])
+    return g.to_frame()
+
+
+def timeit(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--series", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--points", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    for n in args.series:
+        bodies = [response(i, args.points) for i in range(n)]
+
+        old, new = merge_chain(bodies), grid(bodies, args.points)
+        np.testing.assert_allclose(old.to_numpy(dtype=np.float64), new.to_numpy())
+
+        t_old = timeit(lambda: merge_chain(bodies), args.repeat)
+        t_new = timeit(lambda: grid(bodies, args.points), args.repeat)
+        print(
+            f"{n:3d} series x {args.points} points: "
+            f"merge chain {t_old:7.3f}s  grid {t_new:7.3f}s  ({t_old / t_new:.1f}x)"
+        )
+
+
+if __name__ == "__main__":
+    main()
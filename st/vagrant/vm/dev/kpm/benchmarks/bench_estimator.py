@@ -0,0 +1,103 @@
+"""
+Measure estimator throughput and latency with micro-batching on and off.
+
+Models are trained against the fake Prometheus into a temporary directory,
+the estimator is started in a separate process and concurrent clients send
+requests the way kepler does: one JSON request per connection.
+
+    python benchmarks/bench_estimator.py --clients 64 --requests 50 --batch-window 2
+"""
+
+import argparse
+import asyncio
+import contextlib
+import multiprocessing
+import os
+import pathlib
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+
+from fake_kepler import load, summarize
+from fake_prometheus import FakePrometheus
+
+from power_model import trainer
+from power_model.cli.estimator import Server
+
+FEATURES = {
+    "cpu_time": "sum(rate(kepler_process_bpf_cpu_time_ms_total[12s]))",
+    "page_cache_hits": "sum(rate(kepler_process_bpf_page_cache_hit_total[12s]))",
+}
+
+
+def train_config(url: str, path: pathlib.Path) -> dict:
+    end = datetime.now(UTC).replace(microsecond=0) - timedelta(hours=1)
+    return {
+        "prometheus": {"url": url},
+        "train": {
+            "path": str(path),
+            "start_at": end - timedelta(minutes=10),
+            "end_at": end,
+            "step": "1s",
+            "pipelines": [{"name": "kepler-vm-cpu", "features": FEATURES}],
+            "target": "sum(rate(kepler_vm_package_joules_total[12s]))",
+            "models": {"xgboost": {"objective": "reg:squarederror", "random_state": 42}},
+        },
+    }
+
+
+def serve(config: dict, socket_path: str, batch_window: float, max_batch: int):
+    predictor = trainer.Predictor(config)
+    Server(socket_path, predictor, batch_window=batch_window, max_batch=max_batch).listen()
+
+
+@contextlib.contextmanager
+def estimator(config: dict, batch_window: float, max_batch: int):
+    """Runs the estimator in a separate process and yields the path of its socket once it listens."""
+    socket_path = os.path.join(tempfile.mkdtemp(), "estimator.sock")
+    proc = multiprocessing.Process(target=serve, args=(config, socket_path, batch_window, max_batch))
+    proc.start()
+    try:
+        while not os.path.exists(socket_path):
+            time.sleep(0.05)
+        # warm up
+        asyncio.run(load(socket_path, 1, 10, 1))
+        yield socket_path
+    finally:
+        proc.terminate()
+        proc.join()
+
+
+def run(config: dict, args, batch_window: float) -> tuple[float, list[float]]:
+    with estimator(config, batch_window, args.max_batch) as socket_path:
+        return asyncio.run(load(socket_path, args.clients, args.requests, args.rows))
+
+
+def report(name: str, elapsed: float, latencies: list[float]):
+    stats = summarize(elapsed, latencies)
+    print(
+        f"{name:<20} {stats['requests_per_second']:10.0f} req/s   "
+        f"p50 {stats['p50_ms']:7.2f} ms   p99 {stats['p99_ms']:7.2f} ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=64, help="number of concurrent clients")
+    parser.add_argument("--requests", type=int, default=50, help="requests sent by each client")
+    parser.add_argument("--rows", type=int, default=1, help="rows of values per request")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="batch window in milliseconds")
+    parser.add_argument("--max-batch", type=int, default=256)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp, FakePrometheus() as prom:
+        config = train_config(prom.url, pathlib.Path(tmp))
+        trainer.train(config)
+
+        print(f"clients: {args.clients}  requests/client: {args.requests}  rows/request: {args.rows}")
+        report("batching off", *run(config, args, 0))
+        report(f"batching {args.batch_window}ms", *run(config, args, args.batch_window / 1000))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+Compare single row and batch inference of the sklearn pipelines with their
+compiled counterparts and report the largest difference between both.
+
+    python benchmarks/bench_inference.py --rows 1 1000
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from power_model.trainer.compiled import compile_pipeline
+from power_model.trainer.runner import pipeline_for_model_name
+
+MODELS = {
+    "linear": {"positive": True},
+    "polynomial": {"degree": 2},
+    "xgboost": {"objective": "reg:squarederror", "random_state": 42},
+}
+
+
+def per_call(fn, min_time: float = 0.5) -> float:
+    calls = 0
+    begin = time.perf_counter()
+    while (elapsed := time.perf_counter() - begin) < min_time:
+        fn()
+        calls += 1
+    return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[1, 1000], help="rows per predict call")
+    parser.add_argument("--train-rows", type=int, default=5000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    X = pd.DataFrame(rng.random((args.train_rows, 2)) * [1000, 300], columns=["cpu_time", "page_cache_hits"])
+    y = 0.8 * X["cpu_time"] + 0.1 * X["page_cache_hits"] + rng.normal(0, 5, args.train_rows) + 50
+
+    for name, params in MODELS.items():
+        pipeline = pipeline_for_model_name(name, params).fit(X, y)
+        compiled = compile_pipeline(pipeline)
+        diff = np.abs(pipeline.predict(X) - compiled.predict(X.to_numpy())).max()
+        print(f"{name} ({type(compiled).__name__}), max abs diff {diff:.3g}")
+
+        for rows in args.rows:
+            df = X.iloc[:rows]
+            arr = df.to_numpy()
+            t_sklearn = per_call(lambda: pipeline.predict(pd.DataFrame(arr, columns=df.columns)))
+            t_compiled = per_call(lambda: compiled.predict(arr))
+            print(
+                f"  {rows:6d} rows: sklearn {t_sklearn * 1e6:9.1f} us  "
+                f"compiled {t_compiled * 1e6:9.1f} us  ({t_sklearn / t_compiled:.0f}x)"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Compare serial and concurrent execution of Client.range_query against a
+local fake Prometheus.
+
+    python benchmarks/bench_range_query.py --features 8 --latency 0.05
+"""
+
+import argparse
+import time
+from datetime import UTC, datetime, timedelta
+
+from fake_prometheus import FakePrometheus
+
+from power_model.datasource import prometheus
+
+
+def run(url: str, max_workers: int, queries: dict[str, str], start, end, repeat: int) -> float:
+    with prometheus.Client(url, max_workers=max_workers) as client:
+        begin = time.perf_counter()
+        for _ in range(repeat):
+            client.range_query(start=start, end=end, step="1s", **queries)
+        return (time.perf_counter() - begin) / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=8, help="number of queries per range_query call")
+    parser.add_argument("--latency", type=float, default=0.05, help="artificial server latency in seconds")
+    parser.add_argument("--window", type=int, default=600, help="window size in seconds")
+    parser.add_argument("--workers", type=int, default=prometheus.DEFAULT_MAX_WORKERS)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    queries = {f"f{i}": f"sum(rate(metric_{i}_total[12s]))" for i in range(args.features)}
+    end = datetime.now(UTC).replace(microsecond=0)
+    start = end - timedelta(seconds=args.window)
+
+    with FakePrometheus(latency=args.latency) as prom:
+        serial = run(prom.url, 1, queries, start, end, args.repeat)
+        concurrent = run(prom.url, args.workers, queries, start, end, args.repeat)
+
+    print(f"queries: {args.features}  latency: {args.latency}s  window: {args.window}s")
+    print(f"serial     (1 worker):  {serial * 1000:8.1f} ms")
+    print(f"concurrent ({args.workers} workers): {concurrent * 1000:8.1f} ms")
+    print(f"speedup: {serial / concurrent:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
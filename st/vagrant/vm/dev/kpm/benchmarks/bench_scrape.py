@@ -0,0 +1,62 @@
+"""
+Measure parsing a kepler /metrics export and check the rates the kepler
+datasource computes from live scrapes of the fake exporter.
+
+    python benchmarks/bench_scrape.py --processes 100 2000 --seconds 3
+"""
+
+import argparse
+import time
+from datetime import UTC, datetime
+
+from fake_exporter import OTHER, FakeExporter
+
+from power_model.datasource import kepler
+
+QUERIES = {
+    "cpu_time": 'sum(rate(kepler_process_bpf_cpu_time_ms_total{job="vm"}[2s]))',
+    "page_cache_hits": 'sum(irate(kepler_process_bpf_page_cache_hit_total{job="vm"}[2s]))',
+    "target": 'sum(rate(kepler_vm_package_joules_total{job="vm"}[2s]))',
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--processes", type=int, nargs="+", default=[100, 2000], help="processes in the export")
+    parser.add_argument("--seconds", type=float, default=3.0, help="seconds to scrape before querying")
+    parser.add_argument("--interval", type=float, default=0.5, help="scrape interval in seconds")
+    args = parser.parse_args()
+
+    for processes in args.processes:
+        with FakeExporter(processes=processes) as exporter:
+            lines = exporter.server.export(time.time()).encode().splitlines()
+            names = {q.split("(")[2].split("{")[0] for q in QUERIES.values()}
+
+            label_cache: dict = {}
+            for label in ["first", "cached"]:
+                begin = time.perf_counter()
+                parsed = sum(1 for _ in kepler.parse_exposition(lines, names, label_cache))
+                elapsed = time.perf_counter() - begin
+                print(
+                    f"{processes} processes: {len(lines)} lines, {parsed} samples kept "
+                    f"(skipping {len(OTHER)} other metrics) in {elapsed * 1000:.1f} ms ({label} scrape)"
+                )
+
+            target = kepler.Target(exporter.url, {"job": "vm"})
+            with kepler.Client([target], QUERIES.values(), interval=args.interval) as client:
+                time.sleep(args.seconds)
+                df = client.instant_query(datetime.now(UTC), **QUERIES)
+
+            expected = {
+                "cpu_time": exporter.rate("kepler_process_bpf_cpu_time_ms_total"),
+                "page_cache_hits": exporter.rate("kepler_process_bpf_page_cache_hit_total"),
+                "target": exporter.rate("kepler_vm_package_joules_total"),
+            }
+            for key, value in expected.items():
+                got = df[key].iloc[0]
+                print(f"  {key:<16} {got:12.3f}  expected {value:12.3f}  ({abs(got - value) / value:.2%} off)")
+            print(f"  {client.scrapes} scrapes, {client.failures} failures")
+
+
+if __name__ == "__main__":
+    main()
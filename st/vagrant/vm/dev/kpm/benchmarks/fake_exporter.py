@@ -0,0 +1,92 @@
+"""
+A local stand-in for kepler's /metrics endpoint used by the benchmarks.
+
+It exports kepler style per process counters that grow at a known constant
+rate, so that rates computed from scrapes can be checked against the exact
+value, plus unrelated metrics to make the export realistically large.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COUNTERS = {
+    # metric -> increase per second of each process
+    "kepler_process_bpf_cpu_time_ms_total": 10.0,
+    "kepler_process_bpf_page_cache_hit_total": 2.0,
+    "kepler_vm_package_joules_total": 0.5,
+}
+
+# other metrics kepler exports per process, which a scraper has to skip
+OTHER = ["kepler_process_cpu_instructions_total", "kepler_process_cache_miss_total", "kepler_process_dram_joules_total"]
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+
+        payload = self.server.export(time.time()).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        self.server.scrapes += 1
+
+
+class Server(ThreadingHTTPServer):
+    def __init__(self, address, processes: int):
+        super().__init__(address, Handler)
+        self.processes = processes
+        self.started = time.time()
+        self.scrapes = 0
+
+    def export(self, now: float) -> str:
+        elapsed = now - self.started
+        lines = []
+        for name in [*COUNTERS, *OTHER]:
+            lines.append(f"# HELP {name} fake kepler counter")
+            lines.append(f"# TYPE {name} counter")
+            per_second = COUNTERS.get(name, 1.0)
+            for pid in range(self.processes):
+                labels = f'pid="{pid}",command="proc-{pid}",container_id="system_processes",mode="dynamic"'
+                lines.append(f"{name}{{{labels}}} {per_second * elapsed:.6f}")
+        return "\n".join(lines) + "\n"
+
+
+class FakeExporter:
+    """Run the fake exporter on a background thread, use as a context manager."""
+
+    def __init__(self, processes: int = 100, host: str = "127.0.0.1", port: int = 0):
+        self.server = Server((host, port), processes)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/metrics"
+
+    def rate(self, name: str) -> float:
+        """Exact value of sum(rate(name[...])) over all processes."""
+        return COUNTERS[name] * self.server.processes
+
+    @property
+    def scrapes(self) -> int:
+        return self.server.scrapes
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
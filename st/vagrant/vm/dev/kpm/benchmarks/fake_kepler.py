@@ -0,0 +1,64 @@
+"""
+A load generator speaking the estimator's unix socket protocol the way
+kepler does: one JSON request per connection, optionally with the 4 byte
+length prefix of framed requests.
+"""
+
+import asyncio
+import json
+import time
+
+import numpy as np
+
+from power_model.cli.estimator import LENGTH_PREFIX
+
+
+def request(rows: int) -> bytes:
+    return json.dumps(
+        {
+            "metrics": ["bpf_cpu_time_ms"],
+            "values": [[float(600 + i)] for i in range(rows)],
+            "output_type": "ContainerComponentPower",
+            "source": "rapl",
+            "system_features": [],
+            "system_values": [],
+        }
+    ).encode()
+
+
+async def client(socket_path: str, payload: bytes, count: int, latencies: list[float], framed: bool = False):
+    for _ in range(count):
+        begin = time.perf_counter()
+        reader, writer = await asyncio.open_unix_connection(socket_path)
+        if framed:
+            writer.write(LENGTH_PREFIX.pack(len(payload)))
+        writer.write(payload)
+        await writer.drain()
+        if framed:
+            (length,) = LENGTH_PREFIX.unpack(await reader.readexactly(LENGTH_PREFIX.size))
+            response = await reader.readexactly(length)
+        else:
+            response = await reader.read(64 * 1024)
+        writer.close()
+        latencies.append(time.perf_counter() - begin)
+        assert b'"msg": ""' in response, response
+
+
+async def load(
+    socket_path: str, clients: int, count: int, rows: int, framed: bool = False
+) -> tuple[float, list[float]]:
+    """Runs `clients` concurrent clients sending `count` requests each, returns the elapsed time and latencies."""
+    latencies: list[float] = []
+    payload = request(rows)
+    begin = time.perf_counter()
+    await asyncio.gather(*(client(socket_path, payload, count, latencies, framed) for _ in range(clients)))
+    return time.perf_counter() - begin, latencies
+
+
+def summarize(elapsed: float, latencies: list[float]) -> dict[str, float]:
+    ms = np.array(latencies) * 1000
+    return {
+        "requests_per_second": len(ms) / elapsed,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
@@ -0,0 +1,116 @@
+"""
+A local stand-in for the Prometheus HTTP API used by the benchmarks.
+
+It answers /api/v1/query_range and /api/v1/query with synthetic, deterministic
+single series data (one series per query of a combined instant query) so that the client can be exercised without a real
+Prometheus. An artificial per request latency can be added to mimic a remote
+server.
+"""
+
+import json
+import re
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+# the parts of a combined instant query, see prometheus.combine_queries
+COMBINED_RE = re.compile(r'label_replace\(\((.*?)\), "(__pm_query__)", "([^"]+)", "", ""\)', re.DOTALL)
+
+
+def parse_step(step: str) -> float:
+    units = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400}
+    for unit in sorted(units, key=len, reverse=True):
+        if step.endswith(unit):
+            return float(step[: -len(unit)]) * units[unit]
+    return float(step)
+
+
+def sample(query: str, ts: float) -> float:
+    # deterministic value per (query, timestamp)
+    seed = zlib.crc32(query.encode()) % 1000
+    return seed + (ts % 600) / 10
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # headers and body are written separately, without TCP_NODELAY the body
+    # waits for the delayed ack of the client on keep-alive connections
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.respond(url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length).decode()
+        self.respond(urlparse(self.path).path, {k: v[0] for k, v in parse_qs(body).items()})
+
+    def respond(self, path: str, params: dict[str, str]):
+        self.server.requests += 1
+
+        if self.server.latency:
+            time.sleep(self.server.latency)
+
+        if path == "/api/v1/query_range":
+            body = self.range_result(params)
+        elif path == "/api/v1/query":
+            body = self.instant_result(params)
+        else:
+            self.send_error(404)
+            return
+
+        payload = json.dumps(body).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def range_result(self, params):
+        query = params["query"]
+        start, end = float(params["start"]), float(params["end"])
+        step = parse_step(params["step"])
+        n = int((end - start) / step) + 1
+        values = [[start + i * step, str(sample(query, start + i * step))] for i in range(n)]
+        return {"status": "success", "data": {"resultType": "matrix", "result": [{"metric": {}, "values": values}]}}
+
+    def instant_result(self, params):
+        query = params["query"]
+        ts = float(params.get("time", time.time()))
+        parts = [(promql, {label: key}) for promql, label, key in COMBINED_RE.findall(query)] or [(query, {})]
+        result = [{"metric": metric, "value": [ts, str(sample(promql, ts))]} for promql, metric in parts]
+        return {"status": "success", "data": {"resultType": "vector", "result": result}}
+
+
+class FakePrometheus:
+    """Run the fake server on a background thread, use as a context manager."""
+
+    def __init__(self, latency: float = 0.0, host: str = "127.0.0.1", port: int = 0):
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.server.latency = latency
+        self.server.requests = 0
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def requests(self) -> int:
+        return self.server.requests
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.server.server_close()
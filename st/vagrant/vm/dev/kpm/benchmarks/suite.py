@@ -0,0 +1,258 @@
+"""
+Offline benchmark suite: runs every benchmark against the local fake
+Prometheus and fake kepler clients, prints the results and compares them to
+a saved baseline.
+
+    python benchmarks/suite.py                          # run everything
+    python benchmarks/suite.py decode estimator         # run some
+    python benchmarks/suite.py --save baselines/local.json
+    python benchmarks/suite.py --compare baselines/local.json --threshold 0.2
+
+Each benchmark runs --repeat times and keeps the best value of each metric.
+With --compare the suite exits with status 1 when a metric is worse than the
+baseline by more than the threshold. Baselines depend on the machine, whose
+specs are saved along with them, save one per machine before comparing.
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+from datetime import UTC, datetime, timedelta
+from typing import Callable, NamedTuple
+
+import numpy as np
+from bench_decode import START, response
+from bench_estimator import estimator, train_config
+from fake_kepler import load, summarize
+from fake_prometheus import FakePrometheus
+
+from power_model import trainer
+from power_model.datasource import prometheus
+from power_model.datasource.prometheus import Grid, decode_matrix
+
+HERE = pathlib.Path(__file__).parent
+
+
+class Metric(NamedTuple):
+    unit: str
+    higher_is_better: bool
+
+
+class Benchmark(NamedTuple):
+    fn: Callable[[argparse.Namespace], dict[str, float]]
+    metrics: dict[str, Metric]
+
+
+BENCHMARKS: dict[str, Benchmark] = {}
+
+
+def benchmark(name: str, **metrics: Metric):
+    def register(fn):
+        BENCHMARKS[name] = Benchmark(fn, metrics)
+        return fn
+
+    return register
+
+
+@contextlib.contextmanager
+def trained(args):
+    """Yields the config of models trained on the fake prometheus over --window seconds."""
+    with tempfile.TemporaryDirectory() as tmp, FakePrometheus(latency=args.latency) as prom:
+        config = train_config(prom.url, pathlib.Path(tmp))
+        config["train"]["start_at"] = config["train"]["end_at"] - timedelta(seconds=args.window)
+        config["train"]["models"] = {
+            "xgboost": {"objective": "reg:squarederror", "random_state": 42},
+            "linear": {"positive": True},
+            "polynomial": {"degree": 2},
+        }
+        with contextlib.redirect_stdout(io.StringIO()):
+            trainer.train(config, workers=1)
+        yield config
+
+
+@benchmark("decode", us_per_1k_points=Metric("us", False))
+def bench_decode(args):
+    bodies = [response(i, args.window) for i in range(4)]
+    begin = time.perf_counter()
+    grid = Grid([f"f{i}" for i in range(len(bodies))], START, 1, args.window)
+    for i, body in enumerate(bodies):
+        samples = decode_matrix(body)[0]
+        grid.write(i, samples[:, 0], samples[:, 1])
+    grid.to_frame()
+    elapsed = time.perf_counter() - begin
+    return {"us_per_1k_points": elapsed / (len(bodies) * args.window) * 1e9}
+
+
+@benchmark("range_query", seconds=Metric("s", False))
+def bench_range_query(args):
+    queries = {f"f{i}": f"sum(rate(metric_{i}_total[12s]))" for i in range(4)}
+    end = datetime.now(UTC).replace(microsecond=0) - timedelta(hours=1)
+    with FakePrometheus(latency=args.latency) as prom, prometheus.Client(prom.url) as client:
+        begin = time.perf_counter()
+        client.range_query(start=end - timedelta(seconds=args.window), end=end, step="1s", **queries)
+        return {"seconds": time.perf_counter() - begin}
+
+
+@benchmark("train", rows_per_second=Metric("rows/s", True))
+def bench_train(args):
+    with tempfile.TemporaryDirectory() as tmp, FakePrometheus(latency=args.latency) as prom:
+        config = train_config(prom.url, pathlib.Path(tmp))
+        config["train"]["start_at"] = config["train"]["end_at"] - timedelta(seconds=args.window)
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            trainer.train(config, workers=1)
+        return {"rows_per_second": (args.window + 1) / (time.perf_counter() - begin)}
+
+
+@benchmark("predict", p50_ms=Metric("ms", False), p99_ms=Metric("ms", False))
+def bench_predict(args):
+    with trained(args) as config:
+        predictor = trainer.Predictor(config)
+        at = config["train"]["end_at"]
+        latencies = []
+        for _ in range(args.predictions):
+            begin = time.perf_counter()
+            predictor.predict_instant(at)
+            latencies.append(time.perf_counter() - begin)
+
+    ms = np.array(latencies) * 1000
+    return {"p50_ms": float(np.percentile(ms, 50)), "p99_ms": float(np.percentile(ms, 99))}
+
+
+@benchmark("compute_error", seconds=Metric("s", False))
+def bench_compute_error(args):
+    with trained(args) as config:
+        predictor = trainer.Predictor(config)
+        begin = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            predictor.predict_range(config["train"]["start_at"], config["train"]["end_at"])
+        return {"seconds": time.perf_counter() - begin}
+
+
+@benchmark(
+    "estimator",
+    requests_per_second=Metric("req/s", True),
+    p50_ms=Metric("ms", False),
+    p99_ms=Metric("ms", False),
+)
+def bench_estimator(args):
+    with trained(args) as config, estimator(config, args.batch_window / 1000, 256) as socket_path:
+        return summarize(*asyncio.run(load(socket_path, args.clients, args.requests, 1)))
+
+
+def best(values: list[float], metric: Metric) -> float:
+    return max(values) if metric.higher_is_better else min(values)
+
+
+def run(names: list[str], args) -> dict[str, dict[str, float]]:
+    results = {}
+    for name in names:
+        bench = BENCHMARKS[name]
+        runs = [bench.fn(args) for _ in range(args.repeat)]
+        results[name] = {m: best([r[m] for r in runs], metric) for m, metric in bench.metrics.items()}
+        for m, value in results[name].items():
+            print(f"{name:<14} {m:<20} {value:12.3f} {bench.metrics[m].unit}")
+    return results
+
+
+def cpu_model() -> str:
+    try:
+        with open("/proc/cpuinfo") as f:
+            for line in f:
+                if line.startswith("model name"):
+                    return line.partition(":")[2].strip()
+    except OSError:
+        pass
+    return platform.processor() or platform.machine()
+
+
+def machine() -> dict:
+    """The specs of this machine, the timings of a baseline only hold on the same ones."""
+    memory = None
+    if hasattr(os, "sysconf") and "SC_PHYS_PAGES" in os.sysconf_names:
+        memory = os.sysconf("SC_PHYS_PAGES") * os.sysconf("SC_PAGE_SIZE")
+    return {
+        "host": platform.node(),
+        "os": f"{platform.system()} {platform.release()}",
+        "arch": platform.machine(),
+        "cpu": cpu_model(),
+        "cpus": os.cpu_count(),
+        "usable_cpus": len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count(),
+        "memory_bytes": memory,
+        "python": f"{platform.python_implementation()} {platform.python_version()}",
+    }
+
+
+def compare(results: dict[str, dict[str, float]], baseline: dict, threshold: float) -> list[str]:
+    """Returns a line for every metric that regressed by more than threshold."""
+    regressions = []
+    for name, metrics in results.items():
+        for m, value in metrics.items():
+            base = baseline["results"].get(name, {}).get(m)
+            if not base:
+                continue
+
+            metric = BENCHMARKS[name].metrics[m]
+            change = (value - base) / base
+            worse = -change if metric.higher_is_better else change
+            status = "REGRESSION" if worse > threshold else "ok"
+            print(f"{name:<14} {m:<20} {base:12.3f} -> {value:12.3f} {metric.unit:<6} {change:+7.1%}  {status}")
+            if worse > threshold:
+                regressions.append(f"{name}.{m}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmarks", nargs="*", help=f"benchmarks to run, default all of {', '.join(BENCHMARKS)}")
+    parser.add_argument("--repeat", type=int, default=3, help="runs of each benchmark, the best is kept")
+    parser.add_argument("--window", type=int, default=1800, help="seconds of 1s samples fetched and trained on")
+    parser.add_argument("--latency", type=float, default=0.0, help="artificial prometheus latency in seconds")
+    parser.add_argument("--predictions", type=int, default=200, help="predictions timed by the predict benchmark")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent estimator clients")
+    parser.add_argument("--requests", type=int, default=50, help="requests sent by each estimator client")
+    parser.add_argument("--batch-window", type=float, default=2.0, help="estimator batch window in milliseconds")
+    parser.add_argument("--save", type=pathlib.Path, help="write the results as a baseline to this file")
+    parser.add_argument("--compare", type=pathlib.Path, help="compare the results with this baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    names = args.benchmarks or list(BENCHMARKS)
+    if unknown := [n for n in names if n not in BENCHMARKS]:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+    results = run(names, args)
+
+    if args.save:
+        path = args.save if args.save.is_absolute() else HERE / args.save
+        path.parent.mkdir(parents=True, exist_ok=True)
+        baseline = {
+            "machine": machine(),
+            "python": platform.python_version(),
+            "created": datetime.now(UTC).isoformat(timespec="seconds"),
+            "params": {k: v for k, v in vars(args).items() if k not in ("benchmarks", "save", "compare")},
+            "results": results,
+        }
+        path.write_text(json.dumps(baseline, indent=2) + "\n")
+        print(f"saved baseline to {path}")
+
+    if args.compare:
+        path = args.compare if args.compare.is_absolute() else HERE / args.compare
+        baseline = json.loads(path.read_text())
+        if baseline.get("machine") != machine():
+            print(f"baseline was recorded on another machine: {baseline.get('machine')}")
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"regressed: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
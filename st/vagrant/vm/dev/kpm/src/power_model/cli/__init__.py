@@ -3,14 +3,15 @@
 # SPDX-License-Identifier: MIT
 import logging
 import sys
-import time
 from datetime import UTC, datetime, timedelta
 
 import click
-from prometheus_client import start_http_server, Gauge
+from prometheus_client import Gauge
 
-from power_model import trainer
+from power_model import profiling, telemetry, trainer
 from power_model.__about__ import __version__
+from power_model.datasource.prometheus import parse_duration
+from power_model.trainer.scheduler import PredictionLoop
 
 logger = logging.getLogger(__name__)
 
@@ -27,7 +28,28 @@ logger = logging.getLogger(__name__)
     default="info",
     required=False,
 )
-def pm(log_level: str):
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    envvar="POWER_MODEL_METRICS_PORT",
+    help="Serve prometheus metrics of training and predictions on this port, disabled by default.",
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(file_okay=False),
+    default=None,
+    help="Write a report of the wall time, CPU time and peak memory of each stage to this directory.",
+)
+@click.option(
+    "--profile-with",
+    type=click.Choice(profiling.CAPTURES),
+    multiple=True,
+    help="Also capture the command with cProfile (profile.pstats) and/or tracemalloc, may be repeated. "
+    "Use --workers 1 to include model fitting.",
+)
+def pm(log_level: str, metrics_port: int | None, profile_path: str | None, profile_with: tuple[str, ...]):
     level = getattr(logging, log_level.upper())
     logging.basicConfig(
         level=level,
@@ -36,6 +58,13 @@ def pm(log_level: str):
     )
     logger.debug("Log level set to %s", log_level)
 
+    if metrics_port is not None:
+        telemetry.serve(metrics_port)
+
+    if profile_path is not None:
+        profiling.start(profile_path, list(profile_with))
+        click.get_current_context().call_on_close(profiling.stop)
+
 
 @pm.command()
 @click.option(
@@ -45,12 +74,39 @@ def pm(log_level: str):
     help="Path to the pipeline YAML file.",
     type=click.Path(exists=True),
 )
-def train(file):
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of processes training models in parallel, defaults to train.workers or one per core.",
+)
+@click.option(
+    "-i",
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Update the trained models with the data since they were last trained instead of refitting them.",
+)
+@click.option(
+    "-s",
+    "--snapshot",
+    "from_snapshot",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Train from a snapshot of the training inputs written by a previous train instead of querying prometheus.",
+)
+def train(file, workers: int | None, incremental: bool, from_snapshot: str | None):
     """Train models based on the provided pipeline configuration."""
 
     try:
         pipeline = trainer.load_pipeline(file)
-        trainer.train(pipeline)
+        if incremental:
+            if from_snapshot is not None:
+                raise click.UsageError("--snapshot can not be used with --incremental")
+            trainer.retrain(pipeline, workers=workers)
+        else:
+            trainer.train(pipeline, workers=workers, from_snapshot=from_snapshot)
         click.echo("Training completed successfully.")
 
     except Exception as e:
@@ -60,6 +116,50 @@ def train(file):
 
         traceback.print_exc()
 
+@pm.command()
+@click.option(
+    "-f",
+    "--file",
+    required=True,
+    help="Path to the pipeline YAML file.",
+    type=click.Path(exists=True),
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of processes evaluating candidates in parallel, defaults to train.workers or one per core.",
+)
+@click.option(
+    "-b",
+    "--budget",
+    default=None,
+    help="Wall time budget of the search (e.g. 10m), defaults to tune.budget.",
+)
+@click.option(
+    "-s",
+    "--snapshot",
+    "from_snapshot",
+    type=click.Path(exists=True, dir_okay=False),
+    default=None,
+    help="Tune on a snapshot of the training inputs written by a previous train instead of querying prometheus.",
+)
+def tune(file, workers: int | None, budget: str | None, from_snapshot: str | None):
+    """Search the parameter ranges in the tune section and train the best models."""
+
+    try:
+        pipeline = trainer.load_pipeline(file)
+        trainer.tune(pipeline, workers=workers, budget=budget, from_snapshot=from_snapshot)
+        click.echo("Tuning completed successfully.")
+
+    except Exception as e:
+        click.echo(f"An error occurred: {e}")
+        import traceback
+
+        traceback.print_exc()
+
+
 def signal_handler(signum):
     click.secho(f"Gracefully shutting down after receiving signal {signum}")
     sys.exit(0)
@@ -72,7 +172,18 @@ def signal_handler(signum):
     help="Path to the pipeline YAML file.",
     type=click.Path(exists=True),
 )
-def run(file):
+@click.option(
+    "-i",
+    "--interval",
+    default=None,
+    help="Time between predictions (e.g. 1s), defaults to predict.interval or 1s.",
+)
+@click.option(
+    "--table/--no-table",
+    default=True,
+    help="Print the predictions of each tick against the target.",
+)
+def run(file, interval: str | None, table: bool):
     """Run models based on the provided pipeline configuration and compare the prediction against learning."""
 
     # try:
@@ -82,13 +193,16 @@ def run(file):
                    'CPU Frequency as reported by turbostat',
                    ["pipeline", "model"])
 
+    def publish(predictions):
+        for p in predictions:
+            target.labels(p.pipeline, p.model).set(p.y_pred)
+
+    interval = parse_duration(interval or pipeline.get("predict", {}).get("interval", "1s"))
+    loop = PredictionLoop(predictor, interval, publish, show=table)
     try:
-        while True:
-            preditions = predictor.predict()
-            for p in preditions:
-                target.labels(p.pipeline, p.model).set(p.y_pred)
-            time.sleep(1)
+        loop.run()
     except KeyboardInterrupt:
+        loop.stop()
         click.echo("Exiting...")
 
     # except Exception as e:
@@ -125,7 +239,48 @@ def run(file):
     type=int,
     default=5 * 60,
 )
-def compute_error(file, start: datetime|None, end: datetime, duration: int):
+@click.option(
+    "-c",
+    "--chunk",
+    default=None,
+    help="Length of the parts of the window that are fetched and evaluated at once (e.g. 1h), defaults to 1h.",
+)
+@click.option(
+    "-b",
+    "--bucket",
+    default=None,
+    help="Also report the errors per bucket of this length (e.g. 1h).",
+)
+@click.option(
+    "--load-levels",
+    default=None,
+    help="Also report the errors per level of the target between these comma separated edges (e.g. 50,100,200).",
+)
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=None,
+    help="Number of pipelines evaluated in parallel, defaults to all of them.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the errors per bucket to this CSV file.",
+)
+def compute_error(
+    file,
+    start: datetime | None,
+    end: datetime,
+    duration: int,
+    chunk: str | None,
+    bucket: str | None,
+    load_levels: str | None,
+    workers: int | None,
+    output: str | None,
+):
     """Run models based on the provided pipeline configuration and compare the prediction against learning."""
 
     if start is None:
@@ -137,11 +292,21 @@ def compute_error(file, start: datetime|None, end: datetime, duration: int):
     if start is not None and duration > 0:
         end = start + timedelta(seconds=duration)
 
+    if bucket is not None and load_levels is not None:
+        raise click.ClickException("Please provide either --bucket or --load-levels")
+
+    from power_model.trainer.evaluator import Buckets
+
+    buckets = Buckets(
+        seconds=parse_duration(bucket) if bucket else None,
+        levels=sorted(float(v) for v in load_levels.split(",")) if load_levels else None,
+    )
+
     pipeline = trainer.load_pipeline(file)
     predictor = trainer.Predictor(pipeline)
 
     click.secho(f"Predicting from {start} to {end}")
-    predictor.predict_range(start, end)
+    predictor.predict_range(start, end, chunk=chunk, buckets=buckets, workers=workers, output=output)
 
 
 if __name__ == "__main__":
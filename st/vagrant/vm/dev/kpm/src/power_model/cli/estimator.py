@@ -1,19 +1,25 @@
 # SPDX-FileCopyrightText: 2024-present Sunil Thaha <sthaha@redhat.com>
 #
 # SPDX-License-Identifier: MIT
+import asyncio
 import logging
 import sys
 import json
-import socket
 import os
+import re
 import signal
-from datetime import UTC, datetime, timedelta
+import struct
+import time
+import typing
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
 
 import click
-import pandas as pd
+import numpy as np
 
-from power_model import trainer
+from power_model import telemetry, trainer
 from power_model.__about__ import __version__
+from power_model.trainer.reloader import Reloader
 
 logger = logging.getLogger(__name__)
 
@@ -30,7 +36,14 @@ logger = logging.getLogger(__name__)
     default="info",
     required=False,
 )
-def proxy(log_level: str):
+@click.option(
+    "--metrics-port",
+    type=int,
+    default=None,
+    envvar="POWER_MODEL_METRICS_PORT",
+    help="Serve prometheus metrics of the estimator on this port, disabled by default.",
+)
+def proxy(log_level: str, metrics_port: int | None):
     level = getattr(logging, log_level.upper())
     logging.basicConfig(
         level=level,
@@ -39,6 +52,9 @@ def proxy(log_level: str):
     )
     logger.debug("Log level set to %s", log_level)
 
+    if metrics_port is not None:
+        telemetry.serve(metrics_port)
+
 
 def signal_handler(signum):
     click.secho(f"Gracefully shutting down after receiving signal {signum}")
@@ -46,60 +62,317 @@ def signal_handler(signum):
 
 SERVE_SOCKET = "/tmp/estimator.sock"
 
-class PowerRequest:
-    def __init__(self, metrics, values, output_type, source, system_features, system_values, trainer_name="", filter=""):
-        self.trainer_name = trainer_name
-        self.metrics = metrics
-        self.filter = filter
-        self.output_type = output_type
-        self.energy_source = source
-        self.system_features = system_features
-        self.datapoint = pd.DataFrame(values, columns=metrics)
-        data_point_size = len(self.datapoint)
-        for i in range(len(system_features)):
-            self.datapoint[system_features[i]] = [system_values[i]] * data_point_size
+# kepler sends a single JSON document per request without any framing, other
+# clients may prefix each request with its length as a 4 byte big endian
+# integer, the response uses the same framing as the request. Both can be told
+# apart by the first byte as any prefix starting with "{" or whitespace would
+# exceed MAX_REQUEST_SIZE.
+LENGTH_PREFIX = struct.Struct(">I")
+
+DEFAULT_MAX_IN_FLIGHT = 64
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_WINDOW_MS = 0.0
+DEFAULT_MAX_BATCH = 256
+MAX_REQUEST_SIZE = 4 * 1024 * 1024
+
+
+class FramingError(Exception):
+    pass
+
+
+class MalformedRequest(FramingError):
+    """An unframed request that is not valid JSON, it is answered with an error before closing."""
+
+
+# the rest of an unframed request from where decoding failed when it is only
+# a partially received literal, e.g. `1.` or `tru`
+PARTIAL_LITERAL = re.compile(r"[-+.\w]*")
+
+
+def _incomplete(text: str, e: json.JSONDecodeError) -> bool:
+    """Whether the document only failed to decode because the rest of it was not received yet."""
+    return e.msg.startswith("Unterminated string") or PARTIAL_LITERAL.fullmatch(text, e.pos) is not None
+
+
+async def read_request(reader: asyncio.StreamReader, buffer: bytearray) -> tuple[bytes, bool] | None:
+    """
+    Reads the next request from the connection. Returns the payload and
+    whether it was length prefixed, or None once the client closed the
+    connection. Raises MalformedRequest for an unframed request that can
+    not become valid JSON by receiving more of it.
+    """
+    decoder = json.JSONDecoder()
+    while True:
+        while buffer[:1].isspace():
+            del buffer[:1]
+
+        if buffer[:1] == b"{":
+            # unframed JSON: wait until a complete document has been received
+            # instead of relying on the last character read being a brace.
+            # Undecodable bytes, e.g. a character split across reads, are
+            # kept as is and only fail the request they are part of
+            text = buffer.decode(errors="surrogateescape")
+            try:
+                _, end = decoder.raw_decode(text)
+                payload = text[:end].encode(errors="surrogateescape")
+                del buffer[: len(payload)]
+                return payload, False
+            except json.JSONDecodeError as e:
+                if not _incomplete(text, e):
+                    raise MalformedRequest(f"request is not valid JSON: {e}") from e
+        elif len(buffer) >= LENGTH_PREFIX.size:
+            (size,) = LENGTH_PREFIX.unpack_from(buffer)
+            if size > MAX_REQUEST_SIZE:
+                raise FramingError(f"request of {size} bytes exceeds limit of {MAX_REQUEST_SIZE} bytes")
+
+            end = LENGTH_PREFIX.size + size
+            if len(buffer) >= end:
+                payload = bytes(buffer[LENGTH_PREFIX.size : end])
+                del buffer[:end]
+                return payload, True
+
+        if len(buffer) > MAX_REQUEST_SIZE:
+            raise FramingError(f"request exceeds limit of {MAX_REQUEST_SIZE} bytes")
+
+        chunk = await reader.read(64 * 1024)
+        if not chunk:
+            if buffer.strip():
+                raise FramingError("connection closed with an incomplete request")
+            return None
+        buffer += chunk
+
+
+def error_response(msg: str) -> bytes:
+    return json.dumps({"powers": {}, "msg": msg}).encode()
+
+
+class KeplerRequest(NamedTuple):
+    metrics: tuple[str, ...]
+    # one row per entry, one column per metric
+    values: np.ndarray
+    # the fields the request is routed by, see Router
+    meta: dict[str, str]
+
+
+def decode_request(data: bytes) -> KeplerRequest:
+    """Returns the metric values of a kepler request along with its metadata."""
+    j = json.loads(data)
+
+    metrics = tuple(j["metrics"])
+    values = np.asarray(j["values"], dtype=np.float64)
+    if values.ndim != 2 or len(values) == 0:
+        raise ValueError("request has no values")
+    if values.shape[1] != len(metrics):
+        raise ValueError(f"request has {len(metrics)} metrics but {values.shape[1]} values per entry")
+
+    meta = {
+        "trainer_name": j.get("trainer_name") or "",
+        "filter": j.get("filter") or "",
+        "output_type": j.get("output_type") or "",
+        "energy_source": j.get("source") or "",
+    }
+    meta.update(zip(j.get("system_features") or [], map(str, j.get("system_values") or [])))
+    return KeplerRequest(metrics, values, meta)
+
+
+class Batcher:
+    """
+    Gathers the rows of concurrent requests for up to `window` seconds or
+    until `max_batch` rows are pending and predicts the rows of all requests
+    with the same key in a single call of predict(key, X). Each caller
+    receives the rows of its own request.
+    """
+
+    def __init__(self, predict, executor: ThreadPoolExecutor, window: float, max_batch: int):
+        self.predict_batch = predict
+        self.executor = executor
+        self.window = window
+        self.max_batch = max_batch
+
+        self.pending: dict[typing.Hashable, list[tuple[np.ndarray, asyncio.Future]]] = {}
+        self.rows = 0
+        self.timer: asyncio.TimerHandle | None = None
+        self.running: set[asyncio.Task] = set()
+
+    async def predict(self, key: typing.Hashable, X: np.ndarray) -> np.ndarray:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.setdefault(key, []).append((X, future))
+        self.rows += len(X)
+        telemetry.current.batch_rows.set(self.rows)
+
+        if self.rows >= self.max_batch:
+            self.flush()
+        elif self.timer is None:
+            self.timer = loop.call_later(self.window, self.flush)
+
+        return await future
+
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        pending, self.pending, self.rows = self.pending, {}, 0
+        telemetry.current.batch_rows.set(0)
+
+        for key, batch in pending.items():
+            task = asyncio.create_task(self.run(key, batch))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    async def run(self, key: typing.Hashable, batch: list[tuple[np.ndarray, asyncio.Future]]):
+        loop = asyncio.get_running_loop()
+        X = np.concatenate([x for x, _ in batch])
+        try:
+            y = await loop.run_in_executor(self.executor, self.predict_batch, key, X)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        offset = 0
+        for x, future in batch:
+            if not future.done():
+                future.set_result(y[offset : offset + len(x)])
+            offset += len(x)
+
 
 class Server:
-    def __init__(self, socket_path: str, predictor: trainer.Predictor):
+    """
+    Serves kepler estimator requests on a unix socket.
+
+    Each connection may send any number of requests and is served
+    concurrently with all other connections. Requests on a connection are
+    answered in order and the next request is only read once the previous
+    response has been flushed, and at most `max_in_flight` requests are
+    being predicted at any time, so slow clients and bursts apply
+    backpressure instead of queueing without bound.
+
+    Each request is predicted on the model its metadata routes it to, see
+    Router. With a non-zero `batch_window` (in seconds), concurrent requests
+    of the same route are predicted together, see Batcher.
+    """
+
+    def __init__(
+        self,
+        socket_path: str,
+        predictor: trainer.Predictor,
+        workers: int = DEFAULT_WORKERS,
+        max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+        batch_window: float = DEFAULT_BATCH_WINDOW_MS / 1000,
+        max_batch: int = DEFAULT_MAX_BATCH,
+    ):
         self.socket_path = socket_path
         self.predictor = predictor
+        self.max_in_flight = max_in_flight
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="estimator")
+
+        self.batcher = None
+        if batch_window > 0:
+            self.batcher = Batcher(self.predict_rows, self.executor, batch_window, max_batch)
+
+    def swap(self, predictor: trainer.Predictor):
+        """
+        Replaces the predictor, requests that are being predicted finish on
+        the previous one and all following ones use the new one.
+        """
+        self.predictor = predictor
+
+    @staticmethod
+    def predict_rows(key: tuple, values: np.ndarray) -> np.ndarray:
+        predictor, route, metrics = key
+        return predictor.predict_route(route, metrics, values)
 
     def listen(self):
-        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
-        s.bind(self.socket_path)
-        s.listen(1)
+        asyncio.run(self.serve())
+
+    async def serve(self):
+        self.in_flight = asyncio.Semaphore(self.max_in_flight)
+        server = await asyncio.start_unix_server(self.serve_connection, path=self.socket_path)
 
         logger.info(f"listening on {self.socket_path}")
-        while True:
-            connection, _ = s.accept()
-            self.handle(connection)
-
-    def handle(self, connection):
-        data = b""
-        while True:
-            shunk = connection.recv(1024).strip()
-            data += shunk
-            if shunk is None or shunk.decode()[-1] == "}":
-                break
-        decoded_data = data.decode()
-
-        #logger.info(f"request: {decoded_data}")
+        async with server:
+            await server.serve_forever()
+
+    async def serve_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        buffer = bytearray()
         try:
-            # power_request = json.loads(decoded_data, object_hook=lambda d: PowerRequest(**d))
-            j = json.loads(decoded_data)
+            while True:
+                request = await read_request(reader, buffer)
+                if request is None:
+                    break
+
+                payload, framed = request
+                current = telemetry.current
+                current.queued.inc()
+                async with self.in_flight:
+                    current.queued.dec()
+                    current.in_flight.inc()
+                    try:
+                        response = await self.handle(payload)
+                    finally:
+                        current.in_flight.dec()
+
+                if framed:
+                    writer.write(LENGTH_PREFIX.pack(len(response)))
+                writer.write(response)
+                await writer.drain()
+
+        except MalformedRequest as e:
+            # the end of the request is unknown, so the connection can not
+            # be read any further
+            telemetry.current.errors.labels("decode").inc()
+            logger.error(f"closing connection: {e}")
+            writer.write(error_response(str(e)))
+            await writer.drain()
+        except FramingError as e:
+            telemetry.current.errors.labels("framing").inc()
+            logger.error(f"closing connection: {e}")
+        except ConnectionError as e:
+            telemetry.current.errors.labels("connection").inc()
+            logger.debug(f"connection lost: {e}")
+        finally:
+            writer.close()
+
+    async def predict(self, predictor: trainer.Predictor, request: KeplerRequest) -> np.ndarray:
+        # the key pins the predictor, so that requests batched before a reload
+        # are predicted on the routes they were assigned to; every target is
+        # predicted by a single call per batch
+        key = (predictor, predictor.router.route(request.meta), request.metrics)
+        if self.batcher is not None:
+            return await self.batcher.predict(key, request.values)
 
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.predict_rows, key, request.values)
+
+    async def handle(self, data: bytes) -> bytes:
+        current = telemetry.current
+        cause = "decode"
+        try:
+            start = time.perf_counter()
+            request = decode_request(data)
+            decoded = time.perf_counter()
+            current.decode_seconds.observe(decoded - start)
+
+            cause = "inference"
+            predictor = self.predictor
+            y = await self.predict(predictor, request)
+            predicted = time.perf_counter()
+            current.inference_seconds.observe(predicted - decoded)
+            powers = predictor.kepler_powers(y)
         except Exception as e:
+            current.errors.labels(cause).inc()
             msg = f"failed to handle request: {e}"
             logger.error(msg)
-            return {"powers": {}, "msg": msg}
+            return error_response(msg)
 
-        df = pd.DataFrame(j["values"], columns=j["metrics"])
-        bpf_cpu_time_ms = df["bpf_cpu_time_ms"].values[0]
-
-        y = self.predictor.kepler_predict(bpf_cpu_time_ms, 0)
-        response = json.dumps({"powers": y._asdict(), "msg": "", "core_ratio": 1})
-        logger.info(f"response: {bpf_cpu_time_ms}: {response}")
-        connection.send(response.encode())
+        response = json.dumps({"powers": powers._asdict(), "msg": "", "core_ratio": 1}).encode()
+        current.encode_seconds.observe(time.perf_counter() - predicted)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"response: {request.meta}: {request.values.tolist()}: {response.decode()}")
+        return response
 
 
 def clean_socket():
@@ -122,7 +395,37 @@ def sig_handler(*args) -> None:
     help="Path to the pipeline YAML file.",
     type=click.Path(exists=True),
 )
-def run(file):
+@click.option(
+    "-w",
+    "--workers",
+    type=int,
+    default=DEFAULT_WORKERS,
+    help="Number of threads running predictions.",
+)
+@click.option(
+    "--max-in-flight",
+    type=int,
+    default=DEFAULT_MAX_IN_FLIGHT,
+    help="Maximum number of requests being predicted at the same time.",
+)
+@click.option(
+    "--batch-window",
+    type=float,
+    default=DEFAULT_BATCH_WINDOW_MS,
+    help="Milliseconds to gather concurrent requests into a single prediction, 0 disables batching.",
+)
+@click.option(
+    "--max-batch",
+    type=int,
+    default=DEFAULT_MAX_BATCH,
+    help="Number of rows after which a batch is predicted without waiting for the window to pass.",
+)
+@click.option(
+    "--reload/--no-reload",
+    default=True,
+    help="Reload the pipeline config and the models when they change or on SIGHUP, without restarting.",
+)
+def run(file, workers: int, max_in_flight: int, batch_window: float, max_batch: int, reload: bool):
     """Run models based on the provided pipeline configuration and compare the prediction against learning."""
 
     clean_socket()
@@ -130,11 +433,29 @@ def run(file):
 
     pipeline = trainer.load_pipeline(file)
     predictor = trainer.Predictor(pipeline)
+    predictor.router.resolve_all()
+
+    server = Server(
+        SERVE_SOCKET,
+        predictor,
+        workers=workers,
+        max_in_flight=max_in_flight,
+        batch_window=batch_window / 1000,
+        max_batch=max_batch,
+    )
+
+    reloader = None
+    if reload:
+        reloader = Reloader.from_config(file, predictor, server.swap)
+        reloader.start()
+        signal.signal(signal.SIGHUP, lambda *args: reloader.trigger())
 
-    server = Server(SERVE_SOCKET, predictor)
     try:
         server.listen()
     finally:
+        if reloader is not None:
+            reloader.stop()
+        logger.info(f"predictor stats: {server.predictor.stats()}")
         clean_socket()
 
 
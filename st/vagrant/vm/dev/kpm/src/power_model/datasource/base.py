@@ -0,0 +1,22 @@
+from datetime import datetime
+from typing import Protocol
+
+import pandas as pd
+
+
+class InstantSource(Protocol):
+    """
+    Source of the live samples of the pipelines. Queries return a frame with
+    one column per keyword query, indexed by unix timestamp, containing only
+    the timestamps at which every query has a sample.
+    """
+
+    def instant_query(self, at: datetime, **queries: str) -> pd.DataFrame: ...
+
+    def close(self): ...
+
+
+class RangeSource(InstantSource, Protocol):
+    """Source that also serves the samples of a window, e.g. for training."""
+
+    def range_query(self, start: datetime, end: datetime, step, **queries: str) -> pd.DataFrame: ...
@@ -0,0 +1,228 @@
+import hashlib
+import logging
+import os
+import pathlib
+import re
+from typing import Iterable, NamedTuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# samples newer than this may still change as late scrapes arrive at
+# prometheus, so they are returned but never marked as cached
+DEFAULT_SETTLE_SECONDS = 5 * 60
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+# samples of a query are stored in files of at most this many grid points so
+# that a request only reads and writes the part of the history it covers
+DEFAULT_SEGMENT_POINTS = 4096
+
+SIZE_UNITS = {"": 1, "B": 1, "KB": 1000, "MB": 1000**2, "GB": 1000**3, "KIB": 1024, "MIB": 1024**2, "GIB": 1024**3}
+
+
+def parse_size(size) -> int:
+    """Converts a size like 512MiB or 1GB to bytes."""
+    if isinstance(size, int):
+        return size
+
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*", str(size))
+    if not m or m.group(2).upper() not in SIZE_UNITS:
+        raise ValueError(f"Invalid size: {size}")
+
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2).upper()])
+
+
+class Interval(NamedTuple):
+    start: float
+    end: float
+
+
+class Entry:
+    """
+    Samples of one query on one step grid together with the intervals of the
+    grid that have already been fetched from prometheus.
+    """
+
+    def __init__(self, timestamps: np.ndarray, values: np.ndarray, covered: list[Interval]):
+        self.timestamps = timestamps
+        self.values = values
+        self.covered = covered
+
+    @classmethod
+    def empty(cls) -> "Entry":
+        return cls(np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64), [])
+
+    @classmethod
+    def concat(cls, entries: list["Entry"], step: float) -> "Entry":
+        """Joins the entries of consecutive, non overlapping segments."""
+        joined = cls.empty()
+        if entries:
+            joined.timestamps = np.concatenate([e.timestamps for e in entries])
+            joined.values = np.concatenate([e.values for e in entries])
+        joined.covered = merge_intervals([iv for e in entries for iv in e.covered], step)
+        return joined
+
+    def segment(self, start: float, end: float) -> "Entry":
+        """Returns the samples and covered intervals within start..end."""
+        inside = (self.timestamps >= start) & (self.timestamps <= end)
+        covered = [
+            Interval(max(iv.start, start), min(iv.end, end))
+            for iv in self.covered
+            if iv.start <= end and iv.end >= start
+        ]
+        return Entry(self.timestamps[inside], self.values[inside], covered)
+
+    def missing(self, start: float, end: float, step: float) -> list[Interval]:
+        """Returns the parts of start..end (inclusive) that are not covered."""
+        missing = []
+        cursor = start
+        for iv in self.covered:
+            if iv.end < cursor:
+                continue
+            if iv.start > end:
+                break
+            if iv.start > cursor:
+                missing.append(Interval(cursor, min(iv.start - step, end)))
+            cursor = iv.end + step
+
+        if cursor <= end:
+            missing.append(Interval(cursor, end))
+        return missing
+
+    def splice(self, start: float, end: float, step: float, timestamps: np.ndarray, values: np.ndarray):
+        """Replaces the samples in start..end with the given ones and marks the range as covered."""
+        outside = (self.timestamps < start) | (self.timestamps > end)
+        ts = np.concatenate([self.timestamps[outside], timestamps])
+        order = np.argsort(ts, kind="stable")
+        self.timestamps = ts[order]
+        self.values = np.concatenate([self.values[outside], values])[order]
+        self.covered = merge_intervals([*self.covered, Interval(start, end)], step)
+
+
+def merge_intervals(intervals: list[Interval], step: float) -> list[Interval]:
+    merged: list[Interval] = []
+    for iv in sorted(intervals):
+        # adjacent grid intervals are merged as well
+        if merged and iv.start <= merged[-1].end + step:
+            merged[-1] = Interval(merged[-1].start, max(merged[-1].end, iv.end))
+        else:
+            merged.append(iv)
+    return merged
+
+
+class RangeCache:
+    """
+    On-disk cache of range query results.
+
+    Each (prometheus server, promql, step, grid offset) is split into segments of
+    segment_points grid points and every segment is stored in its own npz
+    file holding the sample timestamps, values and the covered intervals, so
+    that a request only reads and rewrites the segments it overlaps. Files
+    are evicted least recently used first once the directory grows beyond
+    max_bytes.
+    """
+
+    def __init__(
+        self,
+        path: str | pathlib.Path,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        settle_seconds: float = DEFAULT_SETTLE_SECONDS,
+        segment_points: int = DEFAULT_SEGMENT_POINTS,
+    ):
+        if segment_points < 1:
+            raise ValueError(f"segment_points must be at least 1, got {segment_points}")
+
+        self.path = pathlib.Path(path)
+        self.max_bytes = max_bytes
+        self.settle_seconds = settle_seconds
+        self.segment_points = segment_points
+        os.makedirs(self.path, exist_ok=True)
+
+    @staticmethod
+    def key(url: str, promql: str, step: float, start: float) -> str:
+        # queries whose grid is shifted relative to each other can not share
+        # samples, nor can those sent to different servers
+        offset = start % step
+        return hashlib.sha256(f"{url}\0{promql}\0{step!r}\0{offset!r}".encode()).hexdigest()
+
+    def segments(self, start: float, end: float, step: float) -> list[tuple[int, Interval]]:
+        """Returns the index and grid interval of the segments that overlap start..end."""
+        offset = start % step
+        span = self.segment_points * step
+        first = int((start - offset) // span)
+        last = int((end - offset) // span)
+        return [(i, Interval(offset + i * span, offset + (i + 1) * span - step)) for i in range(first, last + 1)]
+
+    def _file(self, key: str, segment: int) -> pathlib.Path:
+        return self.path / f"{key}-{segment}.npz"
+
+    def _load_segment(self, file: pathlib.Path) -> Entry:
+        try:
+            with np.load(file) as npz:
+                entry = Entry(
+                    npz["timestamps"],
+                    npz["values"],
+                    [Interval(float(s), float(e)) for s, e in npz["covered"]],
+                )
+        except FileNotFoundError:
+            return Entry.empty()
+        except Exception as e:
+            logger.warning(f"ignoring unreadable cache file {file}: {e}")
+            return Entry.empty()
+
+        # mtime tracks the last use for eviction
+        os.utime(file)
+        return entry
+
+    def load(self, key: str, start: float, end: float, step: float) -> Entry:
+        """Loads the segments that overlap start..end."""
+        return Entry.concat([self._load_segment(self._file(key, i)) for i, _ in self.segments(start, end, step)], step)
+
+    def store(self, key: str, promql: str, entry: Entry, start: float, end: float, step: float) -> list[pathlib.Path]:
+        """
+        Writes the segments of the entry that overlap start..end and returns
+        their files. The entry must hold everything cached for those
+        segments, as returned by load, as they are overwritten.
+        """
+        files = []
+        for i, segment in self.segments(start, end, step):
+            part = entry.segment(*segment)
+            file = self._file(key, i)
+            tmp = file.with_name(f"{file.name}.tmp")
+            with open(tmp, "wb") as f:
+                np.savez_compressed(
+                    f,
+                    timestamps=part.timestamps,
+                    values=part.values,
+                    covered=np.array(part.covered, dtype=np.float64).reshape(-1, 2),
+                    promql=np.array(promql),
+                )
+            os.replace(tmp, file)
+            files.append(file)
+        return files
+
+    def evict(self, keep: Iterable[pathlib.Path] = ()):
+        """
+        Removes the least recently used files until the directory fits in
+        max_bytes. The files in keep, usually the ones just stored, are
+        never removed.
+        """
+        keep = set(keep)
+        files = [(f, f.stat()) for f in self.path.glob("*.npz")]
+        total = sum(st.st_size for _, st in files)
+        if total <= self.max_bytes:
+            return
+
+        for f, st in sorted(files, key=lambda x: x[1].st_mtime):
+            if total <= self.max_bytes:
+                break
+            if f in keep:
+                continue
+            logger.debug(f"evicting cache file {f}")
+            f.unlink(missing_ok=True)
+            total -= st.st_size
+
+        if total > self.max_bytes:
+            logger.warning(f"cache {self.path} holds {total} bytes, more than max_size {self.max_bytes}")
@@ -0,0 +1,252 @@
+import logging
+import re
+import threading
+import time
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+import requests
+
+from power_model.datasource import promql
+from power_model.datasource.prometheus import parse_duration
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRAPE_INTERVAL = 1.0
+
+# instant selectors without a range look this far back for a sample
+DEFAULT_LOOKBACK = 60.0
+
+MAX_LABEL_CACHE = 100_000
+
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)\s*=\s*"((?:[^"\\]|\\.)*)"')
+
+
+class Sample(NamedTuple):
+    name: str
+    labels: promql.Labels
+    value: float
+
+
+def _unescape(value: str) -> str:
+    if "\\" not in value:
+        return value
+    return value.replace("\\n", "\n").replace('\\"', '"').replace("\\\\", "\\")
+
+
+def parse_exposition(
+    lines: Iterable[bytes | str], names: set[str] | None = None, label_cache: dict | None = None
+) -> Iterator[Sample]:
+    """
+    Parses the Prometheus text / OpenMetrics exposition format line by line,
+    yielding only the samples of the given metric names. Lines of other
+    metrics are skipped before their labels are parsed, which is where most
+    of the time goes for large exports. The parsed labels can be memoized
+    across scrapes in label_cache as the same series are exported each time.
+    """
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode()
+        if not line or line[0] == "#":
+            continue
+
+        brace = line.find("{")
+        space = line.find(" ")
+        end = brace if brace != -1 and (space == -1 or brace < space) else space
+        if end == -1:
+            continue
+        name = line[:end]
+        if names is not None and name not in names:
+            continue
+
+        labels: promql.Labels = ()
+        rest = line[end:]
+        if brace == end:
+            close = line.rfind("}")
+            raw = line[brace + 1 : close]
+            labels = label_cache.get(raw) if label_cache is not None else None
+            if labels is None:
+                labels = tuple(sorted((k, _unescape(v)) for k, v in LABEL_RE.findall(raw)))
+                if label_cache is not None:
+                    label_cache[raw] = labels
+            rest = line[close + 1 :]
+
+        # the value may be followed by a timestamp, which is ignored as the
+        # samples are stamped with the time they were scraped
+        fields = rest.split()
+        if not fields:
+            continue
+        yield Sample(name, labels, float(fields[0]))
+
+
+class Ring:
+    """Fixed size ring buffer of (timestamp, value) samples of one series."""
+
+    def __init__(self, capacity: int):
+        self.timestamps = np.full(capacity, -np.inf)
+        self.values = np.zeros(capacity)
+        self.head = 0
+        self.count = 0
+
+    def append(self, ts: float, value: float):
+        self.timestamps[self.head] = ts
+        self.values[self.head] = value
+        self.head = (self.head + 1) % len(self.timestamps)
+        self.count = min(self.count + 1, len(self.timestamps))
+
+    @property
+    def last(self) -> float:
+        return self.timestamps[self.head - 1] if self.count else -np.inf
+
+    def samples(self) -> tuple[np.ndarray, np.ndarray]:
+        """Returns the samples in time order."""
+        order = (np.arange(self.count) + self.head - self.count) % len(self.timestamps)
+        return self.timestamps[order], self.values[order]
+
+
+class Target(NamedTuple):
+    url: str
+    # added to every series scraped from the target, e.g. {job: vm} so that
+    # the queries of the pipelines select the same series as in prometheus
+    labels: dict[str, str]
+
+
+class Client:
+    """
+    Live datasource that scrapes the /metrics endpoint of one or more kepler
+    (or any other) exporters on a fixed interval and evaluates the queries
+    of the pipelines in process from a ring buffer of recent samples per
+    series, without going through prometheus.
+
+    Only instant queries are supported and only the subset of PromQL in
+    datasource.promql. The buffers are sized for the longest range in the
+    queries, series that stop being exported are dropped once all their
+    samples left that window.
+    """
+
+    def __init__(
+        self,
+        targets: list[Target],
+        queries: Iterable[str],
+        interval: float = DEFAULT_SCRAPE_INTERVAL,
+        lookback: float = DEFAULT_LOOKBACK,
+    ):
+        if not targets:
+            raise ValueError("at least one scrape target is required")
+
+        self.targets = targets
+        self.interval = interval
+        self.lookback = lookback
+
+        self.exprs: dict[str, promql.Expr] = {}
+        for query in queries:
+            self.exprs.setdefault(query.strip(), promql.parse(query))
+        self.names = set().union(*(promql.metric_names(e) for e in self.exprs.values()))
+        self.window = max([promql.max_window(e) for e in self.exprs.values()] + [lookback])
+        self.capacity = int(np.ceil(self.window / interval)) + 2
+
+        self.buffers: dict[str, dict[promql.Labels, Ring]] = {name: {} for name in self.names}
+        self.label_cache: dict[str, promql.Labels] = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+
+        self.scrapes = 0
+        self.failures = 0
+
+        self.stopped = threading.Event()
+        self.scraped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="kepler-scrape", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_config(cls, config: dict, queries: Iterable[str]) -> "Client":
+        """Create a client from the `predict.kepler` section of the pipeline config."""
+        targets = [
+            Target(t["url"], {k: str(v) for k, v in (t.get("labels") or {}).items()}) for t in config["targets"]
+        ]
+        return cls(
+            targets,
+            queries,
+            interval=parse_duration(config.get("interval", DEFAULT_SCRAPE_INTERVAL)),
+            lookback=parse_duration(config.get("lookback", DEFAULT_LOOKBACK)),
+        )
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _loop(self):
+        tick = time.monotonic()
+        while not self.stopped.is_set():
+            self.scrape()
+            self.scraped.set()
+            # keep a fixed cadence, skipping scrapes that were missed
+            tick += self.interval * max(1, np.ceil((time.monotonic() - tick) / self.interval))
+            self.stopped.wait(max(0.0, tick - time.monotonic()))
+
+    def scrape(self):
+        now = time.time()
+        for target in self.targets:
+            try:
+                with self.session.get(target.url, stream=True, timeout=self.interval) as response:
+                    response.raise_for_status()
+                    lines = response.iter_lines(chunk_size=64 * 1024)
+                    samples = list(parse_exposition(lines, self.names, self.label_cache))
+            except (requests.RequestException, ValueError) as e:
+                self.failures += 1
+                logger.warning(f"failed to scrape {target.url}: {e}")
+                continue
+
+            extra = tuple(target.labels.items())
+            with self.lock:
+                for sample in samples:
+                    labels = tuple(sorted(sample.labels + extra)) if extra else sample.labels
+                    series = self.buffers[sample.name]
+                    if (ring := series.get(labels)) is None:
+                        ring = series[labels] = Ring(self.capacity)
+                    ring.append(now, sample.value)
+
+        with self.lock:
+            for series in self.buffers.values():
+                for labels in [k for k, ring in series.items() if ring.last < now - self.window]:
+                    del series[labels]
+        # the exported series churn with the processes, start over instead of
+        # growing without bound
+        if len(self.label_cache) > MAX_LABEL_CACHE:
+            self.label_cache.clear()
+        self.scrapes += 1
+
+    def series(self, name: str) -> dict[promql.Labels, tuple[np.ndarray, np.ndarray]]:
+        with self.lock:
+            return {labels: ring.samples() for labels, ring in self.buffers.get(name, {}).items()}
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Waits for the first scrape to complete."""
+        return self.scraped.wait(timeout)
+
+    def instant_query(self, at: datetime, **queries):
+        ts = at.timestamp()
+        row = []
+        for key, query in queries.items():
+            expr = self.exprs.get(query.strip())
+            if expr is None:
+                raise ValueError(f"Query was not registered with the kepler datasource: {query}")
+
+            vector = expr.evaluate(self, ts, self.lookback)
+            if not vector:
+                raise ValueError(f"No data found for query: {query}")
+            if len(vector) > 1:
+                raise ValueError(f"Expected single time-series but got {len(vector)} for query: {query}")
+            row.append(next(iter(vector.values())))
+
+        return pd.DataFrame([row], columns=list(queries), index=pd.Index([int(round(ts))], name="timestamp"))
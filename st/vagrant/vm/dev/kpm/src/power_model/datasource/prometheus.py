@@ -1,9 +1,19 @@
-import functools as fn
+import collections
 import logging
-from datetime import datetime
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Iterator, NamedTuple
 
+import numpy as np
 import pandas as pd
-from prometheus_api_client import MetricRangeDataFrame, PrometheusConnect
+import requests
+from prometheus_api_client import PrometheusApiClientException, PrometheusConnect
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from power_model.datasource.cache import DEFAULT_MAX_BYTES, DEFAULT_SETTLE_SECONDS, Interval, RangeCache, parse_size
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -28,75 +38,376 @@ class Query:
         return Query(query=f"sum( {self.query} )", cols=self.cols)
 
 
+# number of queries that are allowed to be in flight at the same time
+DEFAULT_MAX_WORKERS = 8
+
+# prometheus refuses range queries that would return more than 11,000 points
+# per series, stay well below that for every request
+MAX_POINTS_PER_QUERY = 10_000
+
+# same retry policy as PrometheusConnect uses by default
+MAX_REQUEST_RETRIES = 3
+RETRY_BACKOFF_FACTOR = 1
+RETRY_ON_STATUS = [408, 429, 500, 502, 503, 504]
+
+# label that tags the series of each query in a combined instant query
+QUERY_LABEL = "__pm_query__"
+
+
+DURATION_UNITS = {"ms": 0.001, "s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800, "y": 31536000}
+
+
+def parse_duration(duration) -> float:
+    """
+    Converts a prometheus duration (e.g. "1s", "1m30s") or a number of seconds
+    to seconds.
+    """
+    if isinstance(duration, (int, float)):
+        return float(duration)
+    if isinstance(duration, timedelta):
+        return duration.total_seconds()
+
+    duration = str(duration).strip()
+    try:
+        return float(duration)
+    except ValueError:
+        pass
+
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|[smhdwy])", duration)
+    if not parts or "".join(n + u for n, u in parts) != duration:
+        raise ValueError(f"Invalid duration: {duration}")
+
+    return sum(float(n) * DURATION_UNITS[u] for n, u in parts)
+
+
+class Chunk(NamedTuple):
+    key: str
+    promql: str
+    start: float
+    end: float
+
+
+# start of the sample list of a series in a matrix response
+VALUES_RE = re.compile(r'"values"\s*:\s*\[')
+
+# characters dropped from a sample list to leave comma separated numbers
+SAMPLE_CHARS = str.maketrans("", "", '[]" \t\r\n')
+
+
+def decode_matrix(text: str) -> list[np.ndarray]:
+    """
+    Decodes the series of a range query response body into (n, 2) arrays of
+    timestamps and values without building the intermediate JSON objects.
+    """
+    if '"status":"success"' not in text.replace(" ", ""):
+        raise ValueError(f"Unexpected response: {text[:200]}")
+
+    series = []
+    for m in VALUES_RE.finditer(text):
+        start = m.end()
+        if text[start : start + 1] == "]":
+            series.append(np.empty((0, 2), dtype=np.float64))
+            continue
+
+        end = text.index("]]", start)
+        samples = text[start:end].translate(SAMPLE_CHARS)
+        series.append(np.fromstring(samples, dtype=np.float64, sep=",").reshape(-1, 2))
+
+    return series
+
+
+class Grid:
+    """
+    Pre-allocated column buffer with one column per query on a fixed step
+    grid.
+
+    Chunks are written into their slot on the grid as they arrive, so samples
+    that appear in two adjacent chunks are stored only once and all columns
+    are aligned by construction.
+    """
+
+    def __init__(self, columns: list[str], start: float, step: float, size: int):
+        self.columns = columns
+        self.start = start
+        self.step = step
+        self.values = np.full((size, len(columns)), np.nan, dtype=np.float64)
+        self.filled = np.zeros((size, len(columns)), dtype=bool)
+
+    def write(self, column: int, timestamps: np.ndarray, values: np.ndarray):
+        idx = np.rint((timestamps - self.start) / self.step).astype(np.int64)
+        keep = (idx >= 0) & (idx < len(self.values))
+
+        idx = idx[keep]
+        self.values[idx, column] = values[keep]
+        self.filled[idx, column] = True
+
+    def has_data(self, column: int) -> bool:
+        return bool(self.filled[:, column].any())
+
+    def samples(self, column: int, until: float) -> tuple[np.ndarray, np.ndarray]:
+        """Returns timestamps and values of the samples up to (and including) until."""
+        idx = np.flatnonzero(self.filled[: int((until - self.start) // self.step) + 1, column])
+        return self.start + idx * self.step, self.values[idx, column]
+
+    def to_frame(self) -> pd.DataFrame:
+        """Returns the rows for which every column has a sample."""
+        idx = np.flatnonzero(self.filled.all(axis=1))
+        timestamps = (self.start + idx * self.step).astype(np.int64)
+        return pd.DataFrame(
+            self.values[idx],
+            columns=self.columns,
+            index=pd.Index(timestamps, name="timestamp"),
+        )
+
+
+def combine_queries(queries: dict[str, str]) -> str:
+    """
+    Returns a single PromQL expression evaluating every query, where the
+    series of each query carries its key in the QUERY_LABEL label so that
+    the result can be split client side. The label values are distinct, so
+    `or` never drops a series of a later query.
+    """
+    return " or ".join(
+        f'label_replace(({promql}), "{QUERY_LABEL}", "{key}", "", "")' for key, promql in queries.items()
+    )
+
+
 class Client:
-    def __init__(self, url: str):
-        self.prom = PrometheusConnect(url, disable_ssl=True)
+    """
+    Prometheus client that runs the queries passed to range_query
+    concurrently and those passed to instant_query as a single combined
+    expression.
 
-    def instant_query(self, at: datetime, **queries):
-        results = []
-        common_columns = set(["timestamp"])
+    All queries share a single keep-alive connection pool which is sized to
+    match the number of workers, so at most `max_workers` requests are in
+    flight at any time and connections are reused between calls.
 
-        # Iterate over each query provided in kwargs
-        for key, promql in queries.items():
-            logger.debug(f"Running query {key}: '{promql}' @  {at}")
+    Long windows are split into step aligned chunks of at most
+    `max_points` samples which are fetched in parallel and streamed into a
+    pre-allocated buffer per query.
 
-            data = self.prom.custom_query_range(query=promql, start_time=at, end_time=at, step="1s")
-            if not data or len(data[0]["values"]) == 0:
-                raise ValueError(f"No data found for query: {promql}")
+    When a cache is given, range queries only fetch the parts of the window
+    that are not already cached.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_points: int = MAX_POINTS_PER_QUERY,
+        cache: RangeCache | None = None,
+    ):
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be at least 1, got {max_workers}")
+        if max_points < 1:
+            raise ValueError(f"max_points must be at least 1, got {max_points}")
 
-            if len(data) != 1:
-                raise ValueError(f"Expected single time-series but got {len(data)} for query: {promql}")
+        self.max_workers = max_workers
+        self.max_points = max_points
+        self.cache = cache
 
-            # common_columns = common_columns.union(set(promql.cols))
-            metric_df = MetricRangeDataFrame(
-                data=data,
-                ts_as_datetime=False,
+        self.url = url.rstrip("/")
+        self.session = session = requests.Session()
+        session.verify = False
+        self.prom = PrometheusConnect(url, disable_ssl=True, session=session)
+
+        # PrometheusConnect mounts an adapter with the default pool size (10),
+        # replace it with one that is sized for the worker pool.
+        retry = Retry(
+            total=MAX_REQUEST_RETRIES,
+            backoff_factor=RETRY_BACKOFF_FACTOR,
+            status_forcelist=RETRY_ON_STATUS,
+            # instant queries are POSTed to fit long combined expressions,
+            # they are read only and safe to retry
+            allowed_methods=Retry.DEFAULT_ALLOWED_METHODS | {"POST"},
+        )
+        session.mount(url, HTTPAdapter(pool_connections=1, pool_maxsize=max_workers, max_retries=retry))
+
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prom-query")
+
+    @classmethod
+    def from_config(cls, config: dict) -> "Client":
+        """Create a client from the `prometheus` section of the pipeline config."""
+        cache = None
+        if cache_config := config.get("cache"):
+            cache = RangeCache(
+                cache_config["path"],
+                max_bytes=parse_size(cache_config.get("max_size", DEFAULT_MAX_BYTES)),
+                settle_seconds=parse_duration(cache_config.get("settle", DEFAULT_SETTLE_SECONDS)),
             )
-            metric_df.index = metric_df.index.astype("int64")
-            metric_df.rename(columns={"value": key}, inplace=True)
-            results.append(metric_df)
-
-        # Merge all DataFrames on timestamp column
-        logger.debug("results: %d", len(results))
-        merged_df = fn.reduce(
-            lambda left, right: pd.merge(left, right, on=list(common_columns), how="inner"),
-            results,
+
+        return cls(
+            config["url"],
+            max_workers=config.get("max_workers", DEFAULT_MAX_WORKERS),
+            max_points=config.get("max_points", MAX_POINTS_PER_QUERY),
+            cache=cache,
         )
-        # Optionally, sort the final DataFrame by timestamp if needed
-        merged_df.sort_index(inplace=True)
-        return merged_df
 
-    def range_query(self, start: datetime, end: datetime, step, **queries):
-        common_columns = set(["timestamp"])
+    def close(self):
+        self.executor.shutdown(wait=True)
+        self.prom.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _fetch_chunk(self, chunk: Chunk, step: float) -> np.ndarray:
+        logger.debug(
+            f"Running query {chunk.key}: '{chunk.promql}' with step {step} between {chunk.start} and {chunk.end}"
+        )
+
+        # query the API directly so that the response body is decoded straight
+        # into numpy instead of going through the parsed JSON
+        response = self.session.get(
+            f"{self.url}/api/v1/query_range",
+            params={"query": chunk.promql, "start": repr(chunk.start), "end": repr(chunk.end), "step": repr(step)},
+        )
+        if response.status_code != 200:
+            raise PrometheusApiClientException(
+                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
+            )
+
+        series = decode_matrix(response.text)
+        if len(series) > 1:
+            raise ValueError(f"Expected single time-series but got {len(series)} for query: {chunk.promql}")
+
+        return series[0] if series else np.empty((0, 2), dtype=np.float64)
+
+    def _chunks(self, key: str, promql: str, start: float, end: float, step: float) -> Iterator[Chunk]:
+        span = self.max_points * step
+        chunk_start = start
+        while chunk_start <= end:
+            # the last sample of a chunk sits one step before the next chunk
+            yield Chunk(key, promql, chunk_start, min(chunk_start + span - step, end))
+            chunk_start += span
+
+    def _stream(self, chunks: list[Chunk], step: float) -> Iterator[tuple[Chunk, np.ndarray]]:
+        # keep at most max_workers chunks in flight so that only a bounded
+        # number of responses is held in memory at any time
+        pending = collections.deque()
+        for chunk in chunks:
+            if len(pending) >= self.max_workers:
+                done = pending.popleft()
+                yield done[0], done[1].result()
+            pending.append((chunk, self.executor.submit(self._fetch_chunk, chunk, step)))
+
+        while pending:
+            done = pending.popleft()
+            yield done[0], done[1].result()
+
+    def _run_all(self, start: datetime, end: datetime, step, queries: dict[str, str]) -> pd.DataFrame:
+        step = parse_duration(step)
+        start_ts = float(round(start.timestamp()))
+        end_ts = float(round(end.timestamp()))
+        if end_ts < start_ts:
+            raise ValueError(f"End of range {end} is before its start {start}")
 
-        # Iterate over each query provided in kwargs
-        results = []
+        size = int((end_ts - start_ts) // step) + 1
+
+        keys = list(queries)
+        column = {key: i for i, key in enumerate(keys)}
+        grid = Grid(keys, start_ts, step, size)
+        cache = self.cache
+
+        entries = {}
+        chunks = []
         for key, promql in queries.items():
-            logger.debug(f"Running query {key}: '{promql}' with step {step} between {start} and {end}")
+            missing = [Interval(start_ts, end_ts)]
+            if cache is not None:
+                cache_key = cache.key(self.url, promql, step, start_ts)
+                entry = cache.load(cache_key, start_ts, end_ts, step)
+                grid.write(column[key], entry.timestamps, entry.values)
+                missing = entry.missing(start_ts, end_ts, step)
+                if missing:
+                    entries[key] = (cache_key, entry)
+                else:
+                    logger.debug(f"{key}: served from cache")
+
+            chunks.extend(c for iv in missing for c in self._chunks(key, promql, iv.start, iv.end, step))
+
+        logger.debug(f"{len(queries)} queries split into {len(chunks)} chunks")
+
+        for chunk, samples in self._stream(chunks, step):
+            if len(samples):
+                grid.write(column[chunk.key], samples[:, 0], samples[:, 1])
 
-            data = self.prom.custom_query_range(query=promql, start_time=start, end_time=end, step=step)
-            if not data or len(data[0]["values"]) == 0:
+        if cache is not None:
+            self._update_cache(cache, queries, grid, column, entries, start_ts, end_ts, step)
+
+        for key, promql in queries.items():
+            if not grid.has_data(column[key]):
                 raise ValueError(f"No data found for query: {promql}")
 
-            if len(data) != 1:
-                raise ValueError(f"Expected single time-series but got {len(data)} for query: {promql}")
+        # columns follow the order of the queries regardless of the order in
+        # which the chunks complete, rows missing a sample in any column are
+        # dropped
+        return grid.to_frame()
+
+    @staticmethod
+    def _update_cache(cache: RangeCache, queries, grid, column, entries, start: float, end: float, step: float):
+        settled = time.time() - cache.settle_seconds
+        if settled < start:
+            return
 
-            # common_columns = common_columns.union(set(promql.cols))
-            metric_df = MetricRangeDataFrame(
-                data=data,
-                ts_as_datetime=False,
+        # only the part of the window that can no longer change is cached
+        until = start + ((min(end, settled) - start) // step) * step
+        stored = []
+        for key, (cache_key, entry) in entries.items():
+            timestamps, values = grid.samples(column[key], until)
+            entry.splice(start, until, step, timestamps, values)
+            stored += cache.store(cache_key, queries[key], entry, start, until, step)
+        cache.evict(keep=stored)
+
+    def _fetch_instant(self, promql: str, ts: float) -> list[dict]:
+        logger.debug(f"Running instant query '{promql}' at {ts}")
+        response = self.session.post(f"{self.url}/api/v1/query", data={"query": promql, "time": repr(ts)})
+        if response.status_code != 200:
+            raise PrometheusApiClientException(
+                "HTTP Status Code {} ({!r})".format(response.status_code, response.content)
             )
-            metric_df.index = metric_df.index.astype("int64")
-            metric_df.rename(columns={"value": key}, inplace=True)
-            results.append(metric_df)
 
-        # Merge all DataFrames on timestamp column
-        logger.info(f"{' | '.join([*queries])}: { [df.shape for df in results ]}")
+        data = response.json()["data"]
+        if data["resultType"] != "vector":
+            raise ValueError(f"Expected an instant vector but got {data['resultType']} for query: {promql}")
+        return data["result"]
 
-        merged_df = fn.reduce(
-            lambda left, right: pd.merge(left, right, on=list(common_columns), how="inner"),
-            results,
-        )
-        # Optionally, sort the final DataFrame by timestamp if needed
-        merged_df.sort_index(inplace=True)
-        return merged_df
+    def _instant_values(self, queries: dict[str, str], ts: float) -> dict[str, list[float]]:
+        try:
+            result = self._fetch_instant(combine_queries(queries), ts)
+        except (PrometheusApiClientException, ValueError) as e:
+            # e.g. one of the queries is a scalar that label_replace refuses
+            logger.debug(f"combined instant query failed, running them separately: {e}")
+            results = self.executor.map(lambda promql: self._fetch_instant(promql, ts), queries.values())
+            return {key: [float(r["value"][1]) for r in result] for key, result in zip(queries, results)}
+
+        values: dict[str, list[float]] = {key: [] for key in queries}
+        for series in result:
+            values[series["metric"][QUERY_LABEL]].append(float(series["value"][1]))
+        return values
+
+    def instant_query(self, at: datetime, **queries):
+        """
+        Evaluates all queries at a single instant with one request to the
+        instant query endpoint and returns them as a frame of a single row.
+        """
+        ts = float(round(at.timestamp()))
+        values = self._instant_values(queries, ts)
+
+        row = []
+        for key, promql in queries.items():
+            if not values[key]:
+                raise ValueError(f"No data found for query: {promql}")
+            if len(values[key]) > 1:
+                raise ValueError(f"Expected single time-series but got {len(values[key])} for query: {promql}")
+            row.append(values[key][0])
+
+        df = pd.DataFrame([row], columns=list(queries), index=pd.Index([int(ts)], name="timestamp"))
+        logger.debug("results: %d", len(df))
+        return df
+
+    def range_query(self, start: datetime, end: datetime, step, **queries):
+        df = self._run_all(start, end, step, queries)
+        logger.info(f"{' | '.join([*queries])}: {df.shape}")
+        return df
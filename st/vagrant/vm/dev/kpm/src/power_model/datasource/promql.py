@@ -0,0 +1,288 @@
+"""
+The subset of PromQL used by the pipelines, evaluated in process on
+scraped samples:
+
+    sum( rate( name{label="value", ...}[12s] ) ) * 1000
+
+i.e. selectors with =, !=, =~ and !~ matchers, rate / irate / increase /
+delta over a range, sum / avg / min / max / count (optionally by labels)
+and arithmetic with a number.
+"""
+
+import operator
+import re
+from typing import NamedTuple, Protocol
+
+import numpy as np
+
+from power_model.datasource.prometheus import parse_duration
+
+Labels = tuple[tuple[str, str], ...]
+Vector = dict[Labels, float]
+
+TOKEN_RE = re.compile(
+    r"""
+    \s*(?:
+        (?P<number>\d+(?:\.\d+)?(?:[eE][+-]?\d+)?)(?![a-zA-Z_])
+      | (?P<duration>\[[^\]]+\])
+      | (?P<string>"(?:[^"\\]|\\.)*")
+      | (?P<ident>[a-zA-Z_:][a-zA-Z0-9_:]*)
+      | (?P<op>=~|!~|!=|==|=|[-+*/(){},])
+    )""",
+    re.VERBOSE,
+)
+
+FUNCTIONS = {"rate", "irate", "increase", "delta"}
+AGGREGATIONS = {"sum", "avg", "min", "max", "count"}
+
+
+def _divide(left: float, right: float) -> float:
+    # like prometheus, dividing by zero gives +-Inf or NaN instead of failing
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return float(np.float64(left) / right)
+
+
+OPERATORS = {"*": operator.mul, "/": _divide, "+": operator.add, "-": operator.sub}
+
+
+class Matcher(NamedTuple):
+    label: str
+    op: str
+    value: str
+
+    def matches(self, labels: dict[str, str]) -> bool:
+        actual = labels.get(self.label, "")
+        if self.op == "=":
+            return actual == self.value
+        if self.op == "!=":
+            return actual != self.value
+        found = re.fullmatch(self.value, actual) is not None
+        return found if self.op == "=~" else not found
+
+
+class Store(Protocol):
+    def series(self, name: str) -> dict[Labels, tuple[np.ndarray, np.ndarray]]:
+        """Returns the (timestamps, values) of every series of the metric in time order."""
+        ...
+
+
+class Selector(NamedTuple):
+    name: str
+    matchers: list[Matcher]
+
+    def select(self, store: Store, at: float, window: float) -> dict[Labels, tuple[np.ndarray, np.ndarray]]:
+        selected = {}
+        for labels, (ts, values) in store.series(self.name).items():
+            if not all(m.matches(dict(labels)) for m in self.matchers):
+                continue
+            keep = (ts > at - window) & (ts <= at)
+            selected[labels] = (ts[keep], values[keep])
+        return selected
+
+    def evaluate(self, store: Store, at: float, lookback: float) -> Vector:
+        # like prometheus, an instant selector returns the latest sample within the lookback
+        selected = self.select(store, at, lookback)
+        return {labels: float(values[-1]) for labels, (ts, values) in selected.items() if len(ts)}
+
+
+def _increase(ts: np.ndarray, values: np.ndarray) -> float:
+    # a drop of a counter is a reset, the new value is the increase since the reset
+    diffs = np.diff(values)
+    return float(np.where(diffs < 0, values[1:], diffs).sum())
+
+
+class Function(NamedTuple):
+    name: str
+    selector: Selector
+    window: float
+
+    def evaluate(self, store: Store, at: float, lookback: float) -> Vector:
+        result = {}
+        for labels, (ts, values) in self.selector.select(store, at, self.window).items():
+            if len(ts) < 2:
+                continue
+            if self.name == "irate":
+                ts, values = ts[-2:], values[-2:]
+            # unlike prometheus there is no extrapolation to the edges of the
+            # window, the samples are scraped at a known fixed interval
+            change = float(values[-1] - values[0]) if self.name == "delta" else _increase(ts, values)
+            result[labels] = change if self.name in ("increase", "delta") else change / (ts[-1] - ts[0])
+        return result
+
+
+class Aggregation(NamedTuple):
+    name: str
+    by: list[str]
+    expr: "Expr"
+
+    def evaluate(self, store: Store, at: float, lookback: float) -> Vector:
+        groups: dict[Labels, list[float]] = {}
+        for labels, value in self.expr.evaluate(store, at, lookback).items():
+            key = tuple((k, v) for k, v in labels if k in self.by)
+            groups.setdefault(key, []).append(value)
+
+        reduce = {"sum": sum, "avg": lambda v: sum(v) / len(v), "min": min, "max": max, "count": len}[self.name]
+        return {key: float(reduce(values)) for key, values in groups.items()}
+
+
+class Arithmetic(NamedTuple):
+    op: str
+    left: "Expr | float"
+    right: "Expr | float"
+
+    def evaluate(self, store: Store, at: float, lookback: float) -> Vector:
+        fn = OPERATORS[self.op]
+        if isinstance(self.left, float):
+            return {k: fn(self.left, v) for k, v in self.right.evaluate(store, at, lookback).items()}
+        if isinstance(self.right, float):
+            return {k: fn(v, self.right) for k, v in self.left.evaluate(store, at, lookback).items()}
+
+        right = self.right.evaluate(store, at, lookback)
+        return {k: fn(v, right[k]) for k, v in self.left.evaluate(store, at, lookback).items() if k in right}
+
+
+Expr = Selector | Function | Aggregation | Arithmetic
+
+
+def _binary(op: str, left, right):
+    if isinstance(left, float) and isinstance(right, float):
+        return OPERATORS[op](left, right)
+    return Arithmetic(op, left, right)
+
+
+class Parser:
+    def __init__(self, query: str):
+        self.query = query
+        self.tokens = []
+        pos = 0
+        query = query.rstrip()
+        while pos < len(query):
+            m = TOKEN_RE.match(query, pos)
+            if m is None:
+                raise ValueError(f"Unsupported PromQL at {pos}: {query}")
+            self.tokens.append((m.lastgroup, m.group(m.lastgroup)))
+            pos = m.end()
+        self.pos = 0
+
+    def peek(self) -> tuple[str, str] | None:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def next(self, kind: str | None = None, value: str | None = None) -> str:
+        token = self.peek()
+        if token is None or (kind and token[0] != kind) or (value and token[1] != value):
+            raise ValueError(f"Unsupported PromQL, expected {value or kind} but got {token}: {self.query}")
+        self.pos += 1
+        return token[1]
+
+    def parse(self) -> Expr:
+        expr = self.sum_expr()
+        if self.peek() is not None:
+            raise ValueError(f"Unsupported PromQL, unexpected {self.peek()}: {self.query}")
+        if isinstance(expr, float):
+            raise ValueError(f"Scalar expressions are not supported: {self.query}")
+        return expr
+
+    def sum_expr(self):
+        left = self.product()
+        while (token := self.peek()) and token[1] in ("+", "-"):
+            self.pos += 1
+            left = _binary(token[1], left, self.product())
+        return left
+
+    def product(self):
+        left = self.operand()
+        while (token := self.peek()) and token[1] in ("*", "/"):
+            self.pos += 1
+            left = _binary(token[1], left, self.operand())
+        return left
+
+    def operand(self):
+        kind, value = self.peek() or (None, None)
+        if kind == "number":
+            self.pos += 1
+            return float(value)
+        if value == "(":
+            self.pos += 1
+            expr = self.sum_expr()
+            self.next(value=")")
+            return expr
+        if kind != "ident":
+            raise ValueError(f"Unsupported PromQL, unexpected {value}: {self.query}")
+
+        if value in AGGREGATIONS:
+            self.pos += 1
+            by = self.grouping()
+            self.next(value="(")
+            expr = self.sum_expr()
+            self.next(value=")")
+            # the grouping may also follow the aggregated expression
+            by = by or self.grouping()
+            return Aggregation(value, by, expr)
+
+        if value in FUNCTIONS:
+            self.pos += 1
+            self.next(value="(")
+            selector = self.selector()
+            window = parse_duration(self.next("duration")[1:-1])
+            self.next(value=")")
+            return Function(value, selector, window)
+
+        return self.selector()
+
+    def grouping(self) -> list[str]:
+        if self.peek() != ("ident", "by"):
+            return []
+        self.pos += 1
+        self.next(value="(")
+        labels = []
+        while self.peek() != ("op", ")"):
+            labels.append(self.next("ident"))
+            if self.peek() == ("op", ","):
+                self.pos += 1
+        self.next(value=")")
+        return labels
+
+    def selector(self) -> Selector:
+        name = self.next("ident")
+        matchers = []
+        if self.peek() == ("op", "{"):
+            self.pos += 1
+            while self.peek() != ("op", "}"):
+                label = self.next("ident")
+                op = self.next("op")
+                if op not in ("=", "!=", "=~", "!~"):
+                    raise ValueError(f"Unsupported matcher {op}: {self.query}")
+                value = self.next("string")[1:-1].encode().decode("unicode_escape")
+                matchers.append(Matcher(label, op, value))
+                if self.peek() == ("op", ","):
+                    self.pos += 1
+            self.next(value="}")
+        return Selector(name, matchers)
+
+
+def parse(query: str) -> Expr:
+    """Parses a query of the supported subset, raising ValueError for anything else."""
+    return Parser(query).parse()
+
+
+def metric_names(expr) -> set[str]:
+    if isinstance(expr, Selector):
+        return {expr.name}
+    if isinstance(expr, Function):
+        return {expr.selector.name}
+    if isinstance(expr, Aggregation):
+        return metric_names(expr.expr)
+    if isinstance(expr, Arithmetic):
+        return set().union(*(metric_names(e) for e in (expr.left, expr.right) if not isinstance(e, float)))
+    return set()
+
+
+def max_window(expr) -> float:
+    """Longest range of the range functions of the expression."""
+    if isinstance(expr, Function):
+        return expr.window
+    if isinstance(expr, Aggregation):
+        return max_window(expr.expr)
+    if isinstance(expr, Arithmetic):
+        return max([max_window(e) for e in (expr.left, expr.right) if not isinstance(e, float)], default=0.0)
+    return 0.0
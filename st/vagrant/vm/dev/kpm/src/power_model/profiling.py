@@ -0,0 +1,142 @@
+"""
+Opt-in profiling of a single command, enabled by `power-model --profile`.
+
+The stages timed with telemetry.Stages are aggregated into a report of the
+wall time, CPU time and peak memory of each stage. The whole command can
+additionally run under cProfile and tracemalloc. Stages that ran in worker
+processes are reported separately under "jobs", summed over the jobs, and
+are neither part of the cProfile capture nor traced by tracemalloc.
+"""
+
+import cProfile
+import json
+import logging
+import os
+import pathlib
+import sys
+import time
+import tracemalloc
+from datetime import UTC, datetime
+
+from power_model.telemetry import Stages
+
+logger = logging.getLogger(__name__)
+
+CAPTURES = ["cprofile", "tracemalloc"]
+
+# allocations listed in the report when tracing memory
+TOP_ALLOCATIONS = 25
+
+current: "Profiler | None" = None
+
+
+class StageReport:
+    def __init__(self):
+        self.calls = 0
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_bytes: int | None = None
+
+    def add(self, stages: Stages, name: str):
+        self.calls += stages.calls.get(name, 1)
+        self.wall_seconds += stages.seconds[name]
+        self.cpu_seconds += stages.cpu_seconds.get(name, 0.0)
+        if name in stages.peak_bytes:
+            self.peak_bytes = max(self.peak_bytes or 0, stages.peak_bytes[name])
+
+    def to_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_bytes": self.peak_bytes,
+        }
+
+
+class Profiler:
+    """
+    Collects the stages of the command and writes profile.json, plus
+    profile.pstats when capturing with cProfile, into `path` on stop.
+    """
+
+    def __init__(self, path: str | os.PathLike, captures: list[str] | None = None):
+        self.path = pathlib.Path(path)
+        self.captures = list(captures or [])
+        unknown = set(self.captures) - set(CAPTURES)
+        if unknown:
+            raise ValueError(f"unknown profile captures {sorted(unknown)}, expected any of {CAPTURES}")
+
+        self.stages: dict[str, StageReport] = {}
+        self.jobs: dict[str, StageReport] = {}
+        self.profile: cProfile.Profile | None = None
+
+    def start(self):
+        self.started = datetime.now(UTC)
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        if "tracemalloc" in self.captures:
+            tracemalloc.start()
+        if "cprofile" in self.captures:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+    def record(self, stages: Stages, jobs: bool = False):
+        """Adds the stages timed in this process, or in a worker process with `jobs`."""
+        reports = self.jobs if jobs else self.stages
+        for name in stages.seconds:
+            reports.setdefault(name, StageReport()).add(stages, name)
+
+    def stop(self) -> pathlib.Path:
+        if self.profile is not None:
+            self.profile.disable()
+
+        report = {
+            "command": sys.argv,
+            "started": self.started.isoformat(),
+            "wall_seconds": time.perf_counter() - self.wall,
+            "cpu_seconds": time.process_time() - self.cpu,
+            "captures": self.captures,
+            "stages": {name: r.to_dict() for name, r in self.stages.items()},
+            "jobs": {name: r.to_dict() for name, r in self.jobs.items()},
+        }
+
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            report["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+            report["top_allocations"] = [
+                {"location": str(stat.traceback), "bytes": stat.size, "count": stat.count}
+                for stat in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]
+            ]
+            tracemalloc.stop()
+
+        os.makedirs(self.path, exist_ok=True)
+        if self.profile is not None:
+            self.profile.dump_stats(self.path / "profile.pstats")
+
+        report_path = self.path / "profile.json"
+        with open(report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"wrote profile to {report_path}")
+        return report_path
+
+
+def start(path: str | os.PathLike, captures: list[str] | None = None) -> Profiler:
+    global current
+    current = Profiler(path, captures)
+    current.start()
+    return current
+
+
+def stop() -> pathlib.Path | None:
+    global current
+    if current is None:
+        return None
+
+    profiler, current = current, None
+    return profiler.stop()
+
+
+def record(stages: Stages):
+    """Adds the stages to the report when profiling, does nothing otherwise."""
+    if current is not None:
+        current.record(stages)
@@ -0,0 +1,267 @@
+"""
+Prometheus instrumentation of the estimator, the prediction loop and
+training.
+
+Nothing is recorded until `serve` is called, until then `current` holds
+no-op instruments so that the hot paths only pay for a method call.
+Training stages run in worker processes, which time them with Stages and
+hand the durations back to be observed in the main process.
+"""
+
+import logging
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+# estimator requests take tens of microseconds up to a few milliseconds
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+PREDICT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# mapping an artifact takes well under a millisecond, unpickling from joblib
+# up to seconds
+LOAD_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+STAGE_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+ERROR_CAUSES = ["framing", "decode", "inference", "connection"]
+TRAIN_STAGES = ["fetch", "merge", "fit", "evaluate", "persist"]
+
+
+class _Noop:
+    """Stands in for every instrument while metrics are disabled."""
+
+    def labels(self, *args, **kwargs):
+        return self
+
+    def observe(self, value: float):
+        pass
+
+    def inc(self, value: float = 1):
+        pass
+
+    def dec(self, value: float = 1):
+        pass
+
+    def set(self, value: float):
+        pass
+
+
+NOOP = _Noop()
+
+
+class Metrics:
+    def __init__(self, registry: CollectorRegistry | None = None):
+        self.enabled = registry is not None
+        if not self.enabled:
+            for name in [
+                "decode_seconds",
+                "inference_seconds",
+                "encode_seconds",
+                "in_flight",
+                "queued",
+                "batch_rows",
+                "errors",
+                "reloads",
+                "model_loads",
+                "model_load_seconds",
+                "model_evictions",
+                "cache_hits",
+                "cache_misses",
+                "cache_evictions",
+                "predict_seconds",
+                "predict_overruns",
+                "predict_failures",
+                "train_stage_seconds",
+            ]:
+                setattr(self, name, NOOP)
+            return
+
+        # estimator-proxy
+        self.decode_seconds = Histogram(
+            "power_model_estimator_decode_seconds",
+            "Time to decode a request into a feature matrix.",
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.inference_seconds = Histogram(
+            "power_model_estimator_inference_seconds",
+            "Time from submitting a request for prediction until its result, including batching.",
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.encode_seconds = Histogram(
+            "power_model_estimator_encode_seconds",
+            "Time to encode the response of a request.",
+            buckets=LATENCY_BUCKETS,
+            registry=registry,
+        )
+        self.in_flight = Gauge(
+            "power_model_estimator_requests_in_flight",
+            "Requests being decoded, predicted or encoded.",
+            registry=registry,
+        )
+        self.queued = Gauge(
+            "power_model_estimator_requests_queued",
+            "Requests read from a connection that wait for an in-flight slot.",
+            registry=registry,
+        )
+        self.batch_rows = Gauge(
+            "power_model_estimator_batch_pending_rows",
+            "Rows gathered by the batcher that wait for the batch to be predicted.",
+            registry=registry,
+        )
+        self.errors = Counter(
+            "power_model_estimator_errors_total",
+            "Failed requests and connections by cause.",
+            ["cause"],
+            registry=registry,
+        )
+        for cause in ERROR_CAUSES:
+            self.errors.labels(cause)
+        self.reloads = Counter(
+            "power_model_estimator_reloads_total",
+            "Reloads of the pipeline config and models by result.",
+            ["result"],
+            registry=registry,
+        )
+        for result in ["success", "failure"]:
+            self.reloads.labels(result)
+
+        # model registry, shared by the estimator and power-model run
+        self.model_loads = Counter(
+            "power_model_model_loads_total",
+            "Models loaded into the registry, including reloads of evicted ones.",
+            registry=registry,
+        )
+        self.model_load_seconds = Histogram(
+            "power_model_model_load_seconds",
+            "Time to load a model into the registry.",
+            buckets=LOAD_BUCKETS,
+            registry=registry,
+        )
+        self.model_evictions = Counter(
+            "power_model_model_evictions_total",
+            "Models dropped from the registry to stay within its bounds.",
+            registry=registry,
+        )
+
+        # prediction cache
+        self.cache_hits = Counter(
+            "power_model_prediction_cache_hits_total",
+            "Rows predicted from the prediction cache.",
+            registry=registry,
+        )
+        self.cache_misses = Counter(
+            "power_model_prediction_cache_misses_total",
+            "Rows not in the prediction cache that were predicted by the model.",
+            registry=registry,
+        )
+        self.cache_evictions = Counter(
+            "power_model_prediction_cache_evictions_total",
+            "Entries dropped from the prediction cache to stay within its size.",
+            registry=registry,
+        )
+
+        # power-model run
+        self.predict_seconds = Histogram(
+            "power_model_predict_seconds",
+            "Time to query the datasource and predict every model on a tick.",
+            buckets=PREDICT_BUCKETS,
+            registry=registry,
+        )
+        self.predict_overruns = Counter(
+            "power_model_predict_overruns_total",
+            "Ticks whose prediction was skipped or dropped for missing its deadline.",
+            registry=registry,
+        )
+        self.predict_failures = Counter(
+            "power_model_predict_failures_total",
+            "Ticks whose prediction failed.",
+            registry=registry,
+        )
+
+        # power-model train
+        self.train_stage_seconds = Histogram(
+            "power_model_train_stage_seconds",
+            "Time spent in each stage of training, fit, evaluate and persist are observed per model.",
+            ["stage"],
+            buckets=STAGE_BUCKETS,
+            registry=registry,
+        )
+        for stage in TRAIN_STAGES:
+            self.train_stage_seconds.labels(stage)
+
+    def observe_stages(self, seconds: dict[str, float]):
+        for stage, value in seconds.items():
+            self.train_stage_seconds.labels(stage).observe(value)
+
+
+current = Metrics()
+
+
+def serve(port: int, addr: str = "0.0.0.0") -> Metrics:
+    """
+    Enables the metrics and serves them, together with any other metric of
+    the default registry, on http://addr:port/metrics.
+    """
+    global current
+    if not current.enabled:
+        current = Metrics(REGISTRY)
+        start_http_server(port, addr)
+        logger.info(f"serving metrics on {addr}:{port}")
+    return current
+
+
+# the peak traced by tracemalloc is process wide, so the peak of a stage is
+# only known when no other stage started while it ran, see Stages.stage
+_tracing_lock = threading.Lock()
+_tracing_active = 0
+_tracing_starts = 0
+
+
+class Stages:
+    """
+    Accumulates the wall and CPU time of named stages, cheap to pickle so
+    that it can be returned from worker processes. While tracemalloc is
+    tracing, the peak of the memory allocated during each stage over what
+    was allocated at its start is kept as well, except for stages that
+    overlapped another one, e.g. on the threads of a pool.
+    """
+
+    def __init__(self):
+        self.seconds: dict[str, float] = {}
+        self.cpu_seconds: dict[str, float] = {}
+        self.peak_bytes: dict[str, int] = {}
+        self.calls: dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        global _tracing_active, _tracing_starts
+
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            with _tracing_lock:
+                alone = _tracing_active == 0
+                _tracing_active += 1
+                _tracing_starts += 1
+                started = _tracing_starts
+                if alone:
+                    tracemalloc.reset_peak()
+            allocated = tracemalloc.get_traced_memory()[0]
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            self.seconds[name] = self.seconds.get(name, 0.0) + time.perf_counter() - start
+            self.cpu_seconds[name] = self.cpu_seconds.get(name, 0.0) + time.process_time() - cpu
+            self.calls[name] = self.calls.get(name, 0) + 1
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1] - allocated
+                with _tracing_lock:
+                    _tracing_active -= 1
+                    overlapped = not alone or _tracing_starts != started
+                if not overlapped:
+                    self.peak_bytes[name] = max(self.peak_bytes.get(name, 0), peak)
@@ -2,7 +2,25 @@
 #
 # SPDX-License-Identifier: MIT
 
+import importlib
+
 from .loader import load_pipeline
-from .runner import Predictor, train
 
-__all__ = ["load_pipeline", "train", "Predictor"]
+__all__ = ["load_pipeline", "train", "retrain", "tune", "Predictor"]
+
+# the training modules import sklearn and xgboost, which take seconds to
+# import; they are only imported on first use so that the estimator, which
+# only needs the Predictor, starts quickly
+_LAZY = {
+    "train": "runner",
+    "retrain": "incremental",
+    "tune": "tuner",
+    "Predictor": "predictor",
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(importlib.import_module(f"{__name__}.{_LAZY[name]}"), name)
@@ -0,0 +1,127 @@
+"""
+Compiled models stored as a small JSON header followed by their raw arrays,
+so that loading a model memory maps the file instead of unpickling sklearn
+and xgboost objects. The pages of the arrays are shared by every process
+that maps the same file.
+
+Layout of a `{name}_model.pm` file:
+  - MAGIC (8 bytes)
+  - length of the header as little endian uint64
+  - JSON header: kind, features, scalars and dtype, shape and offset of each array
+  - the arrays, each aligned to ALIGNMENT bytes from the start of the file
+"""
+
+import json
+import logging
+import os
+import pathlib
+import struct
+
+import numpy as np
+
+from power_model.trainer.compiled import Fallback, Linear, Polynomial, Trees, compile_pipeline
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"PMMODEL1"
+ALIGNMENT = 64
+SUFFIX = "_model.pm"
+
+# kind -> (class, array fields, scalar fields)
+KINDS = {
+    "linear": (Linear, ["coef", "intercept"], []),
+    "polynomial": (Polynomial, ["mean", "scale", "terms", "coef", "intercept"], []),
+    "trees": (
+        Trees,
+        ["mean", "scale", "roots", "feature", "threshold", "children", "default_left", "value", "splits"],
+        ["base_score", "depth"],
+    ),
+}
+
+
+def artifact_path(model_path, name: str) -> pathlib.Path:
+    return pathlib.Path(model_path) / f"{name}{SUFFIX}"
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save(model, path):
+    """Writes a compiled model, replacing any previous file atomically."""
+    kind = next((k for k, (cls, _, _) in KINDS.items() if type(model) is cls), None)
+    if kind is None:
+        raise ValueError(f"{type(model).__name__} models can not be exported")
+
+    _, array_fields, scalar_fields = KINDS[kind]
+    # optional arrays that are None are left out
+    arrays = {f: np.ascontiguousarray(getattr(model, f)) for f in array_fields if getattr(model, f) is not None}
+    header = {
+        "kind": kind,
+        "features": list(model.features),
+        "scalars": {f: getattr(model, f) for f in scalar_fields},
+        "arrays": {},
+    }
+
+    # the offsets depend on the length of the header, which depends on the
+    # offsets; reserve room for them by sizing the header with dummy offsets
+    # of the largest possible width
+    for f, arr in arrays.items():
+        header["arrays"][f] = {"dtype": arr.dtype.str, "shape": list(arr.shape), "offset": 2**63 - 1}
+    data_start = _align(len(MAGIC) + 8 + len(json.dumps(header).encode()))
+
+    offset = data_start
+    for f, arr in arrays.items():
+        header["arrays"][f]["offset"] = offset
+        offset = _align(offset + arr.nbytes)
+
+    encoded = json.dumps(header).encode()
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<Q", len(encoded)))
+        f.write(encoded)
+        for name, arr in arrays.items():
+            f.write(b"\0" * (header["arrays"][name]["offset"] - f.tell()))
+            f.write(arr.tobytes())
+    os.replace(tmp, path)
+
+
+def load(path):
+    """Maps a compiled model read only, its arrays are views of the file."""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a model artifact")
+        (length,) = struct.unpack("<Q", f.read(8))
+        header = json.loads(f.read(length))
+
+    cls, array_fields, _ = KINDS[header["kind"]]
+    mm = np.memmap(path, dtype=np.uint8, mode="r")
+
+    arrays = {}
+    for name in array_fields:
+        spec = header["arrays"].get(name)
+        if spec is None:
+            continue
+        dtype = np.dtype(spec["dtype"])
+        shape = tuple(spec["shape"])
+        count = int(np.prod(shape, dtype=np.int64))
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=count, offset=spec["offset"]).reshape(shape)
+
+    return cls(header["features"], **arrays, **header["scalars"])
+
+
+def export(pipeline, model_path, name: str):
+    """
+    Compiles a trained pipeline and writes it next to its joblib file.
+    Pipelines that can not be compiled have no artifact, any stale one is
+    removed so that they are loaded from joblib.
+    """
+    path = artifact_path(model_path, name)
+    model = compile_pipeline(pipeline)
+    if isinstance(model, Fallback):
+        logger.info(f"{name} can not be compiled, it is loaded through joblib")
+        path.unlink(missing_ok=True)
+        return
+
+    save(model, path)
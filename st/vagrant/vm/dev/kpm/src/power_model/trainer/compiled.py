@@ -0,0 +1,265 @@
+import json
+import logging
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# objectives whose prediction is the raw sum of the leaves and the base score
+IDENTITY_OBJECTIVES = {"reg:squarederror", "reg:squaredlogerror", "reg:absoluteerror", "reg:pseudohubererror"}
+
+
+def primary(y) -> np.ndarray:
+    """
+    The predictions of the primary target. Models trained on several targets
+    predict one column per target, the primary one first.
+    """
+    y = np.asarray(y)
+    return y[:, 0] if y.ndim == 2 else y
+
+
+class Linear:
+    """
+    StandardScaler + LinearRegression folded into a single coefficient vector,
+    or one row of coefficients per target.
+    """
+
+    def __init__(self, features: list[str], coef: np.ndarray, intercept):
+        self.features = features
+        self.coef = coef
+        self.intercept = intercept
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return X @ self.coef.T + self.intercept
+
+
+def polynomial_terms(powers: np.ndarray) -> np.ndarray:
+    """
+    Converts the exponents of PolynomialFeatures into the columns multiplied
+    for each term, where column 0 is a column of ones and column j + 1 is
+    input j, e.g. x0 * x1^2 -> [1, 2, 2].
+    """
+    degree = max(int(powers.sum(axis=1).max()), 1)
+    terms = np.zeros((len(powers), degree), dtype=np.intp)
+    for t, exponents in enumerate(powers):
+        cols = [j + 1 for j, e in enumerate(exponents) for _ in range(e)]
+        terms[t, : len(cols)] = cols
+    return terms
+
+
+class Polynomial:
+    """StandardScaler + PolynomialFeatures + LinearRegression evaluated with numpy."""
+
+    def __init__(self, features: list[str], mean, scale, terms: np.ndarray, coef: np.ndarray, intercept):
+        self.features = features
+        self.mean = mean
+        self.scale = scale
+        self.terms = terms
+        self.coef = coef
+        self.intercept = intercept
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        Z = np.empty((len(X), X.shape[1] + 1))
+        Z[:, 0] = 1
+        Z[:, 1:] = (X - self.mean) / self.scale
+
+        P = Z[:, self.terms[:, 0]]
+        for k in range(1, self.terms.shape[1]):
+            P = P * Z[:, self.terms[:, k]]
+        return P @ self.coef.T + self.intercept
+
+
+class Trees:
+    """
+    XGBoost regressor flattened into node arrays of all trees, evaluated for
+    all rows and trees at once by walking one level per step.
+
+    Leaves point to themselves so that walking `depth` steps always ends on a
+    leaf regardless of the depth of each tree. The children of node i are
+    stored at children[2 * i] (right) and children[2 * i + 1] (left).
+
+    Models of several targets have their trees ordered by target, `splits`
+    holds the first tree of each target and `base_score` one score per
+    target, and predict one column per target.
+    """
+
+    def __init__(
+        self,
+        features: list[str],
+        mean,
+        scale,
+        roots: np.ndarray,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        children: np.ndarray,
+        default_left: np.ndarray,
+        value: np.ndarray,
+        base_score: float | list[float],
+        depth: int,
+        splits: np.ndarray | None = None,
+    ):
+        self.features = features
+        self.mean = mean
+        self.scale = scale
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.default_left = default_left
+        self.value = value
+        self.base_score = base_score
+        self.depth = depth
+        self.splits = splits
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        # xgboost evaluates the splits on float32 inputs
+        Z = ((X - self.mean) / self.scale).astype(np.float32)
+        n, n_features = Z.shape
+        flat = Z.ravel()
+        offset = (np.arange(n, dtype=np.intp) * n_features)[:, None]
+
+        # one row of nodes per input row, one column per tree
+        node = np.repeat(self.roots[None, :], n, axis=0)
+        for _ in range(self.depth):
+            x = np.take(flat, offset + np.take(self.feature, node))
+            go_left = x < np.take(self.threshold, node)
+            missing = np.isnan(x)
+            if missing.any():
+                go_left = np.where(missing, np.take(self.default_left, node), go_left)
+            node = np.take(self.children, 2 * node + go_left)
+
+        leaves = np.take(self.value, node)
+        if self.splits is None:
+            return (leaves.sum(axis=1, dtype=np.float64) + self.base_score).astype(np.float32)
+        y = np.add.reduceat(leaves, self.splits, axis=1, dtype=np.float64)
+        return (y + self.base_score).astype(np.float32)
+
+
+class Fallback:
+    """Any other pipeline, predicted through sklearn."""
+
+    def __init__(self, features: list[str], pipeline):
+        self.features = features
+        self.pipeline = pipeline
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.pipeline.predict(pd.DataFrame(X, columns=self.features))
+
+
+def _scaler(steps) -> tuple[np.ndarray | float, np.ndarray | float]:
+    from sklearn.preprocessing import StandardScaler
+
+    scaler = steps[0] if steps and isinstance(steps[0], StandardScaler) else None
+    if scaler is None:
+        return 0.0, 1.0
+
+    mean = scaler.mean_ if scaler.mean_ is not None else 0.0
+    scale = scaler.scale_ if scaler.scale_ is not None else 1.0
+    return mean, scale
+
+
+def _trees(features: list[str], mean, scale, model) -> Trees | None:
+    booster = model.get_booster()
+    if booster.attr("best_iteration") is not None:
+        return None
+
+    learner = json.loads(booster.save_raw("json"))["learner"]
+    gbm = learner["gradient_booster"]
+    if gbm["name"] != "gbtree" or learner["objective"]["name"] not in IDENTITY_OBJECTIVES:
+        return None
+    trees = gbm["model"]["trees"]
+    # trees with a vector of values per leaf (multi_strategy="multi_output_tree")
+    if any(int(tree["tree_param"].get("size_leaf_vector", "1")) > 1 for tree in trees):
+        return None
+
+    # group the trees of each target, boosting interleaves them
+    outputs = int(learner["learner_model_param"].get("num_target", "1"))
+    target = gbm["model"]["tree_info"]
+    trees = [trees[t] for t in sorted(range(len(trees)), key=lambda t: target[t])]
+
+    roots, feature, threshold, children, default_left, value = [], [], [], [], [], []
+    depth = 0
+    offset = 0
+    for tree in trees:
+        n = int(tree["tree_param"]["num_nodes"])
+        lc = np.asarray(tree["left_children"], dtype=np.int32)
+        rc = np.asarray(tree["right_children"], dtype=np.int32)
+        leaf = lc == -1
+        own = np.arange(n)
+
+        roots.append(offset)
+        feature.append(np.where(leaf, 0, tree["split_indices"]))
+        threshold.append(np.asarray(tree["split_conditions"], dtype=np.float32))
+        children.append(np.column_stack([np.where(leaf, own, rc), np.where(leaf, own, lc)]).ravel() + offset)
+        default_left.append(np.asarray(tree["default_left"], dtype=bool))
+        value.append(np.where(leaf, np.asarray(tree["split_conditions"], dtype=np.float32), 0).astype(np.float32))
+
+        node_depth = np.zeros(n, dtype=np.int32)
+        for i in range(n):
+            if not leaf[i]:
+                node_depth[lc[i]] = node_depth[rc[i]] = node_depth[i] + 1
+        depth = max(depth, int(node_depth.max()))
+        offset += n
+
+    base_score = [float(s) for s in learner["learner_model_param"]["base_score"].strip("[]").split(",")]
+    splits = None
+    if outputs > 1:
+        splits = np.searchsorted(np.sort(target), np.arange(outputs)).astype(np.intp)
+    return Trees(
+        features,
+        mean,
+        scale,
+        np.asarray(roots, dtype=np.intp),
+        np.concatenate(feature).astype(np.intp),
+        np.concatenate(threshold),
+        np.concatenate(children).astype(np.intp),
+        np.concatenate(default_left),
+        np.concatenate(value),
+        base_score[0] if outputs == 1 else base_score,
+        depth,
+        splits,
+    )
+
+
+def compile_pipeline(pipeline):
+    """
+    Returns a pandas free representation of a trained pipeline that predicts
+    from a float array with the columns in the order of the training
+    features. Pipelines that can not be compiled are wrapped in Fallback.
+    """
+    # imported here as loading the compiled models must not pay for
+    # importing sklearn and xgboost
+    from sklearn.linear_model import LinearRegression
+    from sklearn.preprocessing import PolynomialFeatures, StandardScaler
+    from xgboost import XGBRegressor
+
+    features = [str(f) for f in getattr(pipeline, "feature_names_in_", [])]
+    steps = [step for _, step in pipeline.steps]
+    mean, scale = _scaler(steps)
+    body = steps[1:] if steps and isinstance(steps[0], StandardScaler) else steps
+
+    compiled = None
+    if len(body) == 1 and isinstance(body[0], LinearRegression):
+        linear = body[0]
+        coef = linear.coef_ / scale
+        intercept = linear.intercept_ - np.atleast_2d(coef) @ np.broadcast_to(mean, coef.shape[-1:])
+        if coef.ndim == 2:
+            # one intercept per target, also when fit without one
+            intercept = np.broadcast_to(intercept, coef.shape[:1]).copy()
+        else:
+            intercept = intercept.reshape(())
+        compiled = Linear(features, coef, intercept)
+
+    elif len(body) == 2 and isinstance(body[0], PolynomialFeatures) and isinstance(body[1], LinearRegression):
+        poly, linear = body
+        compiled = Polynomial(features, mean, scale, polynomial_terms(poly.powers_), linear.coef_, linear.intercept_)
+
+    elif len(body) == 1 and isinstance(body[0], XGBRegressor):
+        compiled = _trees(features, mean, scale, body[0])
+
+    if compiled is None:
+        logger.debug(f"pipeline {pipeline} can not be compiled, predicting through sklearn")
+        return Fallback(features, pipeline)
+
+    return compiled
@@ -0,0 +1,266 @@
+import csv
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import UTC, datetime, timedelta
+from typing import NamedTuple
+
+import numpy as np
+
+from power_model import profiling
+from power_model.datasource.prometheus import parse_duration
+from power_model.telemetry import Stages
+from power_model.trainer.compiled import primary
+from power_model.trainer.planner import TARGET, QueryPlan
+from power_model.trainer.registry import ModelRegistry
+from power_model.trainer.runner import ErrorMetrics
+
+logger = logging.getLogger(__name__)
+
+# evaluated at once, bounds the memory used regardless of the window
+DEFAULT_CHUNK = "1h"
+
+
+class Accumulator:
+    """
+    Single pass error metrics of one model that can be updated chunk by
+    chunk and merged.
+
+    Every statistic is kept as a running mean (and the spread of the target
+    as a running sum of squared deviations) that is combined with the mean
+    of each chunk weighted by counts, so nothing is summed up over the
+    whole window and no precision is lost on long windows. The MAPE is only
+    taken over the rows with a non-zero target, the rows left out are
+    counted in `zeros`.
+    """
+
+    __slots__ = ("n", "mae", "mse", "y_mean", "y_m2", "ape_n", "mape", "zeros")
+
+    def __init__(self):
+        self.n = 0
+        self.mae = 0.0
+        self.mse = 0.0
+        self.y_mean = 0.0
+        self.y_m2 = 0.0
+        self.ape_n = 0
+        self.mape = 0.0
+        self.zeros = 0
+
+    def update(self, y: np.ndarray, y_pred: np.ndarray):
+        m = len(y)
+        if m == 0:
+            return
+
+        err = y_pred - y
+        batch = Accumulator()
+        batch.n = m
+        batch.mae = float(np.mean(np.abs(err)))
+        batch.mse = float(np.mean(err * err))
+        batch.y_mean = float(np.mean(y))
+        batch.y_m2 = float(np.sum((y - batch.y_mean) ** 2))
+
+        nonzero = y != 0
+        batch.ape_n = int(nonzero.sum())
+        batch.zeros = m - batch.ape_n
+        if batch.ape_n:
+            batch.mape = float(np.mean(np.abs(err[nonzero] / y[nonzero])))
+
+        self.merge(batch)
+
+    def merge(self, other: "Accumulator"):
+        n = self.n + other.n
+        if other.n == 0:
+            return
+
+        w = other.n / n
+        delta = other.y_mean - self.y_mean
+        self.y_m2 += other.y_m2 + delta * delta * self.n * w
+        self.y_mean += delta * w
+        self.mae += (other.mae - self.mae) * w
+        self.mse += (other.mse - self.mse) * w
+        self.n = n
+
+        if other.ape_n:
+            ape_n = self.ape_n + other.ape_n
+            self.mape += (other.mape - self.mape) * other.ape_n / ape_n
+            self.ape_n = ape_n
+        self.zeros += other.zeros
+
+    def result(self) -> ErrorMetrics:
+        # like calculate_metrics, r2 is only reported for more than 5 samples
+        r2 = 0.0
+        if self.n > 5 and self.y_m2 > 0:
+            r2 = 1.0 - self.mse * self.n / self.y_m2
+        mape = self.mape * 100 if self.ape_n else float("nan")
+        return ErrorMetrics(self.mae, self.mse, mape, r2)
+
+
+class Buckets(NamedTuple):
+    """
+    Splits the rows into buckets by time, every `seconds`, or by load, the
+    level of the target between the given edges. Time buckets are keyed by
+    their start, load buckets by the index of their level.
+    """
+
+    seconds: float | None = None
+    levels: list[float] | None = None
+
+    def keys(self, timestamps: np.ndarray, y: np.ndarray) -> np.ndarray:
+        if self.seconds:
+            return (timestamps // self.seconds * self.seconds).astype(np.int64)
+        return np.searchsorted(np.asarray(self.levels, dtype=np.float64), y, side="right")
+
+    def label(self, key: int) -> str:
+        if self.seconds:
+            return datetime.fromtimestamp(key, UTC).isoformat()
+
+        edges = [-np.inf, *self.levels, np.inf]
+        return f"[{edges[key]:g}, {edges[key + 1]:g})"
+
+    def __bool__(self) -> bool:
+        return bool(self.seconds or self.levels)
+
+
+class Evaluation:
+    """Errors of every (pipeline, model) over the window, and per bucket."""
+
+    def __init__(self, buckets: Buckets):
+        self.buckets = buckets
+        self.totals: dict[tuple[str, str], Accumulator] = {}
+        self.by_bucket: dict[tuple[str, str, int], Accumulator] = {}
+        self.rows = 0
+        self.skipped: list[tuple[datetime, datetime]] = []
+
+    def update(self, pipeline: str, model: str, timestamps: np.ndarray, y: np.ndarray, y_pred: np.ndarray):
+        self.totals.setdefault((pipeline, model), Accumulator()).update(y, y_pred)
+        if not self.buckets:
+            return
+
+        keys = self.buckets.keys(timestamps, y)
+        for key in np.unique(keys):
+            rows = keys == key
+            self.by_bucket.setdefault((pipeline, model, int(key)), Accumulator()).update(y[rows], y_pred[rows])
+
+    def merge(self, other: "Evaluation"):
+        for key, acc in other.totals.items():
+            self.totals.setdefault(key, Accumulator()).merge(acc)
+        for key, acc in other.by_bucket.items():
+            self.by_bucket.setdefault(key, Accumulator()).merge(acc)
+
+    def summary(self) -> list[list]:
+        table = []
+        pipeline = None
+        for (name, model), acc in self.totals.items():
+            if pipeline is not None and name != pipeline:
+                table.append([])
+            pipeline = name
+            m = acc.result()
+            table.append([name, model, m.mape, m.mae, m.mse, m.r2, acc.n, acc.zeros])
+        return table
+
+    def bucket_rows(self) -> list[list]:
+        # in the order of the pipelines and models, then of the buckets
+        order = {key: i for i, key in enumerate(self.totals)}
+        rows = []
+        for (name, model, key), acc in sorted(self.by_bucket.items(), key=lambda e: (order[e[0][:2]], e[0][2])):
+            m = acc.result()
+            rows.append([name, model, self.buckets.label(key), m.mape, m.mae, m.mse, m.r2, acc.n, acc.zeros])
+        return rows
+
+    def write_csv(self, path: str):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["pipeline", "model", "bucket", "mape", "mae", "mse", "r2", "samples", "zero_targets"])
+            writer.writerows(self.bucket_rows())
+
+
+def _evaluate_pipeline(
+    plan: QueryPlan, registry: ModelRegistry, models: list[str], pipeline: str, df, buckets: Buckets
+) -> tuple[Evaluation, Stages]:
+    stages = Stages()
+    evaluation = Evaluation(buckets)
+
+    with stages.stage("merge"):
+        X = plan.features(df, pipeline).to_numpy()
+        y = df[TARGET].to_numpy()
+        timestamps = df.index.to_numpy()
+
+    for model_name in models:
+        with stages.stage("load"):
+            model = registry.get(pipeline, model_name)
+        # models of several targets are evaluated on the primary one
+        with stages.stage("predict"):
+            y_pred = primary(model.predict(X))
+        with stages.stage("evaluate"):
+            evaluation.update(pipeline, model_name, timestamps, y, y_pred)
+
+    return evaluation, stages
+
+
+def evaluate_range(
+    source,
+    plan: QueryPlan,
+    registry: ModelRegistry,
+    pipelines: list[str],
+    models: list[str],
+    start: datetime,
+    end: datetime,
+    step,
+    chunk=DEFAULT_CHUNK,
+    buckets: Buckets | None = None,
+    workers: int | None = None,
+) -> Evaluation:
+    """
+    Evaluates the models over the window one chunk at a time, so that only
+    the samples of the chunk being evaluated and of the next one, which is
+    fetched meanwhile, are held in memory. The pipelines of each chunk are
+    evaluated on `workers` threads.
+
+    Chunks without a sample of every query are skipped and listed in
+    Evaluation.skipped.
+    """
+    buckets = buckets or Buckets()
+    step_seconds = parse_duration(step)
+    # chunks are aligned to the step and the last sample of a chunk sits one
+    # step before the next chunk
+    span = max(1, int(parse_duration(chunk) // step_seconds)) * step_seconds
+    windows = []
+    chunk_start = start
+    while chunk_start <= end:
+        windows.append((chunk_start, min(chunk_start + timedelta(seconds=span - step_seconds), end)))
+        chunk_start += timedelta(seconds=span)
+
+    def fetch(window):
+        stages = Stages()
+        with stages.stage("fetch"):
+            try:
+                return plan.range_query(source, start=window[0], end=window[1], step=step), stages
+            except ValueError as e:
+                logger.warning(f"skipping {window[0]} - {window[1]}: {e}")
+                return None, stages
+
+    evaluation = Evaluation(buckets)
+    workers = max(1, min(workers or len(pipelines), len(pipelines)))
+    with (
+        ThreadPoolExecutor(max_workers=1, thread_name_prefix="evaluate-fetch") as fetcher,
+        ThreadPoolExecutor(max_workers=workers, thread_name_prefix="evaluate") as executor,
+    ):
+        pending = fetcher.submit(fetch, windows[0]) if windows else None
+        for i, window in enumerate(windows):
+            df, stages = pending.result()
+            profiling.record(stages)
+            pending = fetcher.submit(fetch, windows[i + 1]) if i + 1 < len(windows) else None
+            if df is None:
+                evaluation.skipped.append(window)
+                continue
+
+            futures = [
+                executor.submit(_evaluate_pipeline, plan, registry, models, pipeline, df, buckets)
+                for pipeline in pipelines
+            ]
+            for future in futures:
+                result, stages = future.result()
+                evaluation.merge(result)
+                profiling.record(stages)
+            evaluation.rows += len(df)
+
+    return evaluation
@@ -0,0 +1,189 @@
+import logging
+import os
+import pathlib
+from datetime import UTC, datetime
+from typing import NamedTuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.pipeline import Pipeline
+from threadpoolctl import threadpool_limits
+from xgboost import XGBRegressor
+
+from power_model.datasource.prometheus import parse_duration
+from power_model.telemetry import Stages
+from power_model.trainer import artifact, parallel, stats
+from power_model.trainer.compiled import primary
+from power_model.trainer.runner import (
+    ErrorMetrics,
+    calculate_metrics,
+    fetch_training_data,
+    pool_size,
+    read_errors,
+    report_stages,
+    save_to_json,
+    target_values,
+    write_errors,
+)
+
+logger = logging.getLogger(__name__)
+
+# boosting rounds added to the xgboost models by each update
+DEFAULT_ROUNDS = 20
+
+
+class Update(NamedTuple):
+    model: str
+    # first row of the shared frame after the watermark of the model
+    row: int
+    columns: list[int]
+    features: list[str]
+    targets: list[int]
+    model_path: str
+    rounds: int
+    threads: int
+
+
+def _continue_boosting(pipeline: Pipeline, X: pd.DataFrame, y: np.ndarray, rounds: int, threads: int):
+    name, model = pipeline.steps[-1]
+    params = {**model.get_params(), "n_estimators": rounds, "n_jobs": threads}
+    Z = pipeline[:-1].transform(X)
+    pipeline.steps[-1] = (name, XGBRegressor(**params).fit(Z, y, xgb_model=model.get_booster()))
+
+
+def update(arr: np.ndarray, job: Update) -> tuple[ErrorMetrics | None, Stages]:
+    """
+    Updates a trained model with the rows of the new window and returns the
+    errors of the model before the update on those rows, i.e. on data it has
+    not seen yet, along with the stage timings of the update.
+    """
+    stages = Stages()
+    model_file = os.path.join(job.model_path, f"{job.model}_model.joblib")
+    pipeline: Pipeline = joblib.load(model_file)
+
+    X = pd.DataFrame(arr[job.row :, job.columns], columns=job.features)
+    y = target_values(arr[job.row :], job.targets)
+
+    with threadpool_limits(limits=job.threads):
+        with stages.stage("evaluate"):
+            metrics = calculate_metrics(primary(y), primary(pipeline.predict(X)))
+
+        if stats.has_stats(pipeline):
+            path = stats.stats_path(job.model_path, job.model)
+            if not path.exists():
+                logger.warning(f"{model_file} has no statistics, run a full train first")
+                return None, stages
+
+            with stages.stage("merge"):
+                merged = stats.Stats.load(path).merge(stats.pipeline_stats(pipeline, X, y))
+            with stages.stage("fit"):
+                stats.apply_stats(pipeline, merged)
+
+        elif isinstance(pipeline.steps[-1][1], XGBRegressor):
+            with stages.stage("fit"):
+                _continue_boosting(pipeline, X, y, job.rounds, job.threads)
+
+        else:
+            logger.warning(f"{model_file} can not be updated incrementally, run a full train instead")
+            return None, stages
+
+    with stages.stage("persist"):
+        if stats.has_stats(pipeline):
+            merged.save(path)
+        joblib.dump(pipeline, model_file)
+        artifact.export(pipeline, job.model_path, job.model)
+        save_to_json(metrics._asdict(), os.path.join(job.model_path, f"{job.model}_model_error.json"))
+    return metrics, stages
+
+
+def retrain(config, workers: int | None = None, until: datetime | None = None):
+    """
+    Updates the trained models with the data since their watermark instead of
+    refitting them over the whole training window:
+      - linear and polynomial models are solved from the statistics of all
+        the data seen so far merged with those of the new window
+      - xgboost models continue boosting for `train.incremental.rounds` rounds
+        on the new window
+
+    The reported errors are those of the previous models on the new window.
+    Each model has its own watermark, a model that could not be updated
+    keeps it and is updated with the data it missed on the next run.
+    """
+    train = config["train"]
+    train_path = pathlib.Path(train["path"])
+    step = parse_duration(train["step"])
+    rounds = (train.get("incremental") or {}).get("rounds", DEFAULT_ROUNDS)
+    until = until or datetime.now(UTC)
+
+    watermarks: dict[tuple[str, str], stats.Watermark] = {}
+    for pipeline in train["pipelines"]:
+        name = pipeline["name"]
+        for model_name in train["models"]:
+            watermark = stats.read_watermark(train_path / name / "models", model_name)
+            if watermark is None:
+                raise ValueError(f"{name}/{model_name} has no watermark, run a full train first")
+            watermarks[name, model_name] = watermark
+
+    start = min(w.timestamp for w in watermarks.values()) + step
+    if start > until.timestamp():
+        logger.info(f"models are up to date with {until}")
+        return
+
+    stages = Stages()
+    with stages.stage("fetch"):
+        plan, df_all = fetch_training_data(config, datetime.fromtimestamp(start, UTC), until)
+    if df_all.empty:
+        logger.info(f"no new samples since {datetime.fromtimestamp(start, UTC)}")
+        return
+
+    timestamps = df_all.index.to_numpy()
+    columns = {c: i for i, c in enumerate(df_all.columns)}
+    jobs: list[tuple[str, Update]] = []
+    for (name, model_name), watermark in watermarks.items():
+        row = int(np.searchsorted(timestamps, watermark.timestamp, side="right"))
+        if row == len(timestamps):
+            logger.info(f"{name}/{model_name} is up to date")
+            continue
+
+        features = plan.columns[name]
+        job = Update(
+            model=model_name,
+            row=row,
+            columns=[columns[c] for c in features.values()],
+            features=list(features.keys()),
+            targets=[columns[c] for c in plan.targets.values()],
+            model_path=str(train_path / name / "models"),
+            rounds=rounds,
+            threads=1,
+        )
+        jobs.append((name, job))
+
+    if not jobs:
+        return
+
+    workers = pool_size(config, workers, len(jobs))
+    threads = parallel.threads_per_job(workers)
+    logger.info(f"updating {len(jobs)} models with {len(df_all)} new samples on {workers} workers")
+
+    with stages.stage("merge"):
+        data = df_all.to_numpy(dtype=np.float64)
+    with parallel.Pool(data, workers) as pool:
+        futures = [(name, job, pool.submit(update, job._replace(threads=threads))) for name, job in jobs]
+        metrics: dict[str, dict[str, ErrorMetrics]] = {}
+        job_stages = []
+        for name, job, future in futures:
+            err, timings = future.result()
+            job_stages.append(timings)
+            if err is None:
+                continue
+
+            metrics.setdefault(name, {})[job.model] = err
+            rows = watermarks[name, job.model].rows + len(timestamps) - job.row
+            stats.write_watermark(job.model_path, job.model, stats.Watermark(float(timestamps[-1]), rows))
+
+    # the models that were not updated keep their previous errors
+    for name, errors in metrics.items():
+        write_errors(name, {**read_errors(train_path / name), **errors}, train_path / name)
+
+    report_stages(stages, job_stages)
@@ -2,6 +2,10 @@ import yaml
 import re
 import typing as typing
 
+# the target predicted when a pipeline has a single target, and the one
+# errors are reported on when it has several
+PRIMARY_TARGET = "package"
+
 
 def replace_vars(input: str, var_lookup: dict[str, typing.Any]) -> str:
     """
@@ -37,6 +41,29 @@ def process_pipelines(pipelines, vars):
     return pipelines
 
 
+def process_targets(train, vars):
+    """
+    Resolves `train.target`, or the `train.targets` map of target name to
+    query, into both: `targets` ordered with the primary target first and
+    `target` holding the query of the primary target. The primary target is
+    "package" when it is one of the targets, the first one otherwise.
+    """
+    targets = train.get("targets")
+    if not targets:
+        train["target"] = replace_vars(train["target"], vars)
+        train["targets"] = {PRIMARY_TARGET: train["target"]}
+        return train
+
+    if train.get("target"):
+        raise ValueError("train.target and train.targets are exclusive, set one of them")
+
+    primary = PRIMARY_TARGET if PRIMARY_TARGET in targets else next(iter(targets))
+    ordered = {primary: targets[primary], **targets}
+    train["targets"] = {name: replace_vars(promql, vars) for name, promql in ordered.items()}
+    train["target"] = train["targets"][primary]
+    return train
+
+
 def load_pipeline(file):
     """Load the pipeline configuration from a YAML file."""
 
@@ -45,5 +72,5 @@ def load_pipeline(file):
 
     vars = config["train"]["vars"] or {}
     process_pipelines(config["train"]["pipelines"], vars)
-    config["train"]["target"] = replace_vars(config["train"]["target"], vars)
+    process_targets(config["train"], vars)
     return config
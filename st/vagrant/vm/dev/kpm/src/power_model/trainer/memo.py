@@ -0,0 +1,104 @@
+import collections
+import threading
+
+import numpy as np
+
+from power_model import telemetry
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions keyed by quantized feature vectors.
+
+    Each feature is rounded to a multiple of its precision (0 keeps the exact
+    value) and the model predicts on the rounded values, so a cached entry
+    does not depend on which of the inputs within the same bucket arrived
+    first. Entries of models of several targets hold the row of predictions
+    of every target.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CACHE_SIZE, precision: dict[str, float] | None = None):
+        if max_size < 1:
+            raise ValueError(f"max_size must be at least 1, got {max_size}")
+
+        self.max_size = max_size
+        self.precision = precision or {}
+        self.entries: collections.OrderedDict[tuple, float | np.ndarray] = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> "PredictionCache":
+        """Create a cache from the `predict.cache` section of the pipeline config."""
+        return cls(max_size=config.get("size", DEFAULT_CACHE_SIZE), precision=config.get("precision"))
+
+    def quantize(self, features: list[str], X: np.ndarray) -> np.ndarray:
+        quanta = np.array([self.precision.get(f, 0) for f in features], dtype=np.float64)
+        if not quanta.any():
+            return X
+
+        rounded = np.rint(X / np.where(quanta > 0, quanta, 1)) * quanta
+        return np.where(quanta > 0, rounded, X)
+
+    def predict(self, key: tuple, features: list[str], X: np.ndarray, predict) -> np.ndarray:
+        """
+        Returns the predictions for every row of X, calling predict once with
+        the quantized rows that are not cached yet.
+        """
+        X = self.quantize(features, np.asarray(X, dtype=np.float64))
+        keys = [(*key, row.tobytes()) for row in X]
+
+        missing = []
+        cached = []
+        with self.lock:
+            for i, k in enumerate(keys):
+                value = self.entries.get(k)
+                if value is None:
+                    missing.append(i)
+                else:
+                    self.entries.move_to_end(k)
+                    cached.append((i, value))
+            self.hits += len(X) - len(missing)
+            self.misses += len(missing)
+        telemetry.current.cache_hits.inc(len(X) - len(missing))
+        telemetry.current.cache_misses.inc(len(missing))
+
+        if missing:
+            predicted = predict(X[missing])
+            outputs = predicted.shape[1:]
+        else:
+            outputs = np.shape(cached[0][1]) if cached else ()
+
+        y = np.empty((len(X), *outputs), dtype=np.float64)
+        for i, value in cached:
+            y[i] = value
+        if not missing:
+            return y
+
+        y[missing] = predicted
+
+        evicted = 0
+        with self.lock:
+            for i in missing:
+                # a copy, a row of y would keep all of y alive
+                self.entries[keys[i]] = y[i].copy() if y.ndim == 2 else y[i]
+                self.entries.move_to_end(keys[i])
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        telemetry.current.cache_evictions.inc(evicted)
+
+        return y
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict[str, int]:
+        return {"size": len(self.entries), "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
@@ -0,0 +1,176 @@
+import logging
+import multiprocessing
+import os
+import signal
+import typing
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from threadpoolctl import threadpool_limits
+
+logger = logging.getLogger(__name__)
+
+
+class SharedArray(NamedTuple):
+    """Describes a numpy array placed in shared memory, cheap to pickle."""
+
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+    @classmethod
+    def create(cls, arr: np.ndarray) -> tuple[shared_memory.SharedMemory, "SharedArray"]:
+        shm = shared_memory.SharedMemory(create=True, size=max(arr.nbytes, 1))
+        np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf)[...] = arr
+        return shm, cls(shm.name, arr.shape, arr.dtype.str)
+
+    def attach(self) -> tuple[shared_memory.SharedMemory, np.ndarray]:
+        shm = shared_memory.SharedMemory(name=self.name)
+        return shm, np.ndarray(self.shape, dtype=np.dtype(self.dtype), buffer=shm.buf)
+
+
+class Job(NamedTuple):
+    pipeline: str
+    model: str
+    params: dict[str, typing.Any]
+    # columns of the shared frame holding the features and the targets,
+    # models of several targets predict one output per target
+    columns: list[int]
+    features: list[str]
+    targets: list[int]
+    target_names: list[str]
+    model_path: str
+    threads: int
+
+
+def threads_per_job(workers: int) -> int:
+    return max(1, (os.cpu_count() or 1) // workers)
+
+
+def fit(arr: np.ndarray, job: Job):
+    # imported here so that the workers do not depend on the import order of
+    # the trainer package
+    from power_model.telemetry import Stages
+    from power_model.trainer import artifact, stats
+    from power_model.trainer.runner import pipeline_for_model_name, train_one
+
+    params = dict(job.params)
+    if job.model == "xgboost":
+        params.setdefault("n_jobs", job.threads)
+
+    X = pd.DataFrame(arr[:, job.columns], columns=job.features)
+    if len(job.targets) == 1:
+        y = pd.Series(arr[:, job.targets[0]], name="target")
+    else:
+        y = pd.DataFrame(arr[:, job.targets], columns=job.target_names)
+
+    stages = Stages()
+    with threadpool_limits(limits=job.threads):
+        pipeline, metrics = train_one(
+            job.model, pipeline_for_model_name(job.model, params), X, y, job.model_path, stages
+        )
+
+    with stages.stage("persist"):
+        artifact.export(pipeline, job.model_path, job.model)
+        # incremental training continues from the statistics of the whole window
+        if stats.has_stats(pipeline):
+            stats.pipeline_stats(pipeline, X, y).save(stats.stats_path(job.model_path, job.model))
+    return metrics, stages
+
+
+def _call(fn, data: SharedArray, job):
+    shm, arr = data.attach()
+    try:
+        return fn(arr, job)
+    finally:
+        del arr
+        shm.close()
+
+
+def _report_pid(pids):
+    pids.put(os.getpid())
+
+
+class Pool:
+    """
+    Process pool whose jobs all work on the same array, which is placed in
+    shared memory once instead of being pickled for each job. Jobs are
+    submitted as fn(arr, job) where fn has to be a module level function.
+
+    With a single worker the jobs run inline on submit.
+    """
+
+    def __init__(self, data: np.ndarray, workers: int):
+        self.data = data
+        self.workers = workers
+        self.shm = None
+        self.executor = None
+        # every worker sends its pid before running a job, so that terminate
+        # can kill the workers busy with one
+        self.pids = None
+
+    def __enter__(self):
+        if self.workers > 1:
+            self.shm, self.desc = SharedArray.create(self.data)
+            self.executor = self._executor()
+        return self
+
+    def _executor(self) -> ProcessPoolExecutor:
+        ctx = multiprocessing.get_context("spawn")
+        self.pids = ctx.SimpleQueue()
+        return ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=ctx, initializer=_report_pid, initargs=(self.pids,)
+        )
+
+    def terminate(self):
+        """
+        Cancels the queued jobs and kills the workers running the others,
+        whose futures are never resolved. Jobs submitted afterwards run on
+        new workers.
+        """
+        if self.executor is None:
+            return
+
+        pids = []
+        while not self.pids.empty():
+            pids.append(self.pids.get())
+
+        # idle workers exit on shutdown, the executor reaps the killed ones
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.executor = self._executor()
+
+    def __exit__(self, *args):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+
+    def submit(self, fn, job) -> Future:
+        if self.executor is not None:
+            return self.executor.submit(_call, fn, self.desc, job)
+
+        future: Future = Future()
+        try:
+            future.set_result(fn(self.data, job))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
+def train_jobs(data: np.ndarray, jobs: list[Job], workers: int) -> list:
+    """
+    Runs the training jobs on a pool of `workers` processes and returns their
+    error metrics and stage timings in the order of the jobs.
+    """
+    with Pool(data, workers) as pool:
+        futures = [pool.submit(fit, job) for job in jobs]
+        return [f.result() for f in futures]
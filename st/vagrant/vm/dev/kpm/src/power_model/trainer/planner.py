@@ -0,0 +1,74 @@
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+from power_model.datasource.base import InstantSource, RangeSource
+from power_model.trainer.loader import PRIMARY_TARGET
+
+logger = logging.getLogger(__name__)
+
+TARGET = "target"
+
+
+class QueryPlan:
+    """
+    Collects every resolved PromQL expression of all pipelines and the targets
+    so that each unique expression is queried only once per window.
+
+    The queries return a single frame with one column per unique expression
+    from which each pipeline slices its features. The primary target is
+    the TARGET column and every other target a column named after it.
+    """
+
+    def __init__(self, pipelines: list[dict], target: str, targets: dict[str, str] | None = None):
+        # the primary target is the first one of `targets` when given
+        targets = targets or {PRIMARY_TARGET: target}
+        self.queries: dict[str, str] = {}
+        # target name -> column, the primary target first
+        self.targets: dict[str, str] = {}
+        self.columns: dict[str, dict[str, str]] = {}
+
+        column_for_query: dict[str, str] = {}
+        for name, promql in targets.items():
+            expr = promql.strip()
+            if expr not in column_for_query:
+                column = f"{TARGET}_{name}" if self.targets else TARGET
+                column_for_query[expr] = column
+                self.queries[column] = promql
+            self.targets[name] = column_for_query[expr]
+
+        first = len(self.queries)
+        for pipeline in pipelines:
+            columns = {}
+            for feature, promql in pipeline["features"].items():
+                expr = promql.strip()
+                if expr not in column_for_query:
+                    column = f"q{len(self.queries) - first}"
+                    column_for_query[expr] = column
+                    self.queries[column] = promql
+                columns[feature] = column_for_query[expr]
+            self.columns[pipeline["name"]] = columns
+
+        total = sum(len(p["features"]) for p in pipelines) + len(targets)
+        logger.debug(f"planned {len(self.queries)} unique queries for {total} expressions")
+
+    @classmethod
+    def from_config(cls, config) -> "QueryPlan":
+        train = config["train"]
+        return cls(train["pipelines"], train["target"], train.get("targets"))
+
+    def range_query(self, prom: RangeSource, start: datetime, end: datetime, step) -> pd.DataFrame:
+        return prom.range_query(start=start, end=end, step=step, **self.queries)
+
+    def instant_query(self, prom: InstantSource, at: datetime) -> pd.DataFrame:
+        return prom.instant_query(at=at, **self.queries)
+
+    def features(self, df: pd.DataFrame, pipeline: str) -> pd.DataFrame:
+        """Returns the features of the pipeline named as in the pipeline config."""
+        columns = self.columns[pipeline]
+        return df[list(columns.values())].set_axis(list(columns.keys()), axis="columns")
+
+    def frame(self, df: pd.DataFrame, pipeline: str) -> pd.DataFrame:
+        """Returns the features of the pipeline along with the targets."""
+        return pd.concat([self.features(df, pipeline), df[list(dict.fromkeys(self.targets.values()))]], axis="columns")
@@ -0,0 +1,232 @@
+import logging
+from datetime import datetime
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+
+from power_model.datasource import kepler, prometheus
+from power_model.datasource.base import InstantSource
+from power_model.trainer.compiled import primary
+from power_model.trainer.memo import PredictionCache
+from power_model.trainer.planner import QueryPlan
+from power_model.trainer.registry import ModelRegistry
+from power_model.trainer.router import Router
+
+logger = logging.getLogger(__name__)
+
+
+# columns of the rows passed to kepler_predict_batch
+KEPLER_METRICS = ("bpf_cpu_time_ms", "bpf_page_cache_hit")
+
+
+class Prediction(NamedTuple):
+    pipeline: str
+    model: str
+    y_pred: float
+
+class KeplerPredition(NamedTuple):
+    package: list[int]
+    core: list[int]
+    uncore: list[int]
+    dram: list[int]
+
+class Predictor:
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+
+        self.prom = prometheus.Client.from_config(pipeline["prometheus"])
+        train = pipeline["train"]
+
+        self.pipelines = train["pipelines"]
+        self.target = train["target"]
+        self.step = train["step"]
+        self.plan = QueryPlan.from_config(pipeline)
+        # the targets the models predict, in the order of their outputs
+        self.targets = list(self.plan.targets)
+
+        # live predictions either query prometheus or scrape the exporters
+        # directly, ranges always come from prometheus
+        predict = pipeline.get("predict") or {}
+        self.source: InstantSource = self.prom
+        if predict.get("datasource", "prometheus") == "kepler":
+            self.source = kepler.Client.from_config(predict["kepler"], self.plan.queries.values())
+
+        self.cache = None
+        if cache_config := pipeline.get("predict", {}).get("cache"):
+            self.cache = PredictionCache.from_config(cache_config)
+
+        self.load_models()
+
+    def load_models(self):
+        """(Re)loads the trained models on demand, invalidating all cached predictions."""
+        train = self.pipeline["train"]
+        self.model_names = list(train["models"])
+        predict = self.pipeline.get("predict") or {}
+        self.registry = ModelRegistry.from_config(train["path"], predict.get("models") or {})
+        self.router = Router.from_config(self.registry, predict)
+
+        if self.cache is not None:
+            self.cache.clear()
+
+    def close(self):
+        if self.source is not self.prom:
+            self.source.close()
+        self.prom.close()
+
+    def stats(self) -> dict[str, dict]:
+        """Counters of the model registry and of the prediction cache."""
+        stats = {"models": self.registry.stats()}
+        if self.cache is not None:
+            stats["cache"] = self.cache.stats()
+        return stats
+
+    def _predict(self, pipeline_name: str, model_name: str, X: np.ndarray) -> np.ndarray:
+        model = self.registry.get(pipeline_name, model_name)
+        if self.cache is None:
+            return model.predict(X)
+
+        return self.cache.predict((pipeline_name, model_name), model.features, X, model.predict)
+
+    def predict_range(self, start, end, step=None, chunk=None, buckets=None, workers=None, output=None):
+        """
+        Prints the errors of every model over the window, and per bucket when
+        buckets are given, see evaluator.evaluate_range. The errors per
+        bucket are also written as CSV to `output`.
+        """
+        from power_model.trainer import evaluator
+
+        evaluation = evaluator.evaluate_range(
+            self.prom,
+            self.plan,
+            self.registry,
+            [p["name"] for p in self.pipelines],
+            self.model_names,
+            start,
+            end,
+            step or self.step,
+            chunk=chunk or evaluator.DEFAULT_CHUNK,
+            buckets=buckets,
+            workers=workers,
+        )
+        for chunk_start, chunk_end in evaluation.skipped:
+            print(f"skipped {chunk_start} - {chunk_end}, not every query has samples")
+
+        print(
+            tabulate(
+                evaluation.summary(),
+                headers=["Name", "Model", "MAPE", "MAE", "MSE", "R2", "Samples", "Zero targets"],
+                tablefmt="tabulate",
+            )
+        )
+        if evaluation.buckets:
+            print()
+            print(
+                tabulate(
+                    evaluation.bucket_rows(),
+                    headers=["Name", "Model", "Bucket", "MAPE", "MAE", "MSE", "R2", "Samples", "Zero targets"],
+                    tablefmt="tabulate",
+                )
+            )
+        if output is not None:
+            evaluation.write_csv(output)
+        return evaluation
+
+    def predict(self, at=None, show: bool = True) -> list[Prediction]:
+        """Predicts with every model at the given time, printing them against the target when show is set."""
+        df_all, ret = self.predict_instant(at)
+        if show:
+            print(self.format_predictions(df_all, ret))
+        return ret
+
+    def predict_instant(self, at=None) -> tuple[pd.DataFrame, list[Prediction]]:
+        """Returns the queried features and target along with the prediction of every model."""
+        if at is None:
+            at = datetime.now()
+
+        df_all = self.plan.instant_query(self.source, at=at)
+
+        ret = []
+        for pipeline in self.pipelines:
+            pipeline_name = pipeline["name"]
+            X = self.plan.features(df_all, pipeline_name).to_numpy()
+
+            for model_name in self.model_names:
+                y_pred = primary(self._predict(pipeline_name, model_name, X))
+                ret.append(Prediction(pipeline_name, model_name, y_pred[0]))
+
+        return df_all, ret
+
+    def format_predictions(self, df_all: pd.DataFrame, predictions: list[Prediction]) -> str:
+        """Formats the predictions of predict_instant as one table per pipeline."""
+        y_val = df_all["target"].values
+
+        tables = []
+        for pipeline in self.pipelines:
+            pipeline_name = pipeline["name"]
+            features = pipeline["features"]
+            X = self.plan.features(df_all, pipeline_name)
+
+            table = []
+            for p in predictions:
+                if p.pipeline != pipeline_name:
+                    continue
+
+                diff = y_val - p.y_pred
+                percent_error = np.round(abs(diff / y_val) * 100, 2)
+
+                row = [pipeline_name, p.model]
+                row = np.append(row, *X.values)
+                row = np.append(row, *y_val)
+                row = np.append(row, p.y_pred)
+                row = np.append(row, [np.round(diff, 2), percent_error])
+                table.append(row.tolist())
+
+            tables.append(
+                tabulate(
+                    table,
+                    headers=["Pipeline", "Name", *features.keys(), "Target", "Predicted", "Diff", "Err %"],
+                    tablefmt="tabulate",
+                )
+            )
+
+        return "\n".join(tables)
+
+    def predict_route(self, route: int, metrics: tuple[str, ...], values: np.ndarray) -> np.ndarray:
+        """
+        Predicts every target for each row of the values of a kepler request
+        on the model of the route, see kepler_powers.
+        """
+        resolved = self.router.resolve(route)
+        if resolved is None:
+            raise ValueError(f"no model can be loaded for route {route}")
+        return self._predict(*resolved.model, self.router.features(resolved, metrics, values))
+
+    def kepler_predict_batch(self, X: np.ndarray) -> np.ndarray:
+        """Predicts every target for each row of (cpu_time, page_cache_hits) on the default route."""
+        return self.predict_route(self.router.default, KEPLER_METRICS, X)
+
+    def kepler_powers(self, y: np.ndarray) -> KeplerPredition:
+        """
+        Splits the predictions of predict_route into the powers of a kepler
+        response. Each output fills the component its target is named after;
+        components without a target, or predicted by models trained on the
+        primary target only, are 0.
+        """
+        y = np.asarray(y, dtype=np.float64).reshape(len(y), -1)
+        if y.shape[1] not in (1, len(self.targets)):
+            raise ValueError(f"model predicts {y.shape[1]} targets, expected {len(self.targets)}: {self.targets}")
+
+        zeros = [0] * len(y)
+        powers = dict.fromkeys(KeplerPredition._fields, zeros)
+        for name, column in zip(self.targets, y.T):
+            if name in powers:
+                powers[name] = column.tolist()
+        return KeplerPredition(**powers)
+
+    def kepler_predict(self, cpu_time, page_cache_hits) -> KeplerPredition:
+        # df_y = self.prom.instant_query(at=datetime.now(), target=self.target)
+        # y_val = df_y["target"].values
+        y_pred = self.kepler_predict_batch(np.array([[cpu_time, page_cache_hits]], dtype=np.float64))
+        return self.kepler_powers(y_pred)
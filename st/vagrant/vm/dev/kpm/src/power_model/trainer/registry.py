@@ -0,0 +1,135 @@
+import collections
+import logging
+import pathlib
+import threading
+import time
+
+from power_model import telemetry
+from power_model.datasource.cache import parse_size
+from power_model.trainer import artifact
+from power_model.trainer.compiled import compile_pipeline
+
+logger = logging.getLogger(__name__)
+
+
+def load_model(path: pathlib.Path, name: str) -> tuple[object, int]:
+    """
+    Returns a compiled model and the size of the file it was loaded from.
+    Models are mapped from their exported artifact, only models without one
+    are unpickled from joblib (importing sklearn and xgboost).
+    """
+    if (exported := artifact.artifact_path(path, name)).exists():
+        return artifact.load(exported), exported.stat().st_size
+
+    import joblib
+
+    logger.info(f"{exported} not found, loading {name} from joblib")
+    model_file = path / f"{name}_model.joblib"
+    return compile_pipeline(joblib.load(model_file)), model_file.stat().st_size
+
+
+class ModelRegistry:
+    """
+    Loads the models of (pipeline, model) pairs on first use and keeps the
+    most recently used ones, bounded by their count and by the total size of
+    their files. Pinned models are loaded upfront and never evicted; they
+    still count towards the bounds.
+    """
+
+    def __init__(
+        self,
+        path,
+        max_models: int | None = None,
+        max_bytes: int | None = None,
+        pinned: list[tuple[str, str]] | None = None,
+    ):
+        self.path = pathlib.Path(path)
+        self.max_models = max_models
+        self.max_bytes = max_bytes
+        self.pinned = set(pinned or [])
+
+        self.entries: collections.OrderedDict[tuple[str, str], tuple[object, int]] = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.loads = 0
+        self.evictions = 0
+        self.load_seconds = 0.0
+
+        for key in self.pinned:
+            self.get(*key)
+
+    @classmethod
+    def from_config(cls, path, config: dict) -> "ModelRegistry":
+        """
+        Create a registry from the `predict.models` section of the pipeline
+        config, where pinned models are given as "pipeline/model".
+        """
+        max_size = config.get("max_size")
+        return cls(
+            path,
+            max_models=config.get("max_models"),
+            max_bytes=parse_size(max_size) if max_size is not None else None,
+            pinned=[tuple(p.split("/", 1)) for p in config.get("pin", [])],
+        )
+
+    def get(self, pipeline: str, model: str):
+        key = (pipeline, model)
+        with self.lock:
+            if (entry := self.entries.get(key)) is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        # loaded outside of the lock so that requests for other models are not
+        # blocked, concurrent misses of the same model may load it twice
+        begin = time.perf_counter()
+        compiled, size = load_model(self.path / pipeline / "models", model)
+        elapsed = time.perf_counter() - begin
+        logger.info(f"loaded {pipeline}/{model} ({size} bytes) in {elapsed * 1000:.1f}ms")
+        telemetry.current.model_loads.inc()
+        telemetry.current.model_load_seconds.observe(elapsed)
+
+        with self.lock:
+            self.loads += 1
+            self.load_seconds += elapsed
+            if key not in self.entries:
+                self.entries[key] = (compiled, size)
+                self.size += size
+                self._evict()
+            return compiled
+
+    def _over_limit(self) -> bool:
+        if self.max_models is not None and len(self.entries) > self.max_models:
+            return True
+        return self.max_bytes is not None and self.size > self.max_bytes
+
+    def _evict(self):
+        for key in [k for k in self.entries if k not in self.pinned]:
+            if not self._over_limit():
+                break
+            _, size = self.entries.pop(key)
+            self.size -= size
+            self.evictions += 1
+            telemetry.current.model_evictions.inc()
+            logger.debug(f"evicted {key[0]}/{key[1]}")
+
+    def clear(self):
+        """Drops every loaded model and reloads the pinned ones."""
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+        for key in self.pinned:
+            self.get(*key)
+
+    def stats(self) -> dict[str, int | float]:
+        return {
+            "models": len(self.entries),
+            "bytes": self.size,
+            "hits": self.hits,
+            "loads": self.loads,
+            "evictions": self.evictions,
+            "load_seconds": self.load_seconds,
+        }
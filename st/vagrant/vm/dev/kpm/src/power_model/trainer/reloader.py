@@ -0,0 +1,176 @@
+import logging
+import os
+import pathlib
+import threading
+
+import numpy as np
+
+from power_model import telemetry
+from power_model.datasource.prometheus import parse_duration
+from power_model.trainer.loader import load_pipeline
+from power_model.trainer.predictor import Predictor
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RELOAD_INTERVAL = 2.0
+# trainings write many files, changes are only picked up once nothing
+# changed for this long
+DEFAULT_RELOAD_SETTLE = 5.0
+
+Fingerprint = dict[str, tuple[int, int]]
+
+
+def fingerprint(file: str | os.PathLike, config: dict) -> Fingerprint:
+    """Modification time and size of the config file and of every file in the model directories."""
+    paths = [pathlib.Path(file)]
+    train_path = pathlib.Path(config["train"]["path"])
+    for pipeline in config["train"]["pipelines"]:
+        models = train_path / pipeline["name"] / "models"
+        if models.is_dir():
+            paths.extend(p for p in models.iterdir() if not p.name.endswith(".tmp"))
+
+    stats = {}
+    for path in paths:
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            continue
+        stats[str(path)] = (st.st_mtime_ns, st.st_size)
+    return stats
+
+
+def warm(predictor: Predictor):
+    """
+    Resolves every route of the estimator and predicts an idle node on each,
+    so that broken models, or models of other targets than the config,
+    fail before the predictor is swapped in.
+    """
+    for route, resolved in enumerate(predictor.router.resolve_all()):
+        if resolved is None:
+            raise ValueError(f"no model can be loaded for route {route}")
+        metrics = tuple(dict.fromkeys(predictor.router.inputs[f] for f in resolved.features))
+        y = predictor.predict_route(route, metrics, np.zeros((1, len(metrics)), dtype=np.float64))
+        if not np.all(np.isfinite(y)):
+            raise ValueError(f"{resolved.model[0]}/{resolved.model[1]} predicted {y.tolist()} for an idle node")
+        predictor.kepler_powers(y)
+
+
+class Reloader:
+    """
+    Polls the pipeline config and the model directories of its pipelines for
+    changes and builds and warms a new Predictor on a background thread
+    once they settled. The new predictor is handed to `swap` only when it
+    loaded and predicted successfully, otherwise the current one is kept
+    until the files change again.
+
+    `swap` must replace the predictor in a single assignment so that
+    requests being predicted finish on the predictor they started with.
+    """
+
+    def __init__(
+        self,
+        file: str | os.PathLike,
+        predictor: Predictor,
+        swap,
+        interval: float = DEFAULT_RELOAD_INTERVAL,
+        settle: float = DEFAULT_RELOAD_SETTLE,
+    ):
+        self.file = file
+        self.predictor = predictor
+        self.swap = swap
+        self.interval = interval
+        self.settle = settle
+
+        self.loaded = fingerprint(file, predictor.pipeline)
+        self.reloads = 0
+        self.failures = 0
+
+        self.stopped = threading.Event()
+        self.triggered = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="estimator-reload", daemon=True)
+
+    @classmethod
+    def from_config(cls, file, predictor: Predictor, swap) -> "Reloader":
+        """Create a reloader from the `predict.reload` section of the pipeline config."""
+        config = (predictor.pipeline.get("predict") or {}).get("reload") or {}
+        return cls(
+            file,
+            predictor,
+            swap,
+            interval=parse_duration(config.get("interval", DEFAULT_RELOAD_INTERVAL)),
+            settle=parse_duration(config.get("settle", DEFAULT_RELOAD_SETTLE)),
+        )
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.triggered.set()
+        self.thread.join()
+
+    def trigger(self):
+        """Reloads on the next poll even if nothing changed, e.g. on SIGHUP."""
+        self.triggered.set()
+
+    def _loop(self):
+        seen = self.loaded
+        settled_for = 0.0
+        while not self.stopped.is_set():
+            forced = self.triggered.wait(self.interval)
+            if self.stopped.is_set():
+                return
+            self.triggered.clear()
+
+            try:
+                current = fingerprint(self.file, self.predictor.pipeline)
+            except Exception as e:
+                logger.warning(f"failed to check {self.file} for changes: {e}")
+                continue
+
+            if current != seen:
+                seen, settled_for = current, 0.0
+                if not forced:
+                    continue
+            else:
+                settled_for += self.interval
+
+            if forced or (current != self.loaded and settled_for >= self.settle):
+                self.reload(current)
+
+    def reload(self, current: Fingerprint | None = None) -> bool:
+        """Builds, warms and swaps in a new predictor, returns whether it was swapped in."""
+        current = current or fingerprint(self.file, self.predictor.pipeline)
+        try:
+            predictor = Predictor(load_pipeline(self.file))
+        except Exception as e:
+            self._failed(current, e)
+            return False
+
+        try:
+            warm(predictor)
+        except Exception as e:
+            predictor.close()
+            self._failed(current, e)
+            return False
+
+        old, self.predictor = self.predictor, predictor
+        self.swap(predictor)
+        # the estimator only predicts from the models, which stay usable for
+        # the requests still running on the old predictor after it is closed
+        old.close()
+
+        # the files as they were before loading, any change while loading
+        # differs from them and is picked up by the next polls
+        self.loaded = current
+        self.reloads += 1
+        telemetry.current.reloads.labels("success").inc()
+        logger.info(f"reloaded {self.file} and its models")
+        return True
+
+    def _failed(self, current: Fingerprint, e: Exception):
+        # keep serving the current predictor and only retry once the files changed again
+        self.loaded = current
+        self.failures += 1
+        telemetry.current.reloads.labels("failure").inc()
+        logger.error(f"failed to reload {self.file}, keeping the current models: {e}")
@@ -0,0 +1,173 @@
+import logging
+import threading
+from typing import NamedTuple
+
+import numpy as np
+
+from power_model.trainer.registry import ModelRegistry
+
+logger = logging.getLogger(__name__)
+
+ModelKey = tuple[str, str]
+
+# the model of the estimator before routing was configured
+DEFAULT_CHAIN: list[ModelKey] = [("kepler-vm-cpu", "xgboost")]
+
+# metrics of a kepler request that provide each feature of the pipelines,
+# features without a metric in the request are 0 unless their route is strict
+DEFAULT_INPUTS = {"cpu_time": "bpf_cpu_time_ms", "page_cache_hits": "bpf_page_cache_hit"}
+
+
+def parse_chain(value: str | list[str]) -> list[ModelKey]:
+    """Parses a model given as "pipeline/model", or a list of them tried in order."""
+    models = [value] if isinstance(value, str) else list(value)
+    chain = []
+    for model in models:
+        pipeline, sep, name = model.partition("/")
+        if not sep or not pipeline or not name:
+            raise ValueError(f"expected a model as pipeline/model, got {model!r}")
+        chain.append((pipeline, name))
+    return chain
+
+
+class Route(NamedTuple):
+    # request metadata (trainer_name, filter, output_type, energy_source or a
+    # system feature such as cpu_architecture) -> value it has to equal
+    match: dict[str, str]
+    chain: list[ModelKey]
+    # reject requests without the metric of a feature instead of using 0
+    strict: bool = False
+
+
+class Resolved(NamedTuple):
+    model: ModelKey
+    features: list[str]
+    strict: bool = False
+
+
+class Router:
+    """
+    Picks the model of a kepler request from its metadata.
+
+    The routes are tried in order and the first one whose `match` equals the
+    metadata of the request wins, requests without a matching route use the
+    default chain. Routes are indexed by the set of metadata keys they
+    match on, so a lookup costs one dict lookup per distinct set of keys
+    rather than one comparison per route.
+
+    Each route has a chain of models followed by the default chain; the
+    route is served by the first model of its chain that loads and whose
+    features all map to request metrics. Chains are resolved on first use
+    and then kept, they are resolved again by building a new Router.
+    """
+
+    def __init__(
+        self,
+        registry: ModelRegistry,
+        routes: list[Route] | None = None,
+        default: list[ModelKey] | None = None,
+        inputs: dict[str, str] | None = None,
+    ):
+        self.registry = registry
+        self.routes = list(routes or [])
+        self.default_chain = list(default or DEFAULT_CHAIN)
+        self.inputs = {**DEFAULT_INPUTS, **(inputs or {})}
+        # the index of the default route
+        self.default = len(self.routes)
+
+        shapes: dict[tuple[str, ...], dict[tuple[str, ...], int]] = {}
+        for i, route in enumerate(self.routes):
+            keys = tuple(sorted(route.match))
+            values = tuple(str(route.match[k]) for k in keys)
+            # an earlier route with the same match shadows later ones
+            shapes.setdefault(keys, {}).setdefault(values, i)
+        self.index = list(shapes.items())
+
+        self.resolved: dict[int, Resolved | None] = {}
+        self.lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, registry: ModelRegistry, config: dict) -> "Router":
+        """
+        Create a router from the `predict` section of the pipeline config:
+
+            routes:
+              - match: {cpu_architecture: Sapphire Rapids}
+                model: [kepler-metal-cpu/xgboost, kepler-metal-cpu/linear]
+                strict: true
+            default: kepler-vm-cpu/xgboost
+            inputs: {cpu_time: bpf_cpu_time_ms}
+        """
+        routes = [
+            Route(
+                {k: str(v) for k, v in (r.get("match") or {}).items()},
+                parse_chain(r["model"]),
+                strict=bool(r.get("strict", False)),
+            )
+            for r in config.get("routes") or []
+        ]
+        default = parse_chain(config["default"]) if config.get("default") else None
+        return cls(registry, routes, default=default, inputs=config.get("inputs"))
+
+    def route(self, meta: dict[str, str]) -> int:
+        best = self.default
+        for keys, table in self.index:
+            i = table.get(tuple(meta.get(k) for k in keys))
+            if i is not None and i < best:
+                best = i
+        return best
+
+    def chain(self, route: int) -> list[ModelKey]:
+        if route == self.default:
+            return self.default_chain
+        return self.routes[route].chain + self.default_chain
+
+    def resolve(self, route: int) -> Resolved | None:
+        if route in self.resolved:
+            return self.resolved[route]
+
+        with self.lock:
+            if route not in self.resolved:
+                self.resolved[route] = self._resolve(route)
+            return self.resolved[route]
+
+    def _resolve(self, route: int) -> Resolved | None:
+        for key in self.chain(route):
+            try:
+                model = self.registry.get(*key)
+            except Exception as e:
+                logger.warning(f"route {route}: skipping {key[0]}/{key[1]}: {e}")
+                continue
+
+            missing = [f for f in model.features if f not in self.inputs]
+            if missing:
+                logger.warning(f"route {route}: skipping {key[0]}/{key[1]}, no request metric for {missing}")
+                continue
+
+            if key != self.chain(route)[0]:
+                logger.warning(f"route {route}: falling back to {key[0]}/{key[1]}")
+            return Resolved(key, list(model.features), route != self.default and self.routes[route].strict)
+
+        logger.error(f"route {route}: none of {self.chain(route)} can be loaded")
+        return None
+
+    def resolve_all(self) -> list[Resolved | None]:
+        return [self.resolve(i) for i in range(len(self.routes) + 1)]
+
+    def features(self, resolved: Resolved, metrics: tuple[str, ...], values: np.ndarray) -> np.ndarray:
+        """
+        Returns the columns of the request values in the order of the
+        features of the model. Features whose metric is missing from the
+        request are 0, strict routes raise instead.
+        """
+        columns = {m: i for i, m in enumerate(metrics)}
+        if resolved.strict:
+            missing = [self.inputs[f] for f in resolved.features if self.inputs[f] not in columns]
+            if missing:
+                raise ValueError(f"request has no {missing} for model {resolved.model[0]}/{resolved.model[1]}")
+
+        X = np.zeros((len(values), len(resolved.features)), dtype=np.float64)
+        for j, feature in enumerate(resolved.features):
+            if (i := columns.get(self.inputs[feature])) is not None:
+                X[:, j] = values[:, i]
+        return X
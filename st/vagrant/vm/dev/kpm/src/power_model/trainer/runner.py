@@ -18,7 +18,12 @@ from sklearn.preprocessing import PolynomialFeatures, StandardScaler
 from tabulate import tabulate
 from xgboost import XGBRegressor
 
+from power_model import profiling, telemetry
 from power_model.datasource import prometheus
+from power_model.telemetry import Stages
+from power_model.trainer import parallel, snapshot, stats
+from power_model.trainer.compiled import primary
+from power_model.trainer.planner import QueryPlan
 
 logger = logging.getLogger(__name__)
 
@@ -48,17 +53,38 @@ def calculate_metrics(y_true, y_pred) -> ErrorMetrics:
     return ErrorMetrics(mae, mse, mape, r2)
 
 
-def train_one(name: str, pipeline: Pipeline, X, y, model_path: pathlib.Path) -> tuple[Pipeline, ErrorMetrics]:
+def target_values(arr: np.ndarray, columns: list[int]) -> np.ndarray:
+    """The targets of the rows, a vector for a single target and one column per target otherwise."""
+    return arr[:, columns[0]] if len(columns) == 1 else arr[:, columns]
+
+
+def target_errors(y_true: pd.DataFrame, y_pred: np.ndarray) -> dict[str, ErrorMetrics]:
+    """The errors of each target of a model trained on several targets."""
+    return {str(t): calculate_metrics(y_true[t].to_numpy(), y_pred[:, i]) for i, t in enumerate(y_true.columns)}
+
+
+def train_one(
+    name: str, pipeline: Pipeline, X, y, model_path: pathlib.Path, stages: Stages | None = None
+) -> tuple[Pipeline, ErrorMetrics]:
+    stages = stages or Stages()
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2)
 
-    pipeline.fit(X_train, y_train)
-    # find accuracy
-    y_pred = pipeline.predict(X_test)
-    metrics = calculate_metrics(y_test, y_pred)
+    with stages.stage("fit"):
+        pipeline.fit(X_train, y_train)
+
+    # find accuracy, the errors of models trained on several targets are
+    # those of the primary target and listed per target
+    with stages.stage("evaluate"):
+        y_pred = pipeline.predict(X_test)
+        metrics = calculate_metrics(primary(y_test), primary(y_pred))
+        errors = metrics._asdict()
+        if isinstance(y_test, pd.DataFrame):
+            errors["targets"] = {t: m._asdict() for t, m in target_errors(y_test, y_pred).items()}
 
     # Save model with Joblib
-    joblib.dump(pipeline, os.path.join(model_path, f"{name}_model.joblib"))
-    save_to_json(metrics._asdict(), os.path.join(model_path, f"{name}_model_error.json"))
+    with stages.stage("persist"):
+        joblib.dump(pipeline, os.path.join(model_path, f"{name}_model.joblib"))
+        save_to_json(errors, os.path.join(model_path, f"{name}_model_error.json"))
 
     return pipeline, metrics
 
@@ -97,44 +123,16 @@ def pipeline_for_model_name(name: str, params: dict[str, typing.Any]) -> Pipelin
     raise ValueError(f"Invalid model name: {name}")
 
 
-def train_models(X, y, models: dict[str, typing.Any], base_dir: pathlib.Path):
-    trained_models = {}
-    metrics = {}
-
-    model_path = pathlib.Path(base_dir) / "models"
-    os.makedirs(model_path, exist_ok=True)
-
-    for name, params in models.items():
-        regressor = pipeline_for_model_name(name, params or {})
-        model, err_metrics = train_one(name, regressor, X, y, model_path)
-        trained_models[name] = model
-        metrics[name] = err_metrics
-
-    return trained_models, metrics
+def read_errors(model_base_path: pathlib.Path) -> dict[str, ErrorMetrics]:
+    path = model_base_path / "model_errors.json"
+    if not path.exists():
+        return {}
 
+    with open(path) as f:
+        return {m: ErrorMetrics(**errors) for m, errors in json.load(f).items()}
 
-def create_model_for_feature(
-    name: str,
-    features: list[str],
-    df: pd.DataFrame,
-    train_path: pathlib.Path,
-    models: dict[str, typing.Any],
-):
-    # Prepare training data (X and y)
-    # ipdb.set_trace()
 
-    # input_data = pd.DataFrame(numpy_array, columns=['feature1', 'feature2', ...])
-    X = df[features] # .rolling(3).mean().dropna()
-    y = df["target"] # .rolling(3).mean().dropna()
-
-    model_base_path = train_path / name
-    os.makedirs(model_base_path, exist_ok=True)
-    # import ipdb
-    # ipdb.set_trace()
-    #df[*["timestamp", *features, "target"]].to_csv(model_base_path / "training_inputs.csv")
-    df.to_csv(model_base_path / "training_inputs.csv")
-
-    trained_models, metrics = train_models(X, y, models, model_base_path)
+def write_errors(name: str, metrics: dict[str, ErrorMetrics], model_base_path: pathlib.Path):
     # Save results to JSON file
     save_to_json({m: metrics[m]._asdict() for m in metrics.keys()}, model_base_path / "model_errors.json")
 
@@ -148,147 +146,126 @@ def create_model_for_feature(
     print(tabulate(table_data, headers=["Name", "MAPE", "MAE", "MSE", "R2"], tablefmt="tabulate"))
 
 
-def train(config):
-    prometheus_url = config["prometheus"]["url"]
-    prom = prometheus.Client(prometheus_url)
-
-    start_at: datetime = config["train"]["start_at"]
-    end_at: datetime = config["train"]["end_at"]
+def report_stages(stages: Stages, job_stages: list[Stages]):
+    """
+    Observes the stage timings of a training run and of each of its jobs,
+    hands them to the profiler when profiling and logs the total time spent
+    in each stage, summed over the jobs.
+    """
+    current = telemetry.current
+    current.observe_stages(stages.seconds)
+    totals = dict(stages.seconds)
+    for job in job_stages:
+        current.observe_stages(job.seconds)
+        for stage, value in job.seconds.items():
+            totals[stage] = totals.get(stage, 0.0) + value
+
+    if profiling.current is not None:
+        profiling.current.record(stages)
+        for job in job_stages:
+            profiling.current.record(job, jobs=True)
+
+    stages = [s for s in telemetry.TRAIN_STAGES if s in totals]
+    logger.info("stage timings: " + ", ".join(f"{stage} {totals[stage]:.2f}s" for stage in stages))
+
+
+def fetch_training_data(
+    config, start_at: datetime | None = None, end_at: datetime | None = None, from_snapshot: str | None = None
+) -> tuple[QueryPlan, pd.DataFrame]:
+    """
+    Returns the query plan and the aligned frame of all features and the
+    target, over the training window of the config unless overridden, or
+    all the rows of a snapshot written by train without querying
+    prometheus.
+    """
+    plan = QueryPlan.from_config(config)
+    if from_snapshot is not None:
+        return plan, snapshot.load(from_snapshot, plan)
+
+    prom = prometheus.Client.from_config(config["prometheus"])
+
+    start_at = start_at or config["train"]["start_at"]
+    end_at = end_at or config["train"]["end_at"]
     step = config["train"]["step"]
 
-    target_query = config["train"]["target"]
-
-    df_target = prom.range_query(start=start_at, end=end_at, step=step, target=target_query)
-
-    pipelines = config["train"]["pipelines"]
-    train_path = pathlib.Path(config["train"]["path"])
-
-    for pipeline in pipelines:
-        name = pipeline["name"]
-        features = pipeline["features"]
-        df_features = prom.range_query(start=start_at, end=end_at, step=step, **features)
-        df = pd.merge(df_features, df_target, on="timestamp")
-        df.info()
-        create_model_for_feature(name, features.keys(), df, train_path, config["train"]["models"])
-
-
-class Prediction(NamedTuple):
-    pipeline: str
-    model: str
-    y_pred: float
-
-class KeplerPredition(NamedTuple):
-    package: list[int]
-    core: list[int]
-    uncore: list[int]
-    dram: list[int]
-
-class Predictor:
-    def __init__(self, pipeline):
-        self.pipeline = pipeline
-
-        self.prom = prometheus.Client(pipeline["prometheus"]["url"])
-        train = pipeline["train"]
-        model_path = pathlib.Path(train["path"])
-
-        self.pipelines = train["pipelines"]
-        pipeline_names = [p["name"] for p in self.pipelines]
-
-        models = train["models"]
-        self.models = {
-            name: {m: joblib.load(model_path / name / "models" / f"{m}_model.joblib") for m in models}
-            for name in pipeline_names
-        }
-
-        self.target = train["target"]
-        self.step = train["step"]
-
-    def predict_range(self, start, end, step=None):
-        step = step or self.step
-
-        summary = []
-        for pipeline in self.pipelines:
-            pipeline_name = pipeline["name"]
-            features = pipeline["features"]
-
-            df_features = self.prom.range_query(start=start, end=end, step=step, **features)
-            df_y = self.prom.range_query(start=start, end=end, step=step, target=self.target)
-
-            X = df_features[features.keys()]
-            y = df_y["target"]
-
-            for model_name, model in self.models[pipeline_name].items():
-                y_pred = model.predict(X)
-                metrics = calculate_metrics(y, y_pred)
-                summary.append([pipeline_name, model_name, metrics.mape, metrics.mae, metrics.mse, metrics.r2])
-            summary.append([])
-
-        print(
-            tabulate(
-                summary,
-                headers=["Name", "MAPE", "MAE", "MSE", "R2"],
-                tablefmt="tabulate",
-            )
-        )
-
-
-
-    def predict(self, at=None) -> list[Prediction]:
-        if at is None:
-            at = datetime.now()
-
-        df_y = self.prom.instant_query(at=at, target=self.target)
-        y_val = df_y["target"].values
+    return plan, plan.range_query(prom, start=start_at, end=end_at, step=step)
 
-        ret = []
 
-        for pipeline in self.pipelines:
-            pipeline_name = pipeline["name"]
-            features = pipeline["features"]
-            df_features = self.prom.instant_query(at=at, **features)
-            X = df_features[features.keys()]
+def pool_size(config, workers: int | None, jobs: int) -> int:
+    workers = workers or config["train"].get("workers") or os.cpu_count() or 1
+    return max(1, min(workers, jobs))
 
-            table = []
 
-            for model_name, model in self.models[pipeline_name].items():
-                y_pred = model.predict(X)
+def train(config, workers: int | None = None, from_snapshot: str | None = None):
+    """
+    Trains every model of every pipeline. The (pipeline, model) jobs run on a
+    pool of `workers` processes, defaulting to `train.workers` in the config
+    or one per core.
 
-                diff = y_val - y_pred
-                percent_error = np.round(abs(diff / y_val) * 100, 2)
+    The training inputs are written to a snapshot while the models are fit,
+    unless `train.snapshot` is false or they were loaded from one.
+    """
+    stages = Stages()
+    with stages.stage("fetch"):
+        plan, df_all = fetch_training_data(config, from_snapshot=from_snapshot)
 
-                ret.append(Prediction(pipeline_name, model_name, y_pred[0]))
-
-                row = [pipeline_name, model_name]
+    pipelines = config["train"]["pipelines"]
+    models = config["train"]["models"]
+    train_path = pathlib.Path(config["train"]["path"])
 
-                row = np.append(row, *X.values)
-                row = np.append(row, *y_val)
-                row = np.append(row, *y_pred)
+    written = None
+    if from_snapshot is None and config["train"].get("snapshot", True):
+        os.makedirs(train_path, exist_ok=True)
+        written = snapshot.save_in_background(snapshot.snapshot_path(train_path), plan, df_all)
 
-                percent_error = np.round(abs(diff / y_val) * 100, 2)
-                row = np.append(row, [np.round(diff, 2), percent_error])
-                table.append(row.tolist())
+    df_all.info()
 
-            print(
-                tabulate(
-                    table,
-                    headers=["Pipeline", "Name", *features.keys(), "Target", "Predicted", "Diff", "Err %"],
-                    tablefmt="tabulate",
+    columns = {c: i for i, c in enumerate(df_all.columns)}
+    jobs = []
+    for pipeline in pipelines:
+        name = pipeline["name"]
+        model_base_path = train_path / name
+        os.makedirs(model_base_path / "models", exist_ok=True)
+
+        features = plan.columns[name]
+        for model_name, params in models.items():
+            jobs.append(
+                parallel.Job(
+                    pipeline=name,
+                    model=model_name,
+                    params=params or {},
+                    columns=[columns[c] for c in features.values()],
+                    features=list(features.keys()),
+                    targets=[columns[c] for c in plan.targets.values()],
+                    target_names=list(plan.targets),
+                    model_path=str(model_base_path / "models"),
+                    threads=1,
                 )
             )
 
-        return ret
-
+    workers = pool_size(config, workers, len(jobs))
+    threads = parallel.threads_per_job(workers)
+    jobs = [job._replace(threads=threads) for job in jobs]
 
-    def kepler_predict(self, cpu_time, page_cache_hits) -> KeplerPredition:
-        # df_y = self.prom.instant_query(at=datetime.now(), target=self.target)
-        # y_val = df_y["target"].values
-        X = pd.DataFrame({"cpu_time": [cpu_time], "page_cache_hits": [page_cache_hits]})
+    logger.info(f"training {len(jobs)} models on {workers} workers with {threads} threads each")
+    with stages.stage("merge"):
+        data = df_all.to_numpy(dtype=np.float64)
+    results = parallel.train_jobs(data, jobs, workers)
 
+    watermark = stats.Watermark(float(df_all.index[-1]), len(df_all))
+    metrics: dict[str, dict[str, ErrorMetrics]] = {p["name"]: {} for p in pipelines}
+    job_stages = []
+    for job, (err, timings) in zip(jobs, results):
+        metrics[job.pipeline][job.model] = err
+        job_stages.append(timings)
+        stats.write_watermark(job.model_path, job.model, watermark)
 
-        # table = []
+    for pipeline in pipelines:
+        name = pipeline["name"]
+        write_errors(name, metrics[name], train_path / name)
 
-        model = self.models["kepler-vm-cpu"]["xgboost"]
-        y_pred = model.predict(X)
-        ret = KeplerPredition(package=y_pred.tolist(), core=[0], uncore=[0], dram=[0]) 
-        return ret
+    if written is not None:
+        with stages.stage("persist"):
+            written.result()
 
+    report_stages(stages, job_stages)
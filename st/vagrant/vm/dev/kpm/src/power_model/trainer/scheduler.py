@@ -0,0 +1,117 @@
+import logging
+import math
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import UTC, datetime
+
+from power_model import telemetry
+from power_model.trainer.predictor import Prediction, Predictor
+
+logger = logging.getLogger(__name__)
+
+
+class Ticker:
+    """
+    Yields the deadline of each tick of a fixed cadence on the monotonic
+    clock, which is when the next tick is due. Ticks are scheduled from the
+    start rather than from the end of the previous tick so they do not drift,
+    and ticks that already passed when the consumer comes back are skipped
+    instead of being fired back to back.
+    """
+
+    def __init__(self, interval: float):
+        if interval <= 0:
+            raise ValueError(f"interval must be positive, got {interval}")
+
+        self.interval = interval
+        self.skipped = 0
+        self.stopped = threading.Event()
+
+    def __iter__(self):
+        tick = time.monotonic()
+        while not self.stopped.is_set():
+            now = time.monotonic()
+            if now < tick and self.stopped.wait(tick - now):
+                return
+
+            deadline = tick + self.interval
+            yield deadline
+
+            # the next tick is due at the deadline, skip the ones that are
+            # entirely in the past
+            late = time.monotonic() - deadline
+            missed = math.floor(late / self.interval) if late > 0 else 0
+            if missed > 0:
+                self.skipped += missed
+                logger.warning(f"tick overran its deadline by {late:.3f}s, skipping {missed} ticks")
+            tick = deadline + missed * self.interval
+
+    def stop(self):
+        self.stopped.set()
+
+
+class PredictionLoop:
+    """
+    Runs Predictor.predict_instant on every tick of a Ticker and hands the
+    predictions to `publish`.
+
+    Predictions run on a worker thread and are only published when they
+    complete before the deadline of their tick. A tick that finds the
+    previous prediction still running is skipped. Tables are formatted and
+    printed on a separate thread, dropping tables while one is still being
+    printed.
+    """
+
+    def __init__(self, predictor: Predictor, interval: float, publish, show: bool = True):
+        self.predictor = predictor
+        self.ticker = Ticker(interval)
+        self.publish = publish
+        self.show = show
+
+        self.overruns = 0
+        self.failures = 0
+
+    def run(self):
+        running: Future | None = None
+        printing: Future | None = None
+
+        with (
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="predict") as executor,
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix="print") as printer,
+        ):
+            current = telemetry.current
+            for deadline in self.ticker:
+                if running is not None and not running.done():
+                    self.overruns += 1
+                    current.predict_overruns.inc()
+                    logger.warning("previous prediction is still running, skipping tick")
+                    continue
+
+                start = time.perf_counter()
+                running = executor.submit(self.predictor.predict_instant, datetime.now(UTC))
+                try:
+                    df_all, predictions = running.result(timeout=max(0.0, deadline - time.monotonic()))
+                except FutureTimeoutError:
+                    self.overruns += 1
+                    current.predict_overruns.inc()
+                    logger.warning("prediction missed its deadline, dropping it")
+                    continue
+                except Exception as e:
+                    self.failures += 1
+                    current.predict_failures.inc()
+                    logger.error(f"prediction failed: {e}")
+                    continue
+                current.predict_seconds.observe(time.perf_counter() - start)
+
+                self.publish(predictions)
+
+                if self.show and (printing is None or printing.done()):
+                    printing = printer.submit(self._print, df_all, predictions)
+
+    def _print(self, df_all, predictions: list[Prediction]):
+        print(self.predictor.format_predictions(df_all, predictions))
+
+    def stop(self):
+        self.ticker.stop()
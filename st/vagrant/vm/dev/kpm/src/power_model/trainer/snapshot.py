@@ -0,0 +1,113 @@
+import hashlib
+import json
+import logging
+import os
+import pathlib
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from power_model.trainer.planner import QueryPlan
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FILE = "training_inputs.npz"
+VERSION = 1
+
+
+def snapshot_path(train_path: str | os.PathLike) -> pathlib.Path:
+    return pathlib.Path(train_path) / SNAPSHOT_FILE
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    # counters and rates on a coarse grid are often exact in float32, which
+    # halves the size before compression
+    narrow = values.astype(np.float32)
+    if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+        return narrow
+    return values
+
+
+def digest(plan: QueryPlan, df: pd.DataFrame) -> str:
+    h = hashlib.sha256()
+    h.update(np.ascontiguousarray(df.index.to_numpy(dtype=np.int64)).tobytes())
+    for column, promql in plan.queries.items():
+        h.update(promql.strip().encode() + b"\0")
+        h.update(np.ascontiguousarray(df[column].to_numpy(dtype=np.float64)).tobytes())
+    return h.hexdigest()
+
+
+def read_meta(path: str | os.PathLike) -> dict | None:
+    try:
+        with np.load(path) as npz:
+            return json.loads(str(npz["meta"]))
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        logger.warning(f"ignoring unreadable snapshot {path}: {e}")
+        return None
+
+
+def save(path: str | os.PathLike, plan: QueryPlan, df: pd.DataFrame) -> bool:
+    """
+    Writes the aligned frame of every unique query as a compressed npz, one
+    array per column, with each column stored as float32 when that is
+    lossless. Columns are keyed by query, so features shared by pipelines
+    are stored once. Returns False without writing when the snapshot at
+    `path` already holds the same data.
+    """
+    path = pathlib.Path(path)
+    meta = {
+        "version": VERSION,
+        "digest": digest(plan, df),
+        "rows": len(df),
+        "start": int(df.index[0]) if len(df) else None,
+        "end": int(df.index[-1]) if len(df) else None,
+        "queries": plan.queries,
+        "pipelines": plan.columns,
+    }
+
+    existing = read_meta(path)
+    if existing is not None and existing.get("digest") == meta["digest"]:
+        logger.info(f"snapshot {path} is up to date")
+        return False
+
+    arrays = {f"column_{c}": _narrow(df[c].to_numpy(dtype=np.float64)) for c in plan.queries}
+    tmp = path.with_name(f"{path.name}.tmp")
+    with open(tmp, "wb") as f:
+        np.savez_compressed(f, meta=np.array(json.dumps(meta)), timestamp=df.index.to_numpy(dtype=np.int64), **arrays)
+    os.replace(tmp, path)
+    logger.info(f"wrote snapshot of {len(df)} rows to {path} ({path.stat().st_size} bytes)")
+    return True
+
+
+def save_in_background(path: str | os.PathLike, plan: QueryPlan, df: pd.DataFrame) -> Future:
+    """Writes the snapshot on a separate thread, the frame must not be modified until it is done."""
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="snapshot")
+    future = executor.submit(save, path, plan, df)
+    executor.shutdown(wait=False)
+    return future
+
+
+def load(path: str | os.PathLike, plan: QueryPlan) -> pd.DataFrame:
+    """
+    Returns the frame of the queries of the plan from a snapshot, in the
+    layout of QueryPlan.range_query. The snapshot may hold other queries
+    too, but every query of the plan must be in it.
+    """
+    with np.load(path) as npz:
+        meta = json.loads(str(npz["meta"]))
+        if meta.get("version") != VERSION:
+            raise ValueError(f"unsupported snapshot version {meta.get('version')} in {path}")
+
+        stored = {promql.strip(): column for column, promql in meta["queries"].items()}
+        missing = [promql for promql in plan.queries.values() if promql.strip() not in stored]
+        if missing:
+            raise ValueError(f"snapshot {path} has no samples for queries: {missing}")
+
+        data = {c: npz[f"column_{stored[promql.strip()]}"].astype(np.float64) for c, promql in plan.queries.items()}
+        index = pd.Index(npz["timestamp"], name="timestamp")
+
+    logger.info(f"loaded {len(index)} rows from snapshot {path}")
+    return pd.DataFrame(data, index=index)
@@ -0,0 +1,136 @@
+import json
+import os
+import pathlib
+from typing import NamedTuple
+
+import numpy as np
+from scipy.optimize import nnls
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+
+# watermark shared by all models of a pipeline, written before watermarks
+# were kept per model
+WATERMARK_FILE = "watermark.json"
+
+
+class Stats(NamedTuple):
+    """
+    Sufficient statistics of a least squares fit on the design matrix Z (the
+    output of every pipeline step but the last) and the target y, kept
+    centered so that merging windows does not lose precision:
+      - zz = (Z - mean_z)^T (Z - mean_z)
+      - zy = (Z - mean_z)^T (y - mean_y)
+
+    With several targets y has one column per target, and mean_y and zy one
+    entry and one column per target.
+    """
+
+    n: int
+    mean_z: np.ndarray
+    mean_y: float | np.ndarray
+    zz: np.ndarray
+    zy: np.ndarray
+
+    @classmethod
+    def from_data(cls, Z: np.ndarray, y: np.ndarray) -> "Stats":
+        Z = np.asarray(Z, dtype=np.float64)
+        y = np.asarray(y, dtype=np.float64)
+        mean_z = Z.mean(axis=0)
+        mean_y = y.mean(axis=0)
+        dz = Z - mean_z
+        return cls(len(Z), mean_z, mean_y, dz.T @ dz, dz.T @ (y - mean_y))
+
+    def merge(self, other: "Stats") -> "Stats":
+        n = self.n + other.n
+        dz = other.mean_z - self.mean_z
+        dy = other.mean_y - self.mean_y
+        w = self.n * other.n / n
+        return Stats(
+            n,
+            self.mean_z + dz * other.n / n,
+            self.mean_y + dy * other.n / n,
+            self.zz + other.zz + np.outer(dz, dz) * w,
+            self.zy + other.zy + np.multiply.outer(dz, dy) * w,
+        )
+
+    def solve(self, positive: bool = False) -> tuple[np.ndarray, float | np.ndarray]:
+        """
+        Returns the coefficients and the intercept of the least squares fit,
+        shaped like those of LinearRegression.
+        """
+        zy = self.zy.reshape(len(self.zz), -1)
+        if not positive:
+            coef = np.linalg.lstsq(self.zz, zy, rcond=None)[0]
+        else:
+            # zz = R^T R turns the normal equations into a least squares
+            # problem on R that nnls can solve, once per target
+            eigvals, eigvecs = np.linalg.eigh(self.zz)
+            keep = eigvals > max(eigvals.max(), 0) * 1e-12
+            root = np.sqrt(eigvals[keep])
+            R = root[:, None] * eigvecs[:, keep].T
+            b = (eigvecs[:, keep].T @ zy) / root[:, None]
+            coef = np.column_stack([nnls(R, b[:, k])[0] for k in range(zy.shape[1])])
+
+        intercept = self.mean_y - self.mean_z @ coef
+        if self.zy.ndim == 1:
+            return coef[:, 0], float(intercept[0])
+        return coef.T, intercept
+
+    def save(self, path: pathlib.Path):
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, n=self.n, mean_z=self.mean_z, mean_y=self.mean_y, zz=self.zz, zy=self.zy)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: pathlib.Path) -> "Stats":
+        with np.load(path) as data:
+            mean_y = data["mean_y"]
+            mean_y = float(mean_y) if mean_y.ndim == 0 else mean_y
+            return cls(int(data["n"]), data["mean_z"], mean_y, data["zz"], data["zy"])
+
+
+def stats_path(model_path, name: str) -> pathlib.Path:
+    return pathlib.Path(model_path) / f"{name}_stats.npz"
+
+
+def has_stats(pipeline: Pipeline) -> bool:
+    """Pipelines ending in a linear regression can be updated from Stats."""
+    return isinstance(pipeline.steps[-1][1], LinearRegression)
+
+
+def pipeline_stats(pipeline: Pipeline, X, y) -> Stats:
+    return Stats.from_data(pipeline[:-1].transform(X), y)
+
+
+def apply_stats(pipeline: Pipeline, stats: Stats):
+    """Replaces the coefficients of the final linear regression by the fit of stats."""
+    linear = pipeline.steps[-1][1]
+    linear.coef_, linear.intercept_ = stats.solve(positive=linear.positive)
+
+
+class Watermark(NamedTuple):
+    # unix timestamp of the last sample the models were trained on
+    timestamp: float
+    rows: int
+
+
+def watermark_path(model_path, name: str) -> pathlib.Path:
+    return pathlib.Path(model_path) / f"{name}_watermark.json"
+
+
+def read_watermark(model_path, name: str) -> Watermark | None:
+    """
+    The watermark of a model, each model has its own so that a model that
+    could not be updated keeps the data it has not seen yet.
+    """
+    for path in [watermark_path(model_path, name), pathlib.Path(model_path) / WATERMARK_FILE]:
+        if path.exists():
+            with open(path) as f:
+                return Watermark(**json.load(f))
+    return None
+
+
+def write_watermark(model_path, name: str, watermark: Watermark):
+    with open(watermark_path(model_path, name), "w") as f:
+        json.dump(watermark._asdict(), f)
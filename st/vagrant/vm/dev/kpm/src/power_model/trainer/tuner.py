@@ -0,0 +1,321 @@
+import logging
+import math
+import os
+import pathlib
+import time
+import typing
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import NamedTuple
+
+import joblib
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from threadpoolctl import threadpool_limits
+
+from power_model.datasource.prometheus import parse_duration
+from power_model.trainer import artifact, parallel, stats
+from power_model.trainer.compiled import primary
+from power_model.trainer.runner import (
+    ErrorMetrics,
+    calculate_metrics,
+    fetch_training_data,
+    pipeline_for_model_name,
+    pool_size,
+    save_to_json,
+    target_values,
+)
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FOLDS = 5
+DEFAULT_CANDIDATES = 16
+DEFAULT_ETA = 3
+DEFAULT_BUDGET = "10m"
+DEFAULT_METRIC = "mae"
+
+
+def sample_space(space: dict[str, typing.Any], n: int, rng: np.random.Generator) -> list[dict[str, typing.Any]]:
+    """
+    Draws n parameter sets from the search space of a model:
+      - a list is a set of choices
+      - a mapping with min and max is a uniform range, sampled on a log scale
+        with `log: true` and as integers if both bounds are integers
+      - anything else is a fixed value
+    Spaces without any choices yield a single candidate.
+    """
+    space = space or {}
+    if not any(isinstance(v, (list, dict)) for v in space.values()):
+        return [dict(space)]
+
+    candidates = []
+    for _ in range(n):
+        params = {}
+        for name, spec in space.items():
+            if isinstance(spec, list):
+                params[name] = spec[rng.integers(len(spec))]
+            elif isinstance(spec, dict):
+                lo, hi = spec["min"], spec["max"]
+                if spec.get("log", False):
+                    value = math.exp(rng.uniform(math.log(lo), math.log(hi)))
+                else:
+                    value = rng.uniform(lo, hi)
+                params[name] = int(round(value)) if isinstance(lo, int) and isinstance(hi, int) else float(value)
+            else:
+                params[name] = spec
+        if params not in candidates:
+            candidates.append(params)
+    return candidates
+
+
+def blocked_splits(rows: int, folds: int) -> list[tuple[int, int]]:
+    """
+    Splits rows into folds + 1 contiguous blocks. Fold i trains on all blocks
+    before block i + 1 and validates on block i + 1, so the model never sees
+    samples that come after the ones it is validated on. Returns the
+    (train_end, test_end) row of each fold.
+    """
+    block = rows // (folds + 1)
+    if block < 2:
+        raise ValueError(f"{rows} rows are not enough for {folds} folds")
+
+    return [(block * (i + 1), rows if i == folds - 1 else block * (i + 2)) for i in range(folds)]
+
+
+def rungs(folds: int, eta: int) -> list[int]:
+    """Number of folds evaluated at each rung of successive halving."""
+    schedule = []
+    n = 1
+    while n < folds:
+        schedule.append(n)
+        n *= eta
+    return schedule + [folds]
+
+
+class Trial(NamedTuple):
+    search: int
+    candidate: int
+    fold: int
+    model: str
+    params: dict[str, typing.Any]
+    columns: list[int]
+    features: list[str]
+    targets: list[int]
+    split: tuple[int, int]
+    threads: int
+
+
+def evaluate(arr: np.ndarray, trial: Trial) -> ErrorMetrics:
+    params = dict(trial.params)
+    if trial.model == "xgboost":
+        params.setdefault("n_jobs", trial.threads)
+
+    train_end, test_end = trial.split
+    X = pd.DataFrame(arr[:test_end, trial.columns], columns=trial.features)
+    y = target_values(arr[:test_end], trial.targets)
+
+    # candidates are fit on every target and scored on the primary one
+    with threadpool_limits(limits=trial.threads):
+        pipeline = pipeline_for_model_name(trial.model, params)
+        pipeline.fit(X.iloc[:train_end], y[:train_end])
+        return calculate_metrics(primary(y[train_end:]), primary(pipeline.predict(X.iloc[train_end:])))
+
+
+class Refit(NamedTuple):
+    model: str
+    params: dict[str, typing.Any]
+    columns: list[int]
+    features: list[str]
+    targets: list[int]
+    model_path: str
+    threads: int
+
+
+def refit(arr: np.ndarray, job: Refit):
+    params = dict(job.params)
+    if job.model == "xgboost":
+        params.setdefault("n_jobs", job.threads)
+
+    X = pd.DataFrame(arr[:, job.columns], columns=job.features)
+    y = target_values(arr, job.targets)
+    with threadpool_limits(limits=job.threads):
+        pipeline = pipeline_for_model_name(job.model, params).fit(X, y)
+
+    joblib.dump(pipeline, os.path.join(job.model_path, f"{job.model}_model.joblib"))
+    artifact.export(pipeline, job.model_path, job.model)
+    if stats.has_stats(pipeline):
+        stats.pipeline_stats(pipeline, X, y).save(stats.stats_path(job.model_path, job.model))
+
+
+class Search:
+    """Successive halving state of one (pipeline, model) combination."""
+
+    def __init__(self, pipeline: str, model: str, candidates: list[dict], metric: str):
+        self.pipeline = pipeline
+        self.model = model
+        self.candidates = candidates
+        self.metric = metric
+        self.alive = list(range(len(candidates)))
+        self.results: dict[int, dict[int, ErrorMetrics]] = {i: {} for i in range(len(candidates))}
+
+    def score(self, candidate: int) -> float:
+        values = [getattr(m, self.metric) for m in self.results[candidate].values()]
+        score = float(np.mean(values)) if values else math.inf
+        # higher is better for r2
+        return -score if self.metric == "r2" and values else score
+
+    def halve(self, eta: int):
+        ranked = sorted(self.alive, key=self.score)
+        self.alive = ranked[: max(1, math.ceil(len(ranked) / eta))]
+
+    def best(self) -> int:
+        # prefer the candidates that were evaluated on the most folds
+        most = max(len(self.results[c]) for c in range(len(self.candidates)))
+        evaluated = [c for c in range(len(self.candidates)) if len(self.results[c]) == most]
+        return min(evaluated, key=self.score)
+
+    def errors(self, candidate: int) -> ErrorMetrics:
+        folds = list(self.results[candidate].values())
+        return ErrorMetrics(*(float(np.mean([getattr(m, f) for m in folds])) for f in ErrorMetrics._fields))
+
+
+def tune(config, workers: int | None = None, budget=None, from_snapshot: str | None = None):
+    """
+    Searches the parameter ranges in the `tune` section of the config with
+    blocked time series cross validation and successive halving, then refits
+    the best candidate of every (pipeline, model) on all data and writes it
+    in the same layout as train. The data is read from `from_snapshot`
+    instead of prometheus when given.
+    """
+    tune_config = config.get("tune") or {}
+    folds = tune_config.get("folds", DEFAULT_FOLDS)
+    eta = tune_config.get("eta", DEFAULT_ETA)
+    metric = tune_config.get("metric", DEFAULT_METRIC)
+    n_candidates = tune_config.get("candidates", DEFAULT_CANDIDATES)
+    budget = parse_duration(budget or tune_config.get("budget", DEFAULT_BUDGET))
+    spaces = tune_config.get("models") or config["train"]["models"]
+
+    if metric not in ErrorMetrics._fields:
+        raise ValueError(f"Invalid metric {metric}, expected one of {ErrorMetrics._fields}")
+
+    deadline = time.monotonic() + budget
+    rng = np.random.default_rng(tune_config.get("seed", 42))
+
+    plan, df_all = fetch_training_data(config, from_snapshot=from_snapshot)
+    arr = df_all.to_numpy(dtype=np.float64)
+    columns = {c: i for i, c in enumerate(df_all.columns)}
+    targets = [columns[c] for c in plan.targets.values()]
+    splits = blocked_splits(len(arr), folds)
+
+    pipelines = config["train"]["pipelines"]
+    searches = []
+    inputs = []
+    for pipeline in pipelines:
+        features = plan.columns[pipeline["name"]]
+        for model, space in spaces.items():
+            searches.append(Search(pipeline["name"], model, sample_space(space, n_candidates, rng), metric))
+            inputs.append(([columns[c] for c in features.values()], list(features.keys())))
+
+    total = sum(len(s.candidates) for s in searches)
+    workers = pool_size(config, workers, total * folds)
+    threads = parallel.threads_per_job(workers)
+    logger.info(f"tuning {total} candidates of {len(searches)} models on {workers} workers, budget {budget}s")
+
+    with parallel.Pool(arr, workers) as pool:
+        for r, n_folds in enumerate(schedule := rungs(folds, eta)):
+            # the most recent folds train on the most data and are evaluated first
+            rung_folds = list(range(folds - n_folds, folds))
+            trials = [
+                Trial(
+                    search=s,
+                    candidate=c,
+                    fold=f,
+                    model=search.model,
+                    params=search.candidates[c],
+                    columns=inputs[s][0],
+                    features=inputs[s][1],
+                    targets=targets,
+                    split=splits[f],
+                    threads=threads,
+                )
+                for s, search in enumerate(searches)
+                for c in search.alive
+                for f in rung_folds
+                if f not in search.results[c]
+            ]
+            # interleave the searches so that all of them make progress when
+            # the budget runs out
+            trials.sort(key=lambda t: (searches[t.search].alive.index(t.candidate), t.fold, t.search))
+
+            pending: dict[Future, Trial] = {}
+            out_of_time = False
+            for trial in trials:
+                if time.monotonic() > deadline:
+                    out_of_time = True
+                    break
+                pending[pool.submit(evaluate, trial)] = trial
+
+            while pending:
+                done, _ = wait(pending, timeout=max(0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    trial = pending.pop(future)
+                    searches[trial.search].results[trial.candidate][trial.fold] = future.result()
+
+            if pending or out_of_time:
+                # running trials would hold up the refits, stop them
+                logger.warning(f"budget of {budget}s exhausted in rung {r}, cancelling {len(pending)} trials")
+                pool.terminate()
+                break
+
+            if r < len(schedule) - 1:
+                for search in searches:
+                    search.halve(eta)
+
+        train_path = pathlib.Path(config["train"]["path"])
+        summary: dict[str, dict[str, typing.Any]] = {}
+        refits = []
+        for s, search in enumerate(searches):
+            if not any(search.results.values()):
+                logger.warning(f"no candidate of {search.pipeline}/{search.model} evaluated within budget, skipping")
+                continue
+
+            best = search.best()
+            model_path = train_path / search.pipeline / "models"
+            os.makedirs(model_path, exist_ok=True)
+
+            job = Refit(
+                model=search.model,
+                params=search.candidates[best],
+                columns=inputs[s][0],
+                features=inputs[s][1],
+                targets=targets,
+                model_path=str(model_path),
+                threads=threads,
+            )
+            refits.append(pool.submit(refit, job))
+
+            errors = search.errors(best)
+            save_to_json(errors._asdict(), model_path / f"{search.model}_model_error.json")
+            summary.setdefault(search.pipeline, {})[search.model] = {
+                "params": search.candidates[best],
+                "folds": len(search.results[best]),
+                "errors": errors._asdict(),
+            }
+
+        for future in refits:
+            future.result()
+
+    watermark = stats.Watermark(float(df_all.index[-1]), len(df_all))
+    for pipeline, models in summary.items():
+        base_path = train_path / pipeline
+        for model in models:
+            stats.write_watermark(base_path / "models", model, watermark)
+        save_to_json({m: r["errors"] for m, r in models.items()}, base_path / "model_errors.json")
+        save_to_json(models, base_path / "tuning.json")
+
+        table = [[m, r["folds"], r["errors"][metric], r["params"]] for m, r in models.items()]
+        print(f"              {pipeline}")
+        print("----------------------------------")
+        print(tabulate(table, headers=["Name", "Folds", metric.upper(), "Params"], tablefmt="tabulate"))
@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from power_model.trainer import artifact
+from power_model.trainer.compiled import Fallback, compile_pipeline
+from power_model.trainer.runner import pipeline_for_model_name
+
+FEATURES = ["cpu_time", "page_cache_hits"]
+
+PARAMS = {
+    "linear": {},
+    "polynomial": {"degree": 3},
+    "xgboost": {"n_estimators": 10, "max_depth": 3, "objective": "reg:squarederror", "random_state": 42},
+}
+
+
+def training_data(targets: int) -> tuple[pd.DataFrame, pd.Series | pd.DataFrame]:
+    rng = np.random.default_rng(9)
+    X = pd.DataFrame(rng.uniform(0, 500, size=(200, 2)), columns=FEATURES)
+    y = pd.DataFrame({f"t{t}": (t + 1) * X["cpu_time"] + 0.1 * X["page_cache_hits"] ** 1.5 for t in range(targets)})
+    return X, y.iloc[:, 0] if targets == 1 else y
+
+
+def mapped(arr: np.ndarray) -> np.ndarray:
+    """The array at the bottom of the views of arr."""
+    while arr.base is not None and not isinstance(arr, np.memmap):
+        arr = arr.base
+    return arr
+
+
+@pytest.mark.parametrize("targets", [1, 3])
+@pytest.mark.parametrize("name", list(PARAMS))
+def test_round_trip(tmp_path, name: str, targets: int):
+    X, y = training_data(targets)
+    pipeline = pipeline_for_model_name(name, PARAMS[name]).fit(X, y)
+
+    artifact.export(pipeline, tmp_path, name)
+    loaded = artifact.load(artifact.artifact_path(tmp_path, name))
+
+    compiled = compile_pipeline(pipeline)
+    assert type(loaded) is type(compiled)
+    assert loaded.features == FEATURES
+    np.testing.assert_array_equal(loaded.predict(X.to_numpy()), compiled.predict(X.to_numpy()))
+
+
+def test_arrays_are_read_only_views_of_the_file(tmp_path):
+    X, y = training_data(1)
+    pipeline = pipeline_for_model_name("xgboost", PARAMS["xgboost"]).fit(X, y)
+    path = artifact.artifact_path(tmp_path, "xgboost")
+
+    artifact.export(pipeline, tmp_path, "xgboost")
+    loaded = artifact.load(path)
+
+    assert not loaded.value.flags.writeable
+    assert isinstance(mapped(loaded.value), np.memmap)
+    # every array starts aligned
+    assert all(a.ctypes.data % artifact.ALIGNMENT == 0 for a in (loaded.roots, loaded.threshold, loaded.children))
+
+
+def test_fallback_removes_a_stale_artifact(tmp_path):
+    X, y = training_data(1)
+    path = artifact.artifact_path(tmp_path, "linear")
+    artifact.export(pipeline_for_model_name("linear", {}).fit(X, y), tmp_path, "linear")
+    assert path.exists()
+
+    odd = Pipeline([("a", StandardScaler()), ("b", StandardScaler()), ("linear", LinearRegression())]).fit(X, y)
+    artifact.export(odd, tmp_path, "linear")
+
+    assert not path.exists()
+    with pytest.raises(ValueError):
+        artifact.save(Fallback(FEATURES, odd), path)
+
+
+def test_load_rejects_other_files(tmp_path):
+    path = tmp_path / "linear_model.pm"
+    path.write_bytes(b"not a model at all")
+
+    with pytest.raises(ValueError):
+        artifact.load(path)
@@ -0,0 +1,93 @@
+import numpy as np
+
+from power_model.datasource.cache import Entry, Interval, RangeCache
+
+URL = "http://prometheus:9090"
+
+
+def entry(covered: list[tuple[float, float]], step: float = 1.0) -> Entry:
+    e = Entry.empty()
+    for start, end in covered:
+        ts = np.arange(start, end + step, step)
+        e.splice(start, end, step, ts, ts * 10)
+    return e
+
+
+def test_missing_of_empty_entry():
+    assert Entry.empty().missing(0, 10, 1) == [Interval(0, 10)]
+
+
+def test_missing_around_covered_intervals():
+    e = entry([(5, 10), (20, 30)])
+
+    assert e.missing(0, 40, 1) == [Interval(0, 4), Interval(11, 19), Interval(31, 40)]
+    assert e.missing(6, 9, 1) == []
+    assert e.missing(8, 25, 1) == [Interval(11, 19)]
+    assert e.missing(12, 15, 1) == [Interval(12, 15)]
+
+
+def test_missing_on_a_coarse_step():
+    e = entry([(10, 20)], step=5)
+
+    assert e.missing(0, 30, 5) == [Interval(0, 5), Interval(25, 30)]
+
+
+def test_splice_merges_adjacent_intervals():
+    e = entry([(0, 4), (10, 14)])
+
+    e.splice(5, 9, 1, np.arange(5.0, 10), np.full(5, -1.0))
+
+    assert e.covered == [Interval(0, 14)]
+    np.testing.assert_array_equal(e.timestamps, np.arange(0, 15))
+    np.testing.assert_array_equal(e.values[5:10], -1)
+    np.testing.assert_array_equal(e.values[:5], np.arange(0, 5) * 10)
+
+
+def test_splice_replaces_samples():
+    e = entry([(0, 10)])
+
+    # a gap in the new samples removes the old ones there
+    e.splice(3, 6, 1, np.array([3.0, 6]), np.array([-3.0, -6]))
+
+    assert e.covered == [Interval(0, 10)]
+    np.testing.assert_array_equal(e.timestamps, [0, 1, 2, 3, 6, 7, 8, 9, 10])
+    np.testing.assert_array_equal(e.values[3:5], [-3, -6])
+
+
+def test_cache_round_trip_over_segments(tmp_path):
+    cache = RangeCache(tmp_path, segment_points=10)
+    key = cache.key(URL, "up", 1.0, 0)
+    stored = entry([(5, 34)])
+
+    files = cache.store(key, "up", stored, 5, 34, 1.0)
+
+    # segments of 10 points, 0..9, 10..19, 20..29 and 30..39
+    assert len(files) == 4
+    loaded = cache.load(key, 12, 25, 1.0)
+    assert loaded.covered == [Interval(10, 29)]
+    np.testing.assert_array_equal(loaded.timestamps, np.arange(10, 30))
+    assert loaded.missing(12, 25, 1.0) == []
+
+    loaded = cache.load(key, 0, 50, 1.0)
+    assert loaded.covered == [Interval(5, 34)]
+    np.testing.assert_array_equal(loaded.values, stored.values)
+
+
+def test_cache_keys_by_server_query_and_grid_offset():
+    key = RangeCache.key(URL, "up", 2.0, 10)
+
+    assert key == RangeCache.key(URL, "up", 2.0, 100)
+    assert key != RangeCache.key(URL, "up", 2.0, 11)
+    assert key != RangeCache.key(URL, "down", 2.0, 10)
+    assert key != RangeCache.key("http://other:9090", "up", 2.0, 10)
+
+
+def test_evict_keeps_stored_files(tmp_path):
+    cache = RangeCache(tmp_path, max_bytes=1, segment_points=10)
+    old = cache.store(cache.key(URL, "old", 1.0, 0), "old", entry([(0, 9)]), 0, 9, 1.0)
+    new = cache.store(cache.key(URL, "new", 1.0, 0), "new", entry([(0, 19)]), 0, 19, 1.0)
+
+    cache.evict(keep=new)
+
+    assert not old[0].exists()
+    assert all(f.exists() for f in new)
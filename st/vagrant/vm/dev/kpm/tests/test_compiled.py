@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.linear_model import LinearRegression
+from sklearn.pipeline import Pipeline
+from sklearn.preprocessing import StandardScaler
+
+from power_model.trainer.compiled import Fallback, Linear, Polynomial, Trees, compile_pipeline
+from power_model.trainer.runner import pipeline_for_model_name
+
+FEATURES = ["cpu_time", "page_cache_hits"]
+TARGETS = ["package", "core", "dram"]
+
+PARAMS = {
+    "linear": {},
+    "polynomial": {"degree": 2},
+    "xgboost": {"n_estimators": 20, "max_depth": 4, "objective": "reg:squarederror", "random_state": 42},
+}
+
+COMPILED = {"linear": Linear, "polynomial": Polynomial, "xgboost": Trees}
+
+
+def training_data(targets: int) -> tuple[pd.DataFrame, pd.DataFrame | pd.Series]:
+    rng = np.random.default_rng(7)
+    X = pd.DataFrame(rng.uniform(0, 1000, size=(300, len(FEATURES))), columns=FEATURES)
+    y = pd.DataFrame(
+        {t: 20 + (i + 1) * 0.05 * X["cpu_time"] + 0.01 * X["page_cache_hits"] ** 1.2 for i, t in enumerate(TARGETS)}
+    )
+    y = y.iloc[:, :targets]
+    return X, y.iloc[:, 0] if targets == 1 else y
+
+
+def assert_same_predictions(pipeline: Pipeline, X: pd.DataFrame):
+    compiled = compile_pipeline(pipeline)
+    expected = pipeline.predict(X)
+    actual = compiled.predict(X.to_numpy())
+
+    assert compiled.features == FEATURES
+    assert actual.shape == expected.shape
+    # xgboost predicts in float32
+    np.testing.assert_allclose(actual, expected, rtol=1e-5, atol=1e-3)
+
+
+@pytest.mark.parametrize("targets", [1, 3])
+@pytest.mark.parametrize("name", list(PARAMS))
+def test_compiled_predicts_like_the_pipeline(name: str, targets: int):
+    X, y = training_data(targets)
+    pipeline = pipeline_for_model_name(name, PARAMS[name]).fit(X, y)
+
+    assert isinstance(compile_pipeline(pipeline), COMPILED[name])
+    assert_same_predictions(pipeline, X)
+
+
+@pytest.mark.parametrize("targets", [1, 3])
+def test_linear_without_intercept(targets: int):
+    X, y = training_data(targets)
+    pipeline = pipeline_for_model_name("linear", {"fit_intercept": False}).fit(X, y)
+
+    compiled = compile_pipeline(pipeline)
+    assert np.shape(compiled.intercept) == (() if targets == 1 else (targets,))
+    assert_same_predictions(pipeline, X)
+
+
+def test_missing_values_follow_the_default_branch():
+    X, y = training_data(1)
+    pipeline = pipeline_for_model_name("xgboost", PARAMS["xgboost"]).fit(X, y)
+
+    X.iloc[::3, 0] = np.nan
+    X.iloc[1::5, 1] = np.nan
+    assert_same_predictions(pipeline, X)
+
+
+def test_unknown_pipelines_fall_back_to_sklearn():
+    X, y = training_data(1)
+    pipeline = Pipeline([("scaler", StandardScaler()), ("scaler2", StandardScaler()), ("linear", LinearRegression())])
+    pipeline.fit(X, y)
+
+    assert isinstance(compile_pipeline(pipeline), Fallback)
+    assert_same_predictions(pipeline, X)
@@ -0,0 +1,169 @@
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from power_model.cli.estimator import (
+    LENGTH_PREFIX,
+    MAX_REQUEST_SIZE,
+    Batcher,
+    FramingError,
+    MalformedRequest,
+    decode_request,
+    read_request,
+)
+
+REQUEST = json.dumps(
+    {
+        "metrics": ["bpf_cpu_time_ms", "bpf_page_cache_hit"],
+        "values": [[600.0, 40.0], [700.0, 50.0]],
+        "output_type": "ContainerComponentPower",
+        "source": "rapl",
+        "system_features": ["cpu_architecture"],
+        "system_values": ["Sapphire Rapids"],
+        "name": "é",
+    },
+    ensure_ascii=False,
+).encode()
+
+
+def framed(payload: bytes) -> bytes:
+    return LENGTH_PREFIX.pack(len(payload)) + payload
+
+
+def read_all(*chunks: bytes) -> list[tuple[bytes, bool]]:
+    """Feeds the chunks to a connection and reads requests until it is closed."""
+
+    async def run():
+        reader = asyncio.StreamReader()
+        for chunk in chunks:
+            reader.feed_data(chunk)
+        reader.feed_eof()
+
+        buffer = bytearray()
+        requests = []
+        while (request := await read_request(reader, buffer)) is not None:
+            requests.append(request)
+        return requests
+
+    return asyncio.run(run())
+
+
+def test_unframed():
+    assert read_all(REQUEST) == [(REQUEST, False)]
+
+
+def test_unframed_split_across_reads():
+    # split inside a string, a number and a multi byte character
+    cuts = [5, REQUEST.index(b"600") + 1, REQUEST.index("é".encode()) + 1]
+    chunks = [REQUEST[i:j] for i, j in zip([0, *cuts], [*cuts, len(REQUEST)])]
+
+    assert read_all(*chunks) == [(REQUEST, False)]
+
+
+def test_unframed_pipelined():
+    assert read_all(REQUEST + b"\n" + REQUEST) == [(REQUEST, False), (REQUEST, False)]
+
+
+def test_length_prefixed():
+    data = framed(REQUEST)
+
+    assert read_all(data) == [(REQUEST, True)]
+    assert read_all(data[:2], data[2:10], data[10:]) == [(REQUEST, True)]
+    assert read_all(data + REQUEST) == [(REQUEST, True), (REQUEST, False)]
+
+
+@pytest.mark.parametrize("data", [b'{"metrics" []}', b"{]", b'{"a": 1 2}', b'{"a": nope}'])
+def test_malformed(data: bytes):
+    with pytest.raises(MalformedRequest):
+        read_all(data)
+
+
+@pytest.mark.parametrize("data", [REQUEST[:-1], b'{"a": tru', b'{"a": "b', framed(REQUEST)[:-1]])
+def test_truncated(data: bytes):
+    with pytest.raises(FramingError) as e:
+        read_all(data)
+    assert not isinstance(e.value, MalformedRequest)
+
+
+def test_oversized_frame():
+    with pytest.raises(FramingError):
+        read_all(LENGTH_PREFIX.pack(MAX_REQUEST_SIZE + 1))
+
+
+def test_decode_request():
+    request = decode_request(REQUEST)
+
+    assert request.metrics == ("bpf_cpu_time_ms", "bpf_page_cache_hit")
+    assert request.values.tolist() == [[600.0, 40.0], [700.0, 50.0]]
+    assert request.meta["cpu_architecture"] == "Sapphire Rapids"
+    assert request.meta["output_type"] == "ContainerComponentPower"
+
+
+class Model:
+    """Predicts the sum of each row and records the batches it was called with."""
+
+    def __init__(self, fail: bool = False):
+        self.calls: list[tuple[str, int]] = []
+        self.fail = fail
+
+    def __call__(self, key: str, X: np.ndarray) -> np.ndarray:
+        self.calls.append((key, len(X)))
+        if self.fail:
+            raise RuntimeError("model failed")
+        return X.sum(axis=1)
+
+
+def predict_all(model: Model, requests: list[tuple[str, np.ndarray]], window: float, max_batch: int):
+    async def run():
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            batcher = Batcher(model, executor, window=window, max_batch=max_batch)
+            return await asyncio.gather(*(batcher.predict(key, X) for key, X in requests), return_exceptions=True)
+
+    return asyncio.run(run())
+
+
+def rows(first: int, n: int) -> np.ndarray:
+    return np.arange(first, first + 2 * n, dtype=np.float64).reshape(n, 2)
+
+
+def test_batcher_predicts_concurrent_requests_at_once():
+    model = Model()
+    requests = [("vm", rows(0, 1)), ("vm", rows(10, 3)), ("vm", rows(100, 2))]
+
+    results = predict_all(model, requests, window=0.01, max_batch=256)
+
+    assert model.calls == [("vm", 6)]
+    for (_, X), y in zip(requests, results):
+        np.testing.assert_array_equal(y, X.sum(axis=1))
+
+
+def test_batcher_batches_by_key():
+    model = Model()
+    requests = [("vm", rows(0, 1)), ("metal", rows(10, 2)), ("vm", rows(20, 1))]
+
+    results = predict_all(model, requests, window=0.01, max_batch=256)
+
+    assert sorted(model.calls) == [("metal", 2), ("vm", 2)]
+    for (_, X), y in zip(requests, results):
+        np.testing.assert_array_equal(y, X.sum(axis=1))
+
+
+def test_batcher_flushes_a_full_batch_without_waiting():
+    model = Model()
+    requests = [("vm", rows(0, 2)) for _ in range(4)]
+
+    begin = time.monotonic()
+    predict_all(model, requests, window=60, max_batch=4)
+
+    assert time.monotonic() - begin < 10
+    assert model.calls == [("vm", 4), ("vm", 4)]
+
+
+def test_batcher_fails_every_request_of_a_failed_batch():
+    results = predict_all(Model(fail=True), [("vm", rows(0, 1)), ("vm", rows(2, 1))], window=0.01, max_batch=256)
+
+    assert all(isinstance(r, RuntimeError) for r in results)
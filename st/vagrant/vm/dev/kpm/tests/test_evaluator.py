@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from power_model.trainer.evaluator import Accumulator
+from power_model.trainer.runner import calculate_metrics
+
+
+def data(rows: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(11)
+    y = rng.uniform(10, 200, size=rows) + 1e4
+    return y, y + rng.normal(scale=5, size=rows)
+
+
+def assert_same_metrics(acc: Accumulator, y: np.ndarray, y_pred: np.ndarray):
+    expected = calculate_metrics(y, y_pred)
+    actual = acc.result()
+
+    assert acc.n == len(y)
+    for field in expected._fields:
+        assert getattr(actual, field) == pytest.approx(getattr(expected, field), rel=1e-9), field
+
+
+def test_single_update():
+    y, y_pred = data(500)
+
+    acc = Accumulator()
+    acc.update(y, y_pred)
+
+    assert_same_metrics(acc, y, y_pred)
+
+
+def test_chunked_updates():
+    y, y_pred = data(1000)
+
+    acc = Accumulator()
+    for start in range(0, 1000, 77):
+        acc.update(y[start : start + 77], y_pred[start : start + 77])
+
+    assert_same_metrics(acc, y, y_pred)
+
+
+def test_merge():
+    y, y_pred = data(600)
+
+    parts = []
+    for rows in np.array_split(np.arange(600), [1, 250, 251]):
+        part = Accumulator()
+        part.update(y[rows], y_pred[rows])
+        parts.append(part)
+
+    acc = Accumulator()
+    for part in parts:
+        acc.merge(part)
+
+    assert_same_metrics(acc, y, y_pred)
+
+
+def test_empty_updates_are_ignored():
+    y, y_pred = data(10)
+
+    acc = Accumulator()
+    acc.update(y[:0], y_pred[:0])
+    acc.merge(Accumulator())
+    acc.update(y, y_pred)
+
+    assert_same_metrics(acc, y, y_pred)
+
+
+def test_r2_needs_more_than_5_samples():
+    y, y_pred = data(5)
+
+    acc = Accumulator()
+    acc.update(y, y_pred)
+
+    assert acc.result().r2 == 0.0
+    assert_same_metrics(acc, y, y_pred)
+
+
+def test_mape_skips_zero_targets():
+    y = np.array([0.0, 10, 20, 0, 40])
+    y_pred = np.array([1.0, 11, 18, 2, 40])
+
+    acc = Accumulator()
+    acc.update(y, y_pred)
+
+    assert acc.zeros == 2
+    nonzero = y != 0
+    assert acc.result().mape == pytest.approx(calculate_metrics(y[nonzero], y_pred[nonzero]).mape)
+    assert np.isnan(Accumulator().result().mape)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+
+from power_model.trainer.memo import PredictionCache
+
+FEATURES = ["cpu_time", "page_cache_hits"]
+KEY = ("kepler-vm-cpu", "xgboost")
+
+
+class Model:
+    """Predicts 2 * cpu_time + page_cache_hits, or one column per target, and records its inputs."""
+
+    def __init__(self, targets: int = 1):
+        self.targets = targets
+        self.calls: list[np.ndarray] = []
+
+    def __call__(self, X: np.ndarray) -> np.ndarray:
+        self.calls.append(X.copy())
+        y = 2 * X[:, 0] + X[:, 1]
+        return y if self.targets == 1 else np.column_stack([y * (t + 1) for t in range(self.targets)])
+
+
+def test_predicts_only_missing_rows():
+    cache = PredictionCache()
+    model = Model()
+
+    first = cache.predict(KEY, FEATURES, np.array([[1.0, 2], [3, 4]]), model)
+    second = cache.predict(KEY, FEATURES, np.array([[3.0, 4], [5, 6], [1, 2]]), model)
+
+    np.testing.assert_array_equal(first, [4, 10])
+    np.testing.assert_array_equal(second, [10, 16, 4])
+    assert [len(X) for X in model.calls] == [2, 1]
+    np.testing.assert_array_equal(model.calls[1], [[5, 6]])
+    assert cache.stats() == {"size": 3, "hits": 2, "misses": 3, "evictions": 0}
+
+
+def test_fully_cached_batch_does_not_predict():
+    cache = PredictionCache()
+    model = Model()
+    X = np.array([[1.0, 2], [3, 4]])
+
+    cache.predict(KEY, FEATURES, X, model)
+    y = cache.predict(KEY, FEATURES, X, model)
+
+    np.testing.assert_array_equal(y, [4, 10])
+    assert len(model.calls) == 1
+
+
+def test_entries_are_per_model():
+    cache = PredictionCache()
+    model = Model()
+    X = np.array([[1.0, 2]])
+
+    cache.predict(KEY, FEATURES, X, model)
+    cache.predict(("kepler-vm-cpu", "linear"), FEATURES, X, model)
+
+    assert len(model.calls) == 2
+
+
+def test_quantized_rows_share_an_entry():
+    cache = PredictionCache(precision={"cpu_time": 10})
+    model = Model()
+
+    first = cache.predict(KEY, FEATURES, np.array([[101.0, 1]]), model)
+    second = cache.predict(KEY, FEATURES, np.array([[96.0, 1]]), model)
+
+    # the model predicts on the rounded values, whichever arrived first
+    np.testing.assert_array_equal(model.calls[0], [[100, 1]])
+    np.testing.assert_array_equal(first, second)
+    assert len(model.calls) == 1
+    # features without a precision are exact
+    cache.predict(KEY, FEATURES, np.array([[100.0, 1.5]]), model)
+    assert len(model.calls) == 2
+
+
+def test_least_recently_used_rows_are_evicted():
+    cache = PredictionCache(max_size=2)
+    model = Model()
+
+    cache.predict(KEY, FEATURES, np.array([[1.0, 0]]), model)
+    cache.predict(KEY, FEATURES, np.array([[2.0, 0]]), model)
+    # touch the first row, the second one is evicted instead
+    cache.predict(KEY, FEATURES, np.array([[1.0, 0]]), model)
+    cache.predict(KEY, FEATURES, np.array([[3.0, 0]]), model)
+
+    assert cache.stats()["evictions"] == 1
+    cache.predict(KEY, FEATURES, np.array([[1.0, 0], [2.0, 0]]), model)
+    np.testing.assert_array_equal(model.calls[-1], [[2, 0]])
+
+
+def test_several_targets():
+    cache = PredictionCache()
+    model = Model(targets=3)
+
+    cache.predict(KEY, FEATURES, np.array([[1.0, 2]]), model)
+    y = cache.predict(KEY, FEATURES, np.array([[1.0, 2], [0, 1]]), model)
+
+    np.testing.assert_array_equal(y, [[4, 8, 12], [1, 2, 3]])
+
+
+def test_from_config():
+    cache = PredictionCache.from_config({"size": 8, "precision": {"cpu_time": 0.5}})
+
+    assert cache.max_size == 8
+    assert cache.precision == {"cpu_time": 0.5}
+    with pytest.raises(ValueError):
+        PredictionCache(max_size=0)
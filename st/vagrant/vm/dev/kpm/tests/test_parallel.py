@@ -0,0 +1,105 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from power_model.trainer import parallel
+from power_model.trainer.parallel import Job, Pool, SharedArray
+
+
+def column_sum(arr: np.ndarray, column: int) -> float:
+    return float(arr[:, column].sum())
+
+
+def pid(arr: np.ndarray, job) -> int:
+    return os.getpid()
+
+
+def sleep(arr: np.ndarray, seconds: float) -> float:
+    time.sleep(seconds)
+    return seconds
+
+
+def fail(arr: np.ndarray, job):
+    raise ValueError(f"job {job} failed")
+
+
+DATA = np.arange(12, dtype=np.float64).reshape(4, 3)
+
+
+def test_shared_array_round_trip():
+    shm, desc = SharedArray.create(DATA)
+    try:
+        attached, arr = desc.attach()
+        np.testing.assert_array_equal(arr, DATA)
+        assert arr.dtype == DATA.dtype
+        del arr
+        attached.close()
+    finally:
+        shm.close()
+        shm.unlink()
+
+
+def test_inline_pool():
+    with Pool(DATA, workers=1) as pool:
+        assert pool.submit(column_sum, 1).result() == 22.0
+        assert pool.submit(pid, None).result() == os.getpid()
+        with pytest.raises(ValueError):
+            pool.submit(fail, 1).result()
+        # nothing to terminate
+        pool.terminate()
+
+
+def test_process_pool():
+    with Pool(DATA, workers=2) as pool:
+        futures = [pool.submit(column_sum, c) for c in range(3)]
+        assert [f.result() for f in futures] == [18.0, 22.0, 26.0]
+        assert pool.submit(pid, None).result() != os.getpid()
+        with pytest.raises(ValueError):
+            pool.submit(fail, 1).result()
+
+
+def test_terminate_kills_running_jobs():
+    begin = time.monotonic()
+    with Pool(DATA, workers=2) as pool:
+        # start the workers before the long jobs so that they are running
+        [f.result() for f in [pool.submit(pid, None) for _ in range(2)]]
+        for _ in range(4):
+            pool.submit(sleep, 60)
+        time.sleep(0.5)
+
+        pool.terminate()
+
+        # new workers run the next jobs and exiting does not wait for the killed ones
+        assert pool.submit(column_sum, 0).result(timeout=60) == 18.0
+    assert time.monotonic() - begin < 50
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_train_jobs(tmp_path, workers: int):
+    rng = np.random.default_rng(5)
+    X = rng.uniform(0, 100, size=(200, 2))
+    data = np.column_stack([X, 3 * X[:, 0] + X[:, 1] + 10])
+    jobs = [
+        Job(
+            pipeline="kepler-vm-cpu",
+            model=model,
+            params={},
+            columns=[0, 1],
+            features=["cpu_time", "page_cache_hits"],
+            targets=[2],
+            target_names=["package"],
+            model_path=str(tmp_path),
+            threads=1,
+        )
+        for model in ("linear", "polynomial")
+    ]
+
+    results = parallel.train_jobs(data, jobs, workers)
+
+    assert len(results) == 2
+    for job, (metrics, stages) in zip(jobs, results):
+        assert metrics.mae < 1e-6
+        assert (tmp_path / f"{job.model}_model.joblib").exists()
+        assert (tmp_path / f"{job.model}_model_error.json").exists()
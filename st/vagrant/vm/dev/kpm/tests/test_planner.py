@@ -0,0 +1,96 @@
+from datetime import UTC, datetime
+
+import numpy as np
+import pandas as pd
+
+from power_model.trainer.planner import TARGET, QueryPlan
+
+CPU = 'sum(rate(kepler_process_bpf_cpu_time_ms_total{job="vm"}[12s]))'
+CPU_IRATE = 'sum(irate(kepler_process_bpf_cpu_time_ms_total{job="vm"}[6s]))'
+CACHE = 'sum(rate(kepler_process_bpf_page_cache_hit_total{job="vm"}[12s]))'
+PACKAGE = 'sum(rate(kepler_vm_package_joules_total{job="metal"}[12s]))'
+DRAM = 'sum(rate(kepler_vm_dram_joules_total{job="metal"}[12s]))'
+
+PIPELINES = [
+    {"name": "rate", "features": {"cpu_time": CPU, "page_cache_hits": CACHE}},
+    # the same expressions up to whitespace are queried once
+    {"name": "irate", "features": {"cpu_time": CPU_IRATE, "page_cache_hits": f"  {CACHE}\n"}},
+    {"name": "dup", "features": {"cpu": CPU}},
+]
+
+
+class Source:
+    """Records the queries and answers with one column per query."""
+
+    def __init__(self):
+        self.calls = []
+
+    def range_query(self, start, end, step, **queries):
+        self.calls.append(("range", start, end, step, queries))
+        return frame(queries)
+
+    def instant_query(self, at, **queries):
+        self.calls.append(("instant", at, queries))
+        return frame(queries).iloc[:1]
+
+    def close(self):
+        pass
+
+
+def frame(queries: dict[str, str]) -> pd.DataFrame:
+    return pd.DataFrame(
+        {column: np.arange(3.0) + i * 10 for i, column in enumerate(queries)},
+        index=pd.Index([100, 101, 102], name="timestamp"),
+    )
+
+
+def test_unique_queries():
+    plan = QueryPlan(PIPELINES, PACKAGE)
+
+    assert plan.queries == {TARGET: PACKAGE, "q0": CPU, "q1": CACHE, "q2": CPU_IRATE}
+    assert plan.targets == {"package": TARGET}
+    assert plan.columns == {
+        "rate": {"cpu_time": "q0", "page_cache_hits": "q1"},
+        "irate": {"cpu_time": "q2", "page_cache_hits": "q1"},
+        "dup": {"cpu": "q0"},
+    }
+
+
+def test_several_targets():
+    plan = QueryPlan(PIPELINES, PACKAGE, {"package": PACKAGE, "dram": DRAM, "core": PACKAGE})
+
+    assert plan.targets == {"package": TARGET, "dram": f"{TARGET}_dram", "core": TARGET}
+    assert list(plan.queries)[:2] == [TARGET, f"{TARGET}_dram"]
+
+
+def test_from_config():
+    plan = QueryPlan.from_config({"train": {"pipelines": PIPELINES, "target": PACKAGE}})
+
+    assert plan.queries[TARGET] == PACKAGE
+    assert set(plan.columns) == {"rate", "irate", "dup"}
+
+
+def test_one_query_per_window():
+    plan = QueryPlan(PIPELINES, PACKAGE)
+    source = Source()
+    start, end = datetime(2024, 10, 23, 5, tzinfo=UTC), datetime(2024, 10, 23, 6, tzinfo=UTC)
+
+    df = plan.range_query(source, start, end, "1s")
+    plan.instant_query(source, end)
+
+    assert source.calls == [("range", start, end, "1s", plan.queries), ("instant", end, plan.queries)]
+    assert list(df.columns) == list(plan.queries)
+
+
+def test_pipeline_features_and_frame():
+    plan = QueryPlan(PIPELINES, PACKAGE, {"package": PACKAGE, "dram": DRAM})
+    df = frame(plan.queries)
+
+    features = plan.features(df, "irate")
+    assert list(features.columns) == ["cpu_time", "page_cache_hits"]
+    np.testing.assert_array_equal(features["cpu_time"], df["q2"])
+    np.testing.assert_array_equal(features["page_cache_hits"], df["q1"])
+
+    full = plan.frame(df, "dup")
+    assert list(full.columns) == ["cpu", TARGET, f"{TARGET}_dram"]
+    assert full.index.equals(df.index)
@@ -0,0 +1,86 @@
+import json
+
+import numpy as np
+import pytest
+
+from power_model.datasource.prometheus import Grid, decode_matrix
+
+
+def matrix(*series: list[tuple[float, str]]) -> str:
+    result = [
+        {"metric": {"instance": str(i)}, "values": [list(sample) for sample in samples]}
+        for i, samples in enumerate(series)
+    ]
+    return json.dumps({"status": "success", "data": {"resultType": "matrix", "result": result}})
+
+
+def test_decode_matrix():
+    text = matrix([(100, "1.5"), (101, "2")], [(100.5, "-3e2")])
+
+    series = decode_matrix(text)
+
+    assert len(series) == 2
+    np.testing.assert_array_equal(series[0], [[100, 1.5], [101, 2]])
+    np.testing.assert_array_equal(series[1], [[100.5, -300]])
+
+
+def test_decode_matrix_special_values():
+    (series,) = decode_matrix(matrix([(1, "NaN"), (2, "+Inf"), (3, "-Inf"), (4, "0")]))
+
+    np.testing.assert_array_equal(series[:, 0], [1, 2, 3, 4])
+    assert np.isnan(series[0, 1])
+    assert series[1, 1] == np.inf
+    assert series[2, 1] == -np.inf
+    assert series[3, 1] == 0
+
+
+def test_decode_matrix_empty_series():
+    series = decode_matrix(matrix([], [(1, "1")]))
+
+    assert series[0].shape == (0, 2)
+    assert series[1].shape == (1, 2)
+    assert decode_matrix(matrix()) == []
+
+
+def test_decode_matrix_error():
+    with pytest.raises(ValueError):
+        decode_matrix(json.dumps({"status": "error", "error": "bad query"}))
+
+
+def test_grid_aligns_columns():
+    grid = Grid(["a", "b"], start=100, step=2, size=5)
+    grid.write(0, np.array([100.0, 102, 104, 106, 108]), np.array([1.0, 2, 3, 4, 5]))
+    # off grid timestamps snap to the nearest slot, samples outside are dropped
+    grid.write(1, np.array([98.0, 102.2, 103.9, 108, 110]), np.array([0.0, 20, 30, 50, 60]))
+
+    df = grid.to_frame()
+
+    assert list(df.columns) == ["a", "b"]
+    assert list(df.index) == [102, 104, 108]
+    np.testing.assert_array_equal(df.to_numpy(), [[2, 20], [3, 30], [5, 50]])
+
+
+def test_grid_keeps_nan_and_inf_samples():
+    grid = Grid(["a", "b"], start=0, step=1, size=3)
+    grid.write(0, np.array([0.0, 1, 2]), np.array([np.nan, np.inf, 1]))
+    grid.write(1, np.array([0.0, 1, 2]), np.array([-np.inf, 2, np.nan]))
+
+    df = grid.to_frame()
+
+    # a sample that is NaN was still received, unlike a missing one
+    assert list(df.index) == [0, 1, 2]
+    assert np.isnan(df.loc[0, "a"]) and df.loc[0, "b"] == -np.inf
+    assert df.loc[1, "a"] == np.inf
+    assert np.isnan(df.loc[2, "b"])
+
+
+def test_grid_samples():
+    grid = Grid(["a"], start=10, step=5, size=4)
+    grid.write(0, np.array([10.0, 20, 25]), np.array([1.0, 2, 3]))
+
+    timestamps, values = grid.samples(0, until=20)
+
+    np.testing.assert_array_equal(timestamps, [10, 20])
+    np.testing.assert_array_equal(values, [1, 2])
+    assert grid.has_data(0)
+    assert not Grid(["a"], start=10, step=5, size=4).has_data(0)
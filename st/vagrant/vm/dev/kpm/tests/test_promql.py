@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from power_model.datasource import promql
+from power_model.datasource.promql import Aggregation, Arithmetic, Function, Matcher, Selector
+
+
+class Store:
+    """Series of counters scraped every second from t = 0."""
+
+    def __init__(self, series: dict[str, dict[promql.Labels, list[float]]]):
+        self.data = {}
+        for name, by_labels in series.items():
+            self.data[name] = {
+                labels: (np.arange(len(values), dtype=np.float64), np.asarray(values, dtype=np.float64))
+                for labels, values in by_labels.items()
+            }
+
+    def series(self, name: str):
+        return self.data.get(name, {})
+
+
+VM = (("job", "vm"), ("pid", "1"))
+VM2 = (("job", "vm"), ("pid", "2"))
+METAL = (("job", "metal"), ("pid", "3"))
+
+STORE = Store(
+    {
+        "cpu_total": {
+            VM: [0, 10, 20, 30, 40, 50],
+            VM2: [0, 5, 10, 15, 20, 25],
+            # a counter reset between t = 3 and t = 4
+            METAL: [100, 200, 300, 400, 50, 150],
+        },
+        "up": {VM: [1, 1, 1, 1, 1, 1], METAL: [1, 1, 1, 1, 1, 0]},
+    }
+)
+
+
+def test_parse():
+    expr = promql.parse('sum by (job) (rate(cpu_total{job="vm", pid!~"2|3"}[4s])) * 1000')
+
+    assert expr == Arithmetic(
+        "*",
+        Aggregation(
+            "sum",
+            ["job"],
+            Function("rate", Selector("cpu_total", [Matcher("job", "=", "vm"), Matcher("pid", "!~", "2|3")]), 4.0),
+        ),
+        1000.0,
+    )
+    assert promql.metric_names(expr) == {"cpu_total"}
+    assert promql.max_window(expr) == 4.0
+
+
+def test_parse_folds_numbers():
+    expr = promql.parse("up * (2 + 3) / 10")
+
+    assert expr == Arithmetic("/", Arithmetic("*", Selector("up", []), 5.0), 10.0)
+
+
+def test_parse_grouping_after_expression():
+    expr = promql.parse("max(up) by (job)")
+
+    assert expr == Aggregation("max", ["job"], Selector("up", []))
+
+
+@pytest.mark.parametrize(
+    "query",
+    ["", "1 + 2", "rate(up)", "up offset 5m", 'up{job=="vm"}', "sum(up", "histogram_quantile(0.9, up)", "up @ 10"],
+)
+def test_parse_unsupported(query: str):
+    with pytest.raises(ValueError):
+        promql.parse(query)
+
+
+@pytest.mark.parametrize(
+    "query, expected",
+    [
+        ('cpu_total{job="vm"}', {VM: 50.0, VM2: 25.0}),
+        ('rate(cpu_total{pid="1"}[4s])', {VM: 10.0}),
+        ('irate(cpu_total{pid="2"}[4s])', {VM2: 5.0}),
+        ('increase(cpu_total{job="vm"}[3s])', {VM: 20.0, VM2: 10.0}),
+        ('delta(cpu_total{job="metal"}[3s])', {METAL: -250.0}),
+        # the reset counts the value after it as the increase
+        ('increase(cpu_total{job="metal"}[3s])', {METAL: 150.0}),
+        ('sum(rate(cpu_total{job=~"v.*"}[5s]))', {(): 15.0}),
+        ("sum by (job) (rate(cpu_total[2s]))", {(("job", "vm"),): 15.0, (("job", "metal"),): 100.0}),
+        ("avg(cpu_total)", {(): 75.0}),
+        ("min(cpu_total)", {(): 25.0}),
+        ("count(up)", {(): 2.0}),
+        ('sum(up{job="vm"}) * 2 - 1', {(): 1.0}),
+        ("cpu_total / up", {VM: 50.0, METAL: np.inf}),
+        ("(0 - cpu_total) / up", {VM: -50.0, METAL: -np.inf}),
+    ],
+)
+def test_evaluate(query: str, expected: promql.Vector):
+    assert promql.parse(query).evaluate(STORE, at=5, lookback=300) == expected
+
+
+def test_evaluate_lookback():
+    expr = promql.parse("cpu_total")
+
+    assert expr.evaluate(STORE, at=2.5, lookback=300)[VM] == 20.0
+    # no sample within the lookback
+    assert expr.evaluate(STORE, at=20, lookback=10) == {}
+
+
+def test_evaluate_needs_two_samples_for_a_rate():
+    expr = promql.parse("rate(cpu_total[1s])")
+
+    assert expr.evaluate(STORE, at=5, lookback=300) == {}
@@ -0,0 +1,107 @@
+import joblib
+import numpy as np
+import pandas as pd
+import pytest
+
+from power_model.trainer import artifact
+from power_model.trainer.compiled import Linear
+from power_model.trainer.registry import ModelRegistry
+from power_model.trainer.runner import pipeline_for_model_name
+
+FEATURES = ["cpu_time", "page_cache_hits"]
+MODELS = [("vm", "linear"), ("vm", "xgboost"), ("metal", "linear"), ("metal", "xgboost")]
+
+
+@pytest.fixture
+def train_path(tmp_path):
+    """Trained models of every (pipeline, model), predicting its index."""
+    for i, (pipeline, model) in enumerate(MODELS):
+        model_path = tmp_path / pipeline / "models"
+        model_path.mkdir(parents=True, exist_ok=True)
+        artifact.save(Linear(FEATURES, np.zeros(2), np.array(float(i))), artifact.artifact_path(model_path, model))
+    return tmp_path
+
+
+def size(train_path, pipeline: str, model: str) -> int:
+    return artifact.artifact_path(train_path / pipeline / "models", model).stat().st_size
+
+
+def predict(model) -> float:
+    return float(model.predict(np.zeros((1, 2)))[0])
+
+
+def test_loads_on_first_use(train_path):
+    registry = ModelRegistry(train_path)
+
+    assert predict(registry.get("metal", "linear")) == 2.0
+    assert registry.get("metal", "linear") is registry.get("metal", "linear")
+    stats = registry.stats()
+    assert (stats["models"], stats["loads"], stats["hits"]) == (1, 1, 2)
+    assert stats["bytes"] == size(train_path, "metal", "linear")
+
+
+def test_missing_model(train_path):
+    with pytest.raises(FileNotFoundError):
+        ModelRegistry(train_path).get("vm", "polynomial")
+
+
+def test_evicts_least_recently_used_beyond_max_models(train_path):
+    registry = ModelRegistry(train_path, max_models=2)
+
+    registry.get("vm", "linear")
+    registry.get("vm", "xgboost")
+    registry.get("vm", "linear")
+    registry.get("metal", "linear")
+
+    assert list(registry.entries) == [("vm", "linear"), ("metal", "linear")]
+    assert registry.stats()["evictions"] == 1
+    # an evicted model is loaded again
+    registry.get("vm", "xgboost")
+    assert registry.stats()["loads"] == 4
+
+
+def test_evicts_beyond_max_bytes(train_path):
+    one = size(train_path, "vm", "linear")
+    registry = ModelRegistry(train_path, max_bytes=2 * one)
+
+    for key in MODELS:
+        registry.get(*key)
+
+    assert list(registry.entries) == MODELS[-2:]
+    assert registry.stats()["bytes"] <= 2 * one
+
+
+def test_pinned_models_are_loaded_upfront_and_kept(train_path):
+    registry = ModelRegistry(train_path, max_models=2, pinned=[("vm", "xgboost")])
+    assert list(registry.entries) == [("vm", "xgboost")]
+
+    for key in MODELS:
+        registry.get(*key)
+
+    assert ("vm", "xgboost") in registry.entries
+    assert len(registry.entries) == 2
+
+    registry.clear()
+    assert list(registry.entries) == [("vm", "xgboost")]
+
+
+def test_from_config(train_path):
+    registry = ModelRegistry.from_config(train_path, {"max_models": 3, "max_size": "1MiB", "pin": ["metal/xgboost"]})
+
+    assert registry.max_models == 3
+    assert registry.max_bytes == 1024**2
+    assert registry.pinned == {("metal", "xgboost")}
+    assert ("metal", "xgboost") in registry.entries
+
+
+def test_loads_joblib_without_an_artifact(tmp_path):
+    model_path = tmp_path / "vm" / "models"
+    model_path.mkdir(parents=True)
+    X = pd.DataFrame(np.arange(20.0).reshape(10, 2), columns=FEATURES)
+    pipeline = pipeline_for_model_name("linear", {}).fit(X, X["cpu_time"] * 2)
+    joblib.dump(pipeline, model_path / "linear_model.joblib")
+
+    model = ModelRegistry(tmp_path).get("vm", "linear")
+
+    assert isinstance(model, Linear)
+    np.testing.assert_allclose(model.predict(X.to_numpy()), pipeline.predict(X), atol=1e-9)
@@ -0,0 +1,149 @@
+import time
+
+import numpy as np
+import pytest
+import yaml
+
+from power_model.trainer import artifact
+from power_model.trainer.compiled import Linear
+from power_model.trainer.loader import load_pipeline
+from power_model.trainer.predictor import Predictor
+from power_model.trainer.reloader import Reloader, fingerprint
+
+FEATURES = ["cpu_time", "page_cache_hits"]
+
+
+def config(train_path) -> dict:
+    return {
+        "prometheus": {"url": "http://prometheus:9090"},
+        "train": {
+            "path": str(train_path),
+            "step": "1s",
+            "vars": {},
+            "pipelines": [
+                {
+                    "name": "vm",
+                    "features": {
+                        "cpu_time": 'sum(rate(kepler_process_bpf_cpu_time_ms_total{job="vm"}[12s]))',
+                        "page_cache_hits": 'sum(rate(kepler_process_bpf_page_cache_hit_total{job="vm"}[12s]))',
+                    },
+                }
+            ],
+            "target": 'sum(rate(kepler_vm_package_joules_total{job="metal"}[12s]))',
+            "models": {"linear": {"positive": True}},
+        },
+        "predict": {"default": "vm/linear"},
+    }
+
+
+def save_model(train_path, intercept: float):
+    models = train_path / "vm" / "models"
+    models.mkdir(parents=True, exist_ok=True)
+    artifact.save(Linear(FEATURES, np.zeros(2), np.array(intercept)), artifact.artifact_path(models, "linear"))
+
+
+@pytest.fixture
+def file(tmp_path):
+    """A pipeline config whose only model predicts 1."""
+    save_model(tmp_path / "train", 1.0)
+    file = tmp_path / "pipeline.yaml"
+    file.write_text(yaml.safe_dump(config(tmp_path / "train")))
+    return file
+
+
+def predict(predictor: Predictor) -> float:
+    return float(np.ravel(predictor.kepler_predict_batch(np.zeros((1, 2))))[0])
+
+
+def wait_for(condition, timeout: float = 10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reload_swaps_in_a_warmed_predictor(file, tmp_path):
+    predictor = Predictor(load_pipeline(file))
+    swapped = []
+    reloader = Reloader(file, predictor, swapped.append)
+    # the models are loaded on first use
+    assert predict(predictor) == 1.0
+
+    save_model(tmp_path / "train", 7.0)
+    assert reloader.reload()
+
+    assert len(swapped) == 1 and reloader.predictor is swapped[0]
+    assert predict(swapped[0]) == 7.0
+    # requests still running on the old predictor keep their models
+    assert predict(predictor) == 1.0
+    assert (reloader.reloads, reloader.failures) == (1, 0)
+    assert reloader.loaded == fingerprint(file, predictor.pipeline)
+
+
+@pytest.mark.parametrize(
+    "breaking",
+    [
+        lambda file, train_path: save_model(train_path, np.nan),
+        lambda file, train_path: artifact.artifact_path(train_path / "vm" / "models", "linear").unlink(),
+        lambda file, train_path: file.write_text("train: ["),
+    ],
+    ids=["predicts_nan", "missing_model", "broken_config"],
+)
+def test_reload_keeps_the_predictor_on_failure(file, tmp_path, breaking):
+    predictor = Predictor(load_pipeline(file))
+    swapped = []
+    reloader = Reloader(file, predictor, swapped.append)
+    # the models are loaded on first use
+    assert predict(predictor) == 1.0
+
+    breaking(file, tmp_path / "train")
+    assert not reloader.reload()
+
+    assert swapped == [] and reloader.predictor is predictor
+    assert predict(predictor) == 1.0
+    assert (reloader.reloads, reloader.failures) == (0, 1)
+    # only retried once the files change again
+    assert reloader.loaded == fingerprint(file, predictor.pipeline)
+
+
+def test_fingerprint_ignores_temporary_files(file, tmp_path):
+    pipeline = load_pipeline(file)
+    before = fingerprint(file, pipeline)
+
+    (tmp_path / "train" / "vm" / "models" / "linear.tmp").write_bytes(b"partial")
+    assert fingerprint(file, pipeline) == before
+
+    save_model(tmp_path / "train", 2.0)
+    (tmp_path / "train" / "vm" / "models" / "polynomial.bin").write_bytes(b"new")
+    assert fingerprint(file, pipeline) != before
+    assert len(fingerprint(file, pipeline)) == len(before) + 1
+
+
+def test_reloads_once_the_changes_settled(file, tmp_path):
+    swapped = []
+    reloader = Reloader(file, Predictor(load_pipeline(file)), swapped.append, interval=0.01, settle=0.05)
+    reloader.start()
+    try:
+        save_model(tmp_path / "train", 3.0)
+        wait_for(lambda: swapped)
+        # nothing changed since, so nothing is reloaded again
+        time.sleep(0.2)
+    finally:
+        reloader.stop()
+
+    assert reloader.reloads == 1
+    assert predict(swapped[0]) == 3.0
+
+
+def test_trigger_reloads_without_changes(file):
+    swapped = []
+    reloader = Reloader(file, Predictor(load_pipeline(file)), swapped.append, interval=60)
+    reloader.start()
+    try:
+        reloader.trigger()
+        wait_for(lambda: swapped)
+    finally:
+        reloader.stop()
+
+    assert reloader.reloads == 1
+    assert predict(swapped[0]) == 1.0
@@ -0,0 +1,150 @@
+import numpy as np
+import pytest
+
+from power_model.trainer.router import Resolved, Route, Router, parse_chain
+
+
+class Model:
+    def __init__(self, features: list[str]):
+        self.features = features
+
+
+class Registry:
+    """Models by (pipeline, model), the others fail to load."""
+
+    def __init__(self, models: dict[tuple[str, str], list[str]]):
+        self.models = {key: Model(features) for key, features in models.items()}
+        self.loads: list[tuple[str, str]] = []
+
+    def get(self, pipeline: str, model: str):
+        self.loads.append((pipeline, model))
+        if (pipeline, model) not in self.models:
+            raise FileNotFoundError(f"{pipeline}/{model}")
+        return self.models[(pipeline, model)]
+
+
+CPU = ["cpu_time"]
+BOTH = ["cpu_time", "page_cache_hits"]
+
+REGISTRY_MODELS = {
+    ("kepler-vm-cpu", "xgboost"): BOTH,
+    ("kepler-metal-cpu", "xgboost"): CPU,
+    ("kepler-metal-cpu", "linear"): CPU,
+    ("kepler-arm", "xgboost"): ["cycles"],
+}
+
+
+def router() -> Router:
+    return Router(
+        Registry(REGISTRY_MODELS),
+        routes=[
+            Route({"cpu_architecture": "Sapphire Rapids"}, parse_chain("kepler-metal-cpu/xgboost")),
+            Route({"cpu_architecture": "Sapphire Rapids", "energy_source": "rapl"}, parse_chain("kepler-none/linear")),
+            Route({"energy_source": "rapl"}, parse_chain(["kepler-none/xgboost", "kepler-metal-cpu/linear"])),
+            Route({"cpu_architecture": "Neoverse"}, parse_chain("kepler-arm/xgboost")),
+            Route({"cpu_architecture": "Zen 4"}, parse_chain("kepler-vm-cpu/xgboost"), strict=True),
+        ],
+    )
+
+
+@pytest.mark.parametrize(
+    "meta, route",
+    [
+        ({"cpu_architecture": "Sapphire Rapids", "energy_source": "rapl"}, 0),
+        ({"cpu_architecture": "Sapphire Rapids"}, 0),
+        ({"cpu_architecture": "Ice Lake", "energy_source": "rapl"}, 2),
+        ({"cpu_architecture": "Neoverse"}, 3),
+        ({"cpu_architecture": "Zen 4"}, 4),
+        ({"cpu_architecture": "Ice Lake"}, 5),
+        ({}, 5),
+    ],
+)
+def test_first_matching_route_wins(meta: dict[str, str], route: int):
+    assert router().route(meta) == route
+
+
+def test_resolve_the_first_model():
+    r = router()
+
+    assert r.resolve(0) == Resolved(("kepler-metal-cpu", "xgboost"), CPU)
+    assert r.resolve(r.default) == Resolved(("kepler-vm-cpu", "xgboost"), BOTH)
+
+
+def test_resolve_falls_back_along_the_chain():
+    r = router()
+
+    # the first model of the chain does not load
+    assert r.resolve(2) == Resolved(("kepler-metal-cpu", "linear"), CPU)
+    # no request metric provides the feature of the model, the default chain follows
+    assert r.resolve(3) == Resolved(("kepler-vm-cpu", "xgboost"), BOTH)
+
+
+def test_resolve_once():
+    r = router()
+
+    r.resolve(2)
+    r.resolve(2)
+
+    assert r.registry.loads == [("kepler-none", "xgboost"), ("kepler-metal-cpu", "linear")]
+
+
+def test_resolve_nothing():
+    r = Router(Registry({}), default=parse_chain("kepler-vm-cpu/xgboost"))
+
+    assert r.resolve(r.default) is None
+    assert r.resolve_all() == [None]
+
+
+def test_features_follow_the_model():
+    r = router()
+    resolved = r.resolve(r.default)
+    values = np.array([[1.0, 10.0, 100.0], [2.0, 20.0, 200.0]])
+
+    X = r.features(resolved, ("bpf_page_cache_hit", "other", "bpf_cpu_time_ms"), values)
+
+    np.testing.assert_array_equal(X, [[100.0, 1.0], [200.0, 2.0]])
+
+
+def test_features_missing_metric_is_zero():
+    r = router()
+
+    X = r.features(r.resolve(r.default), ("bpf_cpu_time_ms",), np.array([[5.0], [6.0]]))
+
+    np.testing.assert_array_equal(X, [[5.0, 0.0], [6.0, 0.0]])
+
+
+def test_features_missing_metric_on_a_strict_route():
+    r = router()
+    resolved = r.resolve(4)
+
+    assert resolved == Resolved(("kepler-vm-cpu", "xgboost"), BOTH, strict=True)
+    with pytest.raises(ValueError, match="bpf_page_cache_hit"):
+        r.features(resolved, ("bpf_cpu_time_ms",), np.ones((1, 1)))
+
+
+def test_from_config():
+    r = Router.from_config(
+        Registry(REGISTRY_MODELS),
+        {
+            "routes": [{"match": {"cpu_architecture": "Zen 4"}, "model": "kepler-metal-cpu/linear", "strict": True}],
+            "default": ["kepler-none/xgboost", "kepler-metal-cpu/xgboost"],
+        },
+    )
+
+    assert r.route({"cpu_architecture": "Zen 4"}) == 0
+    assert r.resolve(0) == Resolved(("kepler-metal-cpu", "linear"), CPU, strict=True)
+    assert r.resolve(r.default) == Resolved(("kepler-metal-cpu", "xgboost"), CPU)
+
+
+def test_custom_inputs():
+    r = Router(Registry(REGISTRY_MODELS), inputs={"cpu_time": "cpu_ms"})
+
+    X = r.features(r.resolve(r.default), ("bpf_page_cache_hit", "cpu_ms"), np.array([[3.0, 4.0]]))
+
+    np.testing.assert_array_equal(X, [[4.0, 3.0]])
+
+
+@pytest.mark.parametrize("value", ["kepler-vm-cpu", "/xgboost", "kepler-vm-cpu/", ["a/b", "c"]])
+def test_parse_chain_rejects_bad_models(value):
+    with pytest.raises(ValueError):
+        parse_chain(value)
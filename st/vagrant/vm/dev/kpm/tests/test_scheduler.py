@@ -0,0 +1,106 @@
+import threading
+import time
+
+import pytest
+
+from power_model.trainer import scheduler
+from power_model.trainer.scheduler import PredictionLoop, Ticker
+
+
+class Clock:
+    """A monotonic clock that only moves when told to."""
+
+    def __init__(self, now: float = 1000.0):
+        self.now = now
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch) -> Clock:
+    clock = Clock()
+    monkeypatch.setattr(scheduler, "time", clock)
+    return clock
+
+
+def test_ticks_do_not_drift(clock):
+    ticker = Ticker(2.0)
+
+    deadlines = []
+    for deadline in ticker:
+        deadlines.append(deadline)
+        # each tick takes some of its interval, the next one starts on time
+        clock.now = deadline - 0.5 if len(deadlines) % 2 else deadline
+        if len(deadlines) == 4:
+            break
+
+    assert deadlines == [1002.0, 1004.0, 1006.0, 1008.0]
+    assert ticker.skipped == 0
+
+
+def test_ticks_in_the_past_are_skipped(clock):
+    ticker = Ticker(1.0)
+
+    deadlines = []
+    for deadline in ticker:
+        deadlines.append(deadline)
+        if len(deadlines) == 1:
+            # overran by 3.5 intervals, the ticks due at 1002, 1003 and 1004 are gone
+            clock.now = deadline + 3.5
+        if len(deadlines) == 2:
+            break
+
+    assert deadlines == [1001.0, 1005.0]
+    assert ticker.skipped == 3
+
+
+def test_stop_ends_a_waiting_ticker():
+    ticker = Ticker(60.0)
+    ticks = []
+
+    def consume():
+        for deadline in ticker:
+            ticks.append(deadline)
+
+    thread = threading.Thread(target=consume)
+    thread.start()
+    time.sleep(0.2)
+    ticker.stop()
+    thread.join(timeout=5)
+
+    assert not thread.is_alive()
+    assert len(ticks) == 1
+
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        Ticker(0)
+
+
+class Predictor:
+    def __init__(self, fail_on: set[int]):
+        self.calls = 0
+        self.fail_on = fail_on
+
+    def predict_instant(self, at):
+        self.calls += 1
+        if self.calls in self.fail_on:
+            raise ValueError("no data")
+        return None, [self.calls]
+
+
+def test_prediction_loop_publishes_each_tick():
+    predictor = Predictor(fail_on={2})
+    published = []
+
+    def publish(predictions):
+        published.append(predictions)
+        if len(published) == 3:
+            loop.stop()
+
+    loop = PredictionLoop(predictor, 0.01, publish, show=False)
+    loop.run()
+
+    assert published == [[1], [3], [4]]
+    assert loop.failures == 1
@@ -0,0 +1,98 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from power_model.trainer import snapshot
+from power_model.trainer.planner import QueryPlan
+
+CPU = 'sum(rate(kepler_process_bpf_cpu_time_ms_total{job="vm"}[12s]))'
+CACHE = 'sum(rate(kepler_process_bpf_page_cache_hit_total{job="vm"}[12s]))'
+PACKAGE = 'sum(rate(kepler_vm_package_joules_total{job="metal"}[12s]))'
+
+PIPELINES = [
+    {"name": "rate", "features": {"cpu_time": CPU, "page_cache_hits": CACHE}},
+    {"name": "cpu", "features": {"cpu_time": CPU}},
+]
+
+
+def frame(plan: QueryPlan) -> pd.DataFrame:
+    rng = np.random.default_rng(5)
+    data = {
+        # exact in float32
+        "target": np.arange(10.0) * 0.5,
+        # not exact in float32
+        "q0": rng.normal(size=10),
+        "q1": np.array([np.nan, np.inf, -np.inf, 0, 1, 2, 3, 4, 5, 6]),
+    }
+    return pd.DataFrame({c: data[c] for c in plan.queries}, index=pd.Index(np.arange(10) + 1000, name="timestamp"))
+
+
+@pytest.fixture
+def plan() -> QueryPlan:
+    return QueryPlan(PIPELINES, PACKAGE)
+
+
+def test_save_and_load(tmp_path, plan: QueryPlan):
+    df = frame(plan)
+    path = snapshot.snapshot_path(tmp_path)
+
+    assert snapshot.save(path, plan, df)
+    loaded = snapshot.load(path, plan)
+
+    pd.testing.assert_frame_equal(loaded, df)
+    with np.load(path) as npz:
+        assert npz["column_target"].dtype == np.float32
+        assert npz["column_q0"].dtype == np.float64
+        assert npz["column_q1"].dtype == np.float32
+    meta = snapshot.read_meta(path)
+    assert (meta["rows"], meta["start"], meta["end"]) == (10, 1000, 1009)
+    assert meta["queries"] == plan.queries
+
+
+def test_save_skips_unchanged_data(tmp_path, plan: QueryPlan):
+    df = frame(plan)
+    path = snapshot.snapshot_path(tmp_path)
+
+    assert snapshot.save(path, plan, df)
+    assert not snapshot.save(path, plan, df.copy())
+
+    df.loc[1005, "q0"] += 1
+    assert snapshot.save(path, plan, df)
+    assert snapshot.load(path, plan).loc[1005, "q0"] == df.loc[1005, "q0"]
+
+
+def test_save_in_background(tmp_path, plan: QueryPlan):
+    df = frame(plan)
+    path = snapshot.snapshot_path(tmp_path)
+
+    assert snapshot.save_in_background(path, plan, df).result(timeout=30)
+    pd.testing.assert_frame_equal(snapshot.load(path, plan), df)
+
+
+def test_load_matches_queries_not_columns(tmp_path, plan: QueryPlan):
+    path = snapshot.snapshot_path(tmp_path)
+    snapshot.save(path, plan, frame(plan))
+    # a config with one pipeline plans other columns for the same queries
+    other = QueryPlan([{"name": "cache", "features": {"hits": f"  {CACHE}\n"}}], PACKAGE)
+
+    loaded = snapshot.load(path, other)
+
+    assert list(loaded.columns) == ["target", "q0"]
+    np.testing.assert_array_equal(loaded["q0"], frame(plan)["q1"])
+
+
+def test_load_missing_query(tmp_path, plan: QueryPlan):
+    path = snapshot.snapshot_path(tmp_path)
+    snapshot.save(path, plan, frame(plan))
+    other = QueryPlan([{"name": "dram", "features": {"dram": CPU.replace("cpu_time_ms", "dram")}}], PACKAGE)
+
+    with pytest.raises(ValueError, match="no samples"):
+        snapshot.load(path, other)
+
+
+def test_read_meta_of_a_missing_or_broken_snapshot(tmp_path):
+    path = snapshot.snapshot_path(tmp_path)
+    assert snapshot.read_meta(path) is None
+
+    path.write_bytes(b"not a snapshot")
+    assert snapshot.read_meta(path) is None
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from sklearn.linear_model import LinearRegression
+
+from power_model.trainer.stats import Stats
+
+
+def data(rows: int, targets: int | None = None, seed: int = 3) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    # large offsets, like counters, to catch loss of precision
+    Z = rng.normal(size=(rows, 3)) * [1, 10, 100] + [1e6, -5e3, 42]
+    coef = np.array([[2.0, 0.5, -0.1], [1.0, 0.0, 0.3]])
+    y = Z @ coef.T + [7, -3] + rng.normal(scale=0.1, size=(rows, 2))
+    return Z, y[:, 0] if targets is None else y[:, :targets]
+
+
+@pytest.mark.parametrize("targets", [None, 2])
+def test_merge_equals_stats_of_all_rows(targets: int | None):
+    Z, y = data(1000, targets)
+
+    merged = Stats.from_data(Z[:100], y[:100])
+    for start in range(100, 1000, 300):
+        merged = merged.merge(Stats.from_data(Z[start : start + 300], y[start : start + 300]))
+    full = Stats.from_data(Z, y)
+
+    assert merged.n == full.n
+    for a, b in zip(merged[1:], full[1:]):
+        np.testing.assert_allclose(a, b, rtol=1e-9, atol=1e-6)
+
+
+@pytest.mark.parametrize("targets", [None, 2])
+def test_solve_equals_a_full_refit(targets: int | None):
+    Z, y = data(1000, targets)
+
+    stats = Stats.from_data(Z[:400], y[:400]).merge(Stats.from_data(Z[400:], y[400:]))
+    coef, intercept = stats.solve()
+    reference = LinearRegression().fit(Z, y)
+
+    assert np.shape(coef) == np.shape(reference.coef_)
+    assert np.shape(intercept) == np.shape(reference.intercept_)
+    np.testing.assert_allclose(coef, reference.coef_, rtol=1e-6)
+    np.testing.assert_allclose(intercept, reference.intercept_, rtol=1e-6)
+
+
+@pytest.mark.parametrize("targets", [None, 2])
+def test_solve_positive_equals_a_full_refit(targets: int | None):
+    Z, y = data(1000, targets)
+
+    stats = Stats.from_data(Z[:500], y[:500]).merge(Stats.from_data(Z[500:], y[500:]))
+    coef, intercept = stats.solve(positive=True)
+    reference = LinearRegression(positive=True).fit(Z, y)
+
+    assert (np.asarray(coef) >= 0).all()
+    np.testing.assert_allclose(coef, reference.coef_, rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(intercept, reference.intercept_, rtol=1e-4)
+
+
+@pytest.mark.parametrize("targets", [None, 2])
+def test_save_and_load(tmp_path, targets: int | None):
+    stats = Stats.from_data(*data(50, targets))
+    path = tmp_path / "model_stats.npz"
+
+    stats.save(path)
+    loaded = Stats.load(path)
+
+    assert loaded.n == stats.n
+    assert np.ndim(loaded.mean_y) == np.ndim(stats.mean_y)
+    for a, b in zip(loaded[1:], stats[1:]):
+        np.testing.assert_array_equal(a, b)
@@ -0,0 +1,119 @@
+import math
+
+import numpy as np
+import pytest
+
+from power_model.trainer.runner import ErrorMetrics
+from power_model.trainer.tuner import Search, Trial, blocked_splits, evaluate, rungs, sample_space
+
+
+def errors(mae: float, r2: float = 0.0) -> ErrorMetrics:
+    return ErrorMetrics(mae, mae * mae, mae, r2)
+
+
+def test_sample_space():
+    space = {
+        "max_depth": [3, 4, 6],
+        "n_estimators": {"min": 50, "max": 400},
+        "learning_rate": {"min": 0.01, "max": 0.3, "log": True},
+        "objective": "reg:squarederror",
+    }
+
+    candidates = sample_space(space, 20, np.random.default_rng(1))
+
+    assert 1 < len(candidates) <= 20
+    for params in candidates:
+        assert params["max_depth"] in (3, 4, 6)
+        assert isinstance(params["n_estimators"], int) and 50 <= params["n_estimators"] <= 400
+        assert isinstance(params["learning_rate"], float) and 0.01 <= params["learning_rate"] <= 0.3
+        assert params["objective"] == "reg:squarederror"
+    # duplicates are dropped
+    assert len({tuple(sorted(p.items())) for p in candidates}) == len(candidates)
+
+
+def test_sample_space_without_choices():
+    assert sample_space({"positive": True}, 16, np.random.default_rng(1)) == [{"positive": True}]
+    assert sample_space(None, 16, np.random.default_rng(1)) == [{}]
+
+
+def test_blocked_splits():
+    assert blocked_splits(60, 5) == [(10, 20), (20, 30), (30, 40), (40, 50), (50, 60)]
+    # the remainder goes to the last fold
+    assert blocked_splits(64, 5)[-1] == (50, 64)
+    with pytest.raises(ValueError):
+        blocked_splits(10, 5)
+
+
+@pytest.mark.parametrize(
+    "folds, eta, schedule",
+    [(5, 3, [1, 3, 5]), (9, 3, [1, 3, 9]), (1, 3, [1]), (8, 2, [1, 2, 4, 8])],
+)
+def test_rungs(folds: int, eta: int, schedule: list[int]):
+    assert rungs(folds, eta) == schedule
+
+
+def test_halve_keeps_the_best_third():
+    search = Search("kepler-vm-cpu", "xgboost", [{"max_depth": d} for d in range(7)], "mae")
+    for c, mae in enumerate([5.0, 1.0, 7.0, 3.0, 2.0, 6.0, 4.0]):
+        search.results[c][0] = errors(mae)
+
+    search.halve(3)
+    assert search.alive == [1, 4, 3]
+
+    search.halve(3)
+    assert search.alive == [1]
+    search.halve(3)
+    assert search.alive == [1]
+
+
+def test_halve_ranks_unevaluated_candidates_last():
+    search = Search("kepler-vm-cpu", "xgboost", [{}, {}, {}], "mae")
+    search.results[2][0] = errors(9.0)
+
+    assert search.score(0) == math.inf
+    search.halve(3)
+    assert search.alive == [2]
+
+
+def test_r2_is_maximized():
+    search = Search("kepler-vm-cpu", "linear", [{}, {}], "r2")
+    search.results[0][0] = errors(1.0, r2=0.5)
+    search.results[1][0] = errors(1.0, r2=0.9)
+
+    search.halve(2)
+
+    assert search.alive == [1]
+
+
+def test_best_prefers_candidates_evaluated_on_more_folds():
+    search = Search("kepler-vm-cpu", "xgboost", [{}, {}, {}], "mae")
+    search.results[0] = {4: errors(0.5)}
+    search.results[1] = {4: errors(2.0), 3: errors(1.0)}
+    search.results[2] = {4: errors(3.0), 3: errors(3.0)}
+
+    assert search.best() == 1
+    assert search.errors(1) == ErrorMetrics(1.5, 2.5, 1.5, 0.0)
+
+
+def test_evaluate_validates_after_training():
+    rng = np.random.default_rng(2)
+    x = rng.uniform(0, 100, size=120)
+    # the relation changes in the validation block, which the fit must not see
+    y = np.where(np.arange(120) < 100, 2 * x + 1, 2 * x + 11)
+    arr = np.column_stack([x, y])
+    trial = Trial(
+        search=0,
+        candidate=0,
+        fold=0,
+        model="linear",
+        params={},
+        columns=[0],
+        features=["cpu_time"],
+        targets=[1],
+        split=(100, 120),
+        threads=1,
+    )
+
+    metrics = evaluate(arr, trial)
+
+    assert metrics.mae == pytest.approx(10.0)